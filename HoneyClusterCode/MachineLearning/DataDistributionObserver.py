@@ -9,22 +9,31 @@ from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
 
 from Main.HoneyCluster import HoneyClusterPaths
+from MachineLearning.HoneyClusterSchema import read_parquet, write_parquet
+from Main.StageProgress import StageProgress, get_size_bytes, ANALYSIS_STAGE
 
-from HoneyClustering import TEMPORAL_FEATURES, COMMAND_FEATURES, BEHAVIORAL_FEATURES
+from MachineLearning.HoneyClustering import TEMPORAL_FEATURES, COMMAND_FEATURES, BEHAVIORAL_FEATURES
 
 
 
 def analizing(paths: HoneyClusterPaths, add_PCA: bool = False):
+    progress = StageProgress(ANALYSIS_STAGE, 4 if add_PCA else 3, paths.run_reports_folder)
     datasets = get_all_datasets(paths)
+    rows = sum(len(dataset) for dataset in datasets.values())
+    progress.step_done("load", rows, sum(get_size_bytes(f) for f in paths.clustering_results_folder.glob("*.parquet")))
 
     _show_all_box_plot_features(datasets["global"], get_cluster_id_column("global"))
     _show_all_box_plot_features(datasets["expertise"], get_cluster_id_column("expertise"))
+    progress.step_done("box_plots", len(datasets["global"]) + len(datasets["expertise"]))
 
     _get_resulting_analysis_output(datasets, paths)
+    progress.step_done("summary", rows)
 
     # FOR PCA BUT REALLY SLOW!
     if add_PCA:
         plot_datasets(datasets)
+        progress.step_done("pca", rows)
+    progress.finish()
 
 
 
@@ -34,7 +43,7 @@ def analizing(paths: HoneyClusterPaths, add_PCA: bool = False):
 
 def read_dataset(dataset_path: Path) -> pd.DataFrame:
     try:
-        df = pd.read_parquet(dataset_path)
+        df = read_parquet(dataset_path)
         return df
     except Exception as e:
         logging.debug(f"errore nel file di clustering: {e}")
@@ -166,7 +175,7 @@ def _get_resulting_analysis_output(datasets: dict, paths: HoneyClusterPaths):
     result_df = result_df[desired_cols]
 
     # Salvataggio doppio per comodità
-    result_df.to_parquet(paths.analysis_result_path)
+    write_parquet(result_df, paths.analysis_result_path)
     result_df.to_csv(paths.analysis_result_path.with_suffix('.csv'), index=False)
 
     return result_df
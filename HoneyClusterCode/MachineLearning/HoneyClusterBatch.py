@@ -0,0 +1,283 @@
+import math
+from array import array
+
+import numpy as np
+
+import MachineLearning.HoneyClusterData as HCD
+from MachineLearning.command_vocabularies import _SIGNATURES, SIGNATURE_WEIGHTS
+from Zenodo import ZenodoDataReader as ZDR
+from Zenodo.Zenodo_keys import Status, Cleaned_Attr
+from Main.FeatureProfiler import FeatureProfiler, NULL_PROFILER
+
+"""
+MOTORE DELLE FEATURE A BLOCCHI
+
+    invece di chiamare le funzioni di HoneyClusterData sessione per sessione, gli eventi di un file vengono appiattiti in array NumPy
+    in formato CSR (come le matrici sparse): un array per tutti gli eventi del file + gli offset di inizio di ogni sessione.
+        - stati (int8) e tempi (epoch in microsecondi, int64) per evento
+        - verbi internati: ogni verbo distinto del file diventa un intero, le sue proprietà (noto, ricognizione/exploit, firme)
+          vengono calcolate una volta sola per verbo invece che una volta per occorrenza
+    le feature derivate da stati e verbi diventano conteggi per sessione (bincount) e riduzioni sui segmenti (reduceat).
+    I valori sono identici a quelli del percorso per sessione: stesse divisioni in float64, log1p/sin/cos di math,
+    le firme sommate nello stesso ordine (get_signatures_score). command_correction_attempts resta per sessione (confronta stringhe).
+    Con un FeatureProfiler attivo vengono misurati parsing dei timestamp, estrazione dei verbi e ogni feature (vedi Main.FeatureProfiler).
+"""
+
+
+class SessionEventArrays:
+    """ eventi delle sessioni di un file in formato CSR: gli eventi della sessione i sono in [event_offsets[i], event_offsets[i+1]) """
+    __slots__ = ("event_offsets", "statuses", "event_timestamps", "verb_offsets", "verb_ids", "verb_names",
+                 "start_us", "end_us", "united_commands", "user_pass", "_verb_index", "_fast_check", "_get_epoch_us", "_get_epoch_us_batch", "_get_verbs")
+
+    def __init__(self, fast_check: ZDR.VerbTrie = None, profiler: FeatureProfiler = NULL_PROFILER):
+        self.event_offsets = array("q", [0])
+        self.statuses = array("b")
+        self.event_timestamps: list[str] = [] # convertiti tutti insieme da get_event_times_us
+        self.verb_offsets = array("q", [0])
+        self.verb_ids = array("q")
+        self.verb_names: list[str] = [] # id -> verbo
+        self.start_us = array("q") # 0 se manca (durata 0)
+        self.end_us = array("q")
+        self.united_commands: list[list[str]] = [] # per command_correction_attempts
+        self.user_pass: list[list[tuple[str, str]]] = []
+        self._verb_index: dict[str, int] = {}
+        self._fast_check = fast_check or ZDR.VERB_TRIE
+        # senza profiling sono le funzioni di ZenodoDataReader stesse
+        self._get_epoch_us = profiler.timed(ZDR.get_epoch_us, "timestamp_parsing")
+        self._get_epoch_us_batch = profiler.timed(ZDR.get_epoch_us_batch, "timestamp_parsing")
+        self._get_verbs = profiler.timed(ZDR.get_verbs_of_commands, "verb_extraction")
+
+    def __len__(self) -> int:
+        return len(self.start_us)
+
+    def add_session(self, session_data: dict) -> bool:
+        """ aggiunge una sessione nel formato cleaned. Le sessioni senza eventi vengono scartate (False) """
+        session_events = session_data[Cleaned_Attr.EVENTS.value]
+        if not session_events:
+            return False
+
+        united_commands = []
+        user_pass = []
+        for event in session_events:
+            self.statuses.append(event[Cleaned_Attr.STATUS.value])
+            self.event_timestamps.append(event[Cleaned_Attr.TIME.value])
+
+            all_event_command = event.get(Cleaned_Attr.MSG.value, [])
+            if all_event_command:
+                united_commands.append("; ".join(all_event_command))
+                for verb in self._get_verbs(all_event_command, self._fast_check):
+                    self.verb_ids.append(self._intern(verb))
+
+            login_tuple = ZDR.get_tuple_login_data(event)
+            if login_tuple:
+                user_pass.append(login_tuple)
+
+        self.event_offsets.append(len(self.statuses))
+        self.verb_offsets.append(len(self.verb_ids))
+        self.start_us.append(self._get_epoch_us(session_data[Cleaned_Attr.START_TIME.value]) or 0)
+        self.end_us.append(self._get_epoch_us(session_data[Cleaned_Attr.END_TIME.value]) or 0)
+        self.united_commands.append(united_commands)
+        self.user_pass.append(user_pass)
+        return True
+
+    def get_event_times_us(self) -> np.ndarray:
+        """ tempi di tutti gli eventi (epoch in microsecondi, int64) in una sola conversione vettoriale; illeggibili -> EPOCH_US_MISSING """
+        return self._get_epoch_us_batch(self.event_timestamps)
+
+    def _intern(self, verb: str) -> int:
+        verb_id = self._verb_index.get(verb)
+        if verb_id is None:
+            verb_id = len(self.verb_names)
+            self._verb_index[verb] = verb_id
+            self.verb_names.append(verb)
+        return verb_id
+
+
+def get_batch_features(arrays: SessionEventArrays, all_known_verbs: set[str], all_recon: set[str], all_exploit: set[str], profiler: FeatureProfiler = NULL_PROFILER) -> dict[str, np.ndarray]:
+    """ feature di tutte le sessioni di arrays, una colonna float64 per nome di HoneyClusterData.FEATURE_NAMES.
+        profiler: i conteggi e le verifiche sui verbi sono condivisi da più feature, vengono misurati a parte (status_counts, verb_counts) """
+    n_sessions = len(arrays)
+    if not n_sessions:
+        return {name: np.empty(0, dtype=np.float64) for name in HCD.FEATURE_NAMES}
+    features = {}
+
+    event_offsets = np.frombuffer(arrays.event_offsets, dtype=np.int64)
+    statuses = np.frombuffer(arrays.statuses, dtype=np.int8)
+    n_events = np.diff(event_offsets)
+
+    with profiler.feature("status_counts"):
+        session_of_event = np.repeat(np.arange(n_sessions), n_events)
+
+        def count(event_mask: np.ndarray) -> np.ndarray:
+            return np.bincount(session_of_event[event_mask], minlength=n_sessions)
+
+        logins = count((statuses == Status.LOGIN_FAILED.value) | (statuses == Status.LOGIN_SUCCESS.value))
+        versioning = count(statuses == Status.VERSION.value)
+        fingerprints = count(statuses == Status.FINGERPRINT.value)
+        tcpip_requests = count(statuses == Status.TCPIP_REQUEST.value)
+        tunneling = tcpip_requests + count(statuses == Status.TCPIP_DATA.value)
+        only_commands = count((statuses < 0) & (statuses != Status.TCPIP_DATA.value))
+        commands_failed = count(statuses == Status.COMMAND_FAILED.value)
+
+    with profiler.feature("verb_counts"):
+        verbs = _get_verb_counts(arrays, all_known_verbs, all_recon, all_exploit)
+
+    start_us = np.frombuffer(arrays.start_us, dtype=np.int64)
+    end_us = np.frombuffer(arrays.end_us, dtype=np.int64)
+
+    with profiler.feature("inter_command_timing"):
+        features["inter_command_timing"] = _get_inter_command_timing(arrays, event_offsets)
+    with profiler.feature("session_duration"):
+        features["session_duration"] = _get_session_duration(start_us, end_us)
+    with profiler.feature("time_of_day_patterns", n_sessions):
+        sin_cos = [HCD.get_time_of_day_patterns_epoch(start) for start in start_us.tolist()]
+        features["time_of_day_patterns_sin"] = np.fromiter((s for s, _ in sin_cos), dtype=np.float64, count=n_sessions)
+        features["time_of_day_patterns_cos"] = np.fromiter((c for _, c in sin_cos), dtype=np.float64, count=n_sessions)
+    with profiler.feature("unique_commands_ratio"):
+        features["unique_commands_ratio"] = _safe_ratio(verbs["unique"], verbs["total"], 0.0)
+    with profiler.feature("command_diversity_ratio"):
+        features["command_diversity_ratio"] = _get_command_diversity_ratio(verbs, features["unique_commands_ratio"], all_known_verbs)
+
+    with profiler.feature("tool_signatures"):
+        # status bits come in get_tool_signatures
+        signature_masks = verbs["signature_masks"]
+        signature_masks |= _bit_where(fingerprints > 0, "fingerprinting")
+        signature_masks |= _bit_where(versioning > 0, "versioning")
+        signature_masks |= _bit_where(tcpip_requests > 0, "tunneling_request")
+        signature_masks |= _bit_where(logins / n_events >= 0.6, "login_occurrence")
+        features["tool_signatures"] = _get_signatures_scores(signature_masks)
+
+    with profiler.feature("reconnaissance_vs_exploitation_ratio"):
+        recon = versioning + logins + verbs["recon"]
+        exploit = tunneling + verbs["exploit"]
+        features["reconnaissance_vs_exploitation_ratio"] = _safe_ratio(exploit, recon + exploit, 0.5)
+
+    with profiler.feature("error_rate"):
+        attempts = only_commands + logins # i COMMAND_FAILED sono tra i comandi: gli unici tentativi non riusciti (vedi get_error_rate)
+        features["error_rate"] = _safe_ratio(attempts - commands_failed, attempts, 0.5)
+
+    with profiler.feature("command_correction_attempts", n_sessions):
+        features["command_correction_attempts"] = _get_command_correction_attempts(arrays, statuses, event_offsets)
+
+    return {name: features[name] for name in HCD.FEATURE_NAMES}
+
+
+"""
+    PRIVATE FUNCTION FOR USAGE PURPOSE
+"""
+
+# un bit per firma, in ordine di nome: scorrere i bit dal basso dà lo stesso ordine di get_signatures_score
+_SIGNATURE_NAMES = tuple(sorted(set(_SIGNATURES) | set(SIGNATURE_WEIGHTS)))
+if len(_SIGNATURE_NAMES) > 64:
+    raise ValueError(f"{len(_SIGNATURE_NAMES)} signatures do not fit in a uint64 mask")
+_SIGNATURE_BITS = {name: np.uint64(1) << np.uint64(i) for i, name in enumerate(_SIGNATURE_NAMES)}
+
+_NOT_BEHAVIOURAL = 0
+_RECON = 1
+_EXPLOIT = 2
+
+def _bit_where(condition: np.ndarray, signature: str) -> np.ndarray:
+    return np.where(condition, _SIGNATURE_BITS[signature], np.uint64(0))
+
+def _safe_ratio(numerator: np.ndarray, denominator: np.ndarray, default: float) -> np.ndarray:
+    """ numerator / denominator in float64 (come la divisione tra int di python), default dove il denominatore è 0 """
+    out = np.full(len(denominator), default, dtype=np.float64)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+def _get_verb_tables(verb_names: list[str], all_known_verbs: set[str], all_recon: set[str], all_exploit: set[str]):
+    """ proprietà di ogni verbo internato: calcolate una volta per verbo distinto del file """
+    known = np.fromiter((v in all_known_verbs for v in verb_names), dtype=bool, count=len(verb_names))
+    behaviour = np.fromiter((_get_verb_behaviour(v, all_recon, all_exploit) for v in verb_names), dtype=np.int8, count=len(verb_names))
+    masks = np.fromiter((_get_verb_signature_mask(v) for v in verb_names), dtype=np.uint64, count=len(verb_names))
+    return known, behaviour, masks
+
+def _get_verb_behaviour(verb: str, all_recon: set[str], all_exploit: set[str]) -> int:
+    # stesso ordine dei controlli di get_reconnaissance_vs_exploitation_ratio
+    if verb in all_recon:
+        return _RECON
+    if verb in all_exploit or verb.startswith("TLS_") or verb.startswith("HTTP_") or verb == "UNKNOWN_PROBE":
+        return _EXPLOIT
+    return _NOT_BEHAVIOURAL
+
+def _get_verb_signature_mask(verb: str) -> int:
+    mask = 0
+    for sig_name, sig_commands in _SIGNATURES.items():
+        if verb in sig_commands:
+            mask |= int(_SIGNATURE_BITS[sig_name])
+    if verb in SIGNATURE_WEIGHTS:
+        mask |= int(_SIGNATURE_BITS[verb])
+    return mask
+
+def _get_verb_counts(arrays: SessionEventArrays, all_known_verbs: set[str], all_recon: set[str], all_exploit: set[str]) -> dict[str, np.ndarray]:
+    n_sessions = len(arrays)
+    verb_offsets = np.frombuffer(arrays.verb_offsets, dtype=np.int64)
+    verb_ids = np.frombuffer(arrays.verb_ids, dtype=np.int64)
+    n_verbs = np.diff(verb_offsets)
+    session_of_verb = np.repeat(np.arange(n_sessions), n_verbs)
+    known, behaviour, masks = _get_verb_tables(arrays.verb_names, all_known_verbs, all_recon, all_exploit)
+
+    # coppie (sessione, verbo) distinte -> verbi unici per sessione
+    n_names = max(len(arrays.verb_names), 1)
+    pairs = np.unique(session_of_verb * n_names + verb_ids)
+    pair_sessions = pairs // n_names
+    unique_verbs = np.bincount(pair_sessions, minlength=n_sessions)
+    unknown_verbs = np.bincount(pair_sessions[~known[pairs % n_names]], minlength=n_sessions)
+
+    verb_behaviour = behaviour[verb_ids]
+    signature_masks = np.zeros(n_sessions, dtype=np.uint64)
+    with_verbs = n_verbs > 0
+    if with_verbs.any(): # reduceat su segmenti vuoti restituirebbe l'elemento successivo: solo le sessioni con verbi
+        signature_masks[with_verbs] = np.bitwise_or.reduceat(masks[verb_ids], verb_offsets[:-1][with_verbs])
+
+    return {
+        "total": n_verbs,
+        "unique": unique_verbs,
+        "unknown": unknown_verbs,
+        "recon": np.bincount(session_of_verb[verb_behaviour == _RECON], minlength=n_sessions),
+        "exploit": np.bincount(session_of_verb[verb_behaviour == _EXPLOIT], minlength=n_sessions),
+        "signature_masks": signature_masks,
+    }
+
+def _get_command_diversity_ratio(verbs: dict[str, np.ndarray], unique_ratio: np.ndarray, all_known_verbs: set[str], bonus: float = 0.3) -> np.ndarray:
+    if not all_known_verbs:
+        return np.zeros(len(unique_ratio), dtype=np.float64)
+    rarity_bonus = _safe_ratio(verbs["unknown"] * bonus, verbs["unique"], 0.0)
+    return np.where(verbs["total"] > 0, np.minimum(unique_ratio + rarity_bonus, 1.0), 0.0)
+
+def _get_signatures_scores(signature_masks: np.ndarray) -> np.ndarray:
+    """ lo score dipende solo dall'insieme delle firme: una somma per maschera distinta """
+    distinct, inverse = np.unique(signature_masks, return_inverse=True)
+    scores = np.array([_get_signatures_score(int(mask)) for mask in distinct], dtype=np.float64)
+    return scores[inverse.reshape(-1)]
+
+def _get_signatures_score(mask: int) -> float:
+    if not mask:
+        return 0.0 # nessuna firma trovata
+    return HCD.get_signatures_score([name for i, name in enumerate(_SIGNATURE_NAMES) if mask >> i & 1])
+
+def _get_inter_command_timing(arrays: SessionEventArrays, event_offsets: np.ndarray) -> np.ndarray:
+    # come HoneyClusterData.get_inter_command_timing: la somma dei delta tra tempi ordinati è (max - min), quindi (max - min) / (n - 1) senza ordinare.
+    # Gli eventi senza un timestamp valido non contano: n sono solo gli eventi con il tempo
+    times = arrays.get_event_times_us()
+    starts = event_offsets[:-1]
+    timed = times != ZDR.EPOCH_US_MISSING
+    n_timed = np.add.reduceat(timed.astype(np.int64), starts)
+    latest = np.maximum.reduceat(times, starts) # EPOCH_US_MISSING è il minimo di int64: non vince mai il massimo
+    earliest = np.minimum.reduceat(np.where(timed, times, np.iinfo(np.int64).max), starts)
+    spans = np.where(n_timed >= 2, latest - earliest, 0)
+    avg_seconds = _safe_ratio(spans, n_timed - 1, 0.0) / ZDR.US_PER_SECOND
+    return np.array([math.log1p(seconds) if n >= 2 else 0.0 for seconds, n in zip(avg_seconds.tolist(), n_timed.tolist())], dtype=np.float64)
+
+def _get_session_duration(start_us: np.ndarray, end_us: np.ndarray) -> np.ndarray:
+    known = (start_us != 0) & (end_us != 0)
+    seconds = (end_us - start_us) / ZDR.US_PER_SECOND
+    return np.array([math.log1p(s) if k else 0.0 for s, k in zip(seconds.tolist(), known.tolist())], dtype=np.float64)
+
+def _get_command_correction_attempts(arrays: SessionEventArrays, statuses: np.ndarray, event_offsets: np.ndarray) -> np.ndarray:
+    all_statuses = statuses.tolist()
+    offsets = event_offsets.tolist()
+    return np.array([
+        HCD.get_command_correction_attempts(all_statuses[offsets[i]:offsets[i + 1]], arrays.united_commands[i], arrays.user_pass[i])
+        for i in range(len(arrays))
+    ], dtype=np.float64)
@@ -1,9 +1,12 @@
 
-from dataclasses import dataclass
-from difflib import SequenceMatcher
+from array import array
+from dataclasses import dataclass, fields
 from typing import Tuple
 
+import numpy as np
+
 from MachineLearning.command_vocabularies import MAX_SIGNATURE_SCORE
+from MachineLearning.CommandSimilarity import similarity_at_least, is_identical
 from MachineLearning.command_vocabularies import _SIGNATURES, SIGNATURE_WEIGHTS
 
 
@@ -27,7 +30,7 @@ command correction attempts
 
 
 
-@dataclass
+@dataclass(slots=True) # niente __dict__ per ogni sessione: ne creiamo milioni
 class HoneyClusterData:
     # temporal features
     inter_command_timing : float    # tempo che passa tra i comandi inviati
@@ -43,6 +46,32 @@ class HoneyClusterData:
     error_rate: float # comandi errati / comandi
     command_correction_attempts: float # quante volte in media l'attaccante cerca di correggersi
 
+FEATURE_NAMES = tuple(f.name for f in fields(HoneyClusterData))
+
+
+class HoneyClusterDataColumns:
+    """ accumulatore colonnare: un array tipizzato (float64) per feature al posto di un dict per sessione """
+    __slots__ = ("_columns",)
+
+    def __init__(self):
+        self._columns = {name: array("d") for name in FEATURE_NAMES}
+
+    def append(self, data: HoneyClusterData):
+        for name, column in self._columns.items():
+            column.append(getattr(data, name))
+
+    def extend_numpy(self, columns: dict[str, np.ndarray]):
+        """ aggiunge in blocco le feature di più sessioni (stessa lunghezza per ogni feature), vedi HoneyClusterBatch """
+        for name, column in self._columns.items():
+            column.frombytes(np.ascontiguousarray(columns[name], dtype=np.float64).tobytes())
+
+    def __len__(self) -> int:
+        return len(self._columns[FEATURE_NAMES[0]])
+
+    def to_numpy(self) -> dict[str, np.ndarray]:
+        """ viste numpy sugli array accumulati, senza copie """
+        return {name: np.frombuffer(column, dtype=np.float64) for name, column in self._columns.items()}
+
 """
 //////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
                 EXTRACTING FEATURES
@@ -86,6 +115,19 @@ def get_time_of_day_patterns(start_time : datetime = None) -> Tuple[float,float]
     angle = math.tau * (hour_decimal / 24.0)
     return math.sin(angle), math.cos(angle)
 
+"""
+    VARIANTI SU EPOCH IN MICROSECONDI (vedi ZenodoDataReader.get_epoch_us): niente datetime.
+    Tempo tra i comandi e durata sono calcolati per tutte le sessioni insieme in HoneyClusterBatch
+"""
+
+def get_time_of_day_patterns_epoch(start_us: int = None) -> Tuple[float, float]:
+    if not start_us:
+        return 0.0, 0.0
+    second_of_day = (start_us // ZDR.US_PER_SECOND) % 86_400
+    hour_decimal = (second_of_day // 3600) + ((second_of_day // 60 % 60) / 60.0) + ((second_of_day % 60) / 3600.0)
+    angle = math.tau * (hour_decimal / 24.0)
+    return math.sin(angle), math.cos(angle)
+
 """
     EXTRACT COMMAND BASED FEATURES
 """
@@ -151,8 +193,11 @@ def get_tool_signatures(statuses: list[int], verbs: list[str]) -> float:
     if not found_signatures:
         return 0.0
 
-    # Restituiamo la somma dei pesi per differenziare la "bravura"
-    return sum(SIGNATURE_WEIGHTS.get(sig, 1.0) for sig in found_signatures) / MAX_SIGNATURE_SCORE
+    return get_signatures_score(found_signatures)
+
+def get_signatures_score(found_signatures) -> float:
+    """ somma dei pesi per differenziare la "bravura". In ordine di nome: la somma di float su un set cambierebbe di 1e-16 tra due esecuzioni """
+    return sum(SIGNATURE_WEIGHTS.get(sig, 1.0) for sig in sorted(found_signatures)) / MAX_SIGNATURE_SCORE
 
 """
     EXTRACT BEHAVIORAL PATTERNS 
@@ -236,20 +281,20 @@ def get_command_correction_attempts(statuses: list[int], united_commands: list[s
         # Verifichiamo che entrambi siano comandi (non None)
         if prev_status == ZDR.Status.COMMAND_FAILED.value and prev_cmd and curr_cmd:
             len_diff = abs(len(prev_cmd) - len(curr_cmd))
-            command_similarity = SequenceMatcher(None, prev_cmd, curr_cmd).ratio()
 
-            if (len(prev_cmd) <= 3 and len_diff <= 1) or (command_similarity >= 0.70):
-                if prev_cmd != curr_cmd:
-                    corrections += 1
+            # stesse decisioni di SequenceMatcher(...).ratio() >= 0.70, vedi CommandSimilarity
+            if prev_cmd != curr_cmd and ((len(prev_cmd) <= 3 and len_diff <= 1) or similarity_at_least(prev_cmd, curr_cmd, 0.70)):
+                corrections += 1
 
         # --- CORREZIONE LOGIN ---
         # Verifichiamo che entrambi siano login (non None)
         elif prev_status == ZDR.Status.LOGIN_FAILED.value and prev_login and curr_login:
-            user_similarity = SequenceMatcher(None, prev_login[0], curr_login[0]).ratio()
-            password_similarity = SequenceMatcher(None, prev_login[1], curr_login[1]).ratio()
-
-            if ((0.7 <= user_similarity < 1.0 and password_similarity >= 0.9) or
-                    (user_similarity == 1.0 and 0.7 <= password_similarity < 1.0)):
+            # (0.7 <= user_similarity < 1.0 and password_similarity >= 0.9) or (user_similarity == 1.0 and 0.7 <= password_similarity < 1.0)
+            # senza calcolare le similarità: quasi sempre basta un confronto tra stringhe o un limite superiore
+            if is_identical(prev_login[0], curr_login[0]):
+                if not is_identical(prev_login[1], curr_login[1]) and similarity_at_least(prev_login[1], curr_login[1], 0.7):
+                    corrections += 1
+            elif similarity_at_least(prev_login[0], curr_login[0], 0.7) and similarity_at_least(prev_login[1], curr_login[1], 0.9):
                 corrections += 1
 
     return corrections / total_relevant_events
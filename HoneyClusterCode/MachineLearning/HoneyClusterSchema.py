@@ -0,0 +1,81 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from MachineLearning.HoneyClusterData import FEATURE_NAMES
+
+"""
+SCHEMA DEI PARQUET
+
+    un solo schema per tutti i file che contengono le feature di HoneyClusterData (processati, dataset completo, risultati del clustering):
+        - feature: float32 (le feature sono arrotondate a 2 decimali, la precisione di float64 non serve)
+          tranne nei file processati, che restano float64: l'arrotondamento del merge va fatto a precisione piena
+          (23/40 = 0.575 in float32 è 0.57500005 e diventerebbe 0.58 invece di 0.57)
+        - etichette dei cluster (cluster_<nome>_id): int8, int16 se i cluster sono più di 127
+        - is_bot: booleano
+    stesso engine (pyarrow), stessa compressione (zstd) e stessa dimensione dei row group ovunque.
+    Lo schema viene applicato sia in scrittura sia in lettura, così anche i file scritti prima vengono convertiti.
+"""
+
+FEATURE_DTYPE = np.float32
+PROCESSED_FEATURE_DTYPE = np.float64
+IS_BOT_COLUMN = "is_bot"
+
+PARQUET_ENGINE = "pyarrow"
+PARQUET_COMPRESSION = "zstd"
+# ~1M righe * 10 feature float32 = 40 MB per row group non compresso: letture sequenziali lunghe ma batch ancora piccoli in memoria
+ROW_GROUP_ROWS = 1024 * 1024
+
+
+def is_label_column(column) -> bool:
+    return isinstance(column, str) and column.startswith("cluster_") and column.endswith("_id")
+
+def get_label_dtype(labels) -> type:
+    """ int8 finché le etichette ci stanno, altrimenti int16 """
+    if len(labels) and (labels.min() < np.iinfo(np.int8).min or labels.max() > np.iinfo(np.int8).max):
+        return np.int16
+    return np.int8
+
+def apply_schema(df: pd.DataFrame, feature_dtype: type = FEATURE_DTYPE) -> pd.DataFrame:
+    """ converte le colonne note ai tipi dello schema, le altre restano come sono. Restituisce un nuovo DataFrame """
+    dtypes = {}
+    for column in df.columns:
+        if column in FEATURE_NAMES:
+            dtypes[column] = feature_dtype
+        elif is_label_column(column):
+            dtypes[column] = get_label_dtype(df[column].to_numpy())
+        elif column == IS_BOT_COLUMN:
+            dtypes[column] = bool
+    changed = {column: dtype for column, dtype in dtypes.items() if df[column].dtype != dtype}
+    if not changed:
+        return df
+    return df.astype(changed, copy=False)
+
+def write_parquet(df: pd.DataFrame, output_path: Path, feature_dtype: type = FEATURE_DTYPE):
+    apply_schema(df, feature_dtype).to_parquet(output_path, engine=PARQUET_ENGINE, compression=PARQUET_COMPRESSION,
+                                               row_group_size=ROW_GROUP_ROWS, index=False)
+
+def write_parquet_batches(frames, output_path: Path, feature_dtype: type = FEATURE_DTYPE) -> int:
+    """ scrive i DataFrame uno dopo l'altro, ognuno come row group dello stesso file: in memoria c'è solo quello corrente.
+        Restituisce le righe scritte (0: il file non viene creato) """
+    rows_written = 0
+    writer = None
+    try:
+        for df in frames:
+            table = pa.Table.from_pandas(apply_schema(df, feature_dtype), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema, compression=PARQUET_COMPRESSION)
+            elif not table.schema.equals(writer.schema): # es. etichette int8 in un batch e int16 in un altro
+                table = table.cast(writer.schema)
+            writer.write_table(table, row_group_size=ROW_GROUP_ROWS)
+            rows_written += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows_written
+
+def read_parquet(input_path: Path, columns: list[str] = None, feature_dtype: type = FEATURE_DTYPE) -> pd.DataFrame:
+    return apply_schema(pd.read_parquet(input_path, engine=PARQUET_ENGINE, columns=columns), feature_dtype)
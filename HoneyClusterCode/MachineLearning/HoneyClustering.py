@@ -1,107 +1,181 @@
 import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from threadpoolctl import threadpool_limits
 
 from Main.HoneyCluster import HoneyClusterPaths
+from Main.RunManifest import atomic_output
+from Main.StageProgress import StageProgress, get_size_bytes, CLUSTERING_STAGE, EXPERTISE_CLUSTERING_STAGE, FEATURES_CLUSTERING_STAGE, LABELING_STAGE, \
+    CONCURRENT_CLUSTERING_STAGE
 from Zenodo.ZenodoProcesser import read_main_dataset
+from Zenodo.ZenodoDatasetMerger import count_complete_dataset_rows, iter_complete_dataset_batches, iter_parquet_batches, get_complete_dataset_files
+from MachineLearning.HoneyClusterSchema import write_parquet, write_parquet_batches
 
 from joblib import dump,load
 
+STREAMING_BATCH_ROWS = 65_536 # righe per blocco nel clustering in streaming
 
-def clustering(honey_paths: HoneyClusterPaths): # dimostra quanto i bot appiattiscono la nostra ricerca, dato che il loro traffico è l'80%, nonostante un pre-sampling mirato
-    try:
-
-        sample_data = _extraction_of_initial_clustering_subset(honey_paths.complete_dataset_file)
-
-        # recupero lo stato precedente se esiste
-        scaler = _get_scaler(honey_paths.scaler_path)
-        model = _get_model(honey_paths.model_path)
 
-        # preparo i dati (e salvo lo scaler aggiornato)
-        scaled_sample_data = _build_scaled_core_model(sample_data, honey_paths.scaler_path,scaler)  # aggiorna automaticamente lo scaler
+def clustering(honey_paths: HoneyClusterPaths, streaming: bool = False, batch_rows: int = STREAMING_BATCH_ROWS): # dimostra quanto i bot appiattiscono la nostra ricerca, dato che il loro traffico è l'80%, nonostante un pre-sampling mirato
+    if streaming: # scaler e centroidi addestrati su tutto il dataset, letto a blocchi (vedi STREAMING CLUSTERING). Se fallisce solleva l'eccezione
+        _streaming_clustering(honey_paths, batch_rows)
+        return
 
-        # il dataset core che stiamo usando (è un subset, quindi è importante metterlo da parte?)
-
-        labels = _creating_clusters(scaled_sample_data, honey_paths.model_path, model)  # aggiorna automaticamente il model
-        # otteniamo una lista del tipo [1,1, 0, 2, 1].
-        # ogni sessione viene assegnata al centroide più vicino
-        # invece che analizzare milioni di file, possiamo analizzare i 'rappresentanti' dei gruppi
+    progress = StageProgress(CLUSTERING_STAGE, 2, honey_paths.run_reports_folder)
+    step = "load"
+    try:
 
-        clustered_sample_data = sample_data.copy()
-        clustered_sample_data['cluster_global_id'] = labels  # aggiungiamo una colonna chiamata id del cluster e ci mettiamo le label
+        sample_data = _extraction_of_initial_clustering_subset(honey_paths.complete_dataset_file)
+        progress.step_done(step, len(sample_data), get_size_bytes(honey_paths.complete_dataset_file))
+        step = "global"
 
-        _writing_as_parquet(clustered_sample_data, honey_paths.clustered_result.with_suffix(".parquet"))
-        _writing_as_csv(clustered_sample_data, honey_paths.clustered_result.with_suffix(".csv"))
+        clustered_sample_data = _global_clustering(sample_data, honey_paths)
+        progress.step_done(step, len(clustered_sample_data))
 
     except Exception as e:
-        logging.debug(f"errore nel clustering: {e}")
+        logging.error(f"errore nel clustering: {e}")
+        progress.step_done(step, failed=True)
+    progress.finish()
 
 def expertise_clustering(honey_paths: HoneyClusterPaths):
     # which df shoud I pass? The extracted initial clustering from the function "_extraction_of_initial_clustering_subset"?
-    initial_dataset = read_main_dataset(honey_paths.complete_dataset_file)
-
-    if initial_dataset.empty:
-        logging.warning("dataset vuoto")
-        raise Exception("dataset vuoto")
+    progress = StageProgress(EXPERTISE_CLUSTERING_STAGE, 2, honey_paths.run_reports_folder)
+    initial_dataset = _load_for_progress(honey_paths, progress)
 
     try:
-        df = _expertise_stage_1(initial_dataset)
-        clustered_df = _expertise_stage_2(df,honey_paths)
-        _writing_as_parquet(clustered_df, honey_paths.clustered_for_expertise_result.with_suffix(".parquet"))
-        _writing_as_csv(clustered_df, honey_paths.clustered_for_time_result.with_suffix(".csv"))
+        _expertise_clustering(initial_dataset, honey_paths)
+        progress.step_done("expertise", len(initial_dataset))
     except Exception as e:
-        logging.debug(f"errore nell'expertise clustering: {e}")
+        logging.error(f"errore nell'expertise clustering: {e}")
+        progress.step_done("expertise", failed=True)
+    progress.finish()
 
 def features_clustering(honey_paths: HoneyClusterPaths):
-    initial_dataset = read_main_dataset(honey_paths.complete_dataset_file)
-
-    if initial_dataset.empty:
-        logging.warning("dataset vuoto")
-        raise Exception("dataset vuoto")
+    progress = StageProgress(FEATURES_CLUSTERING_STAGE, 4, honey_paths.run_reports_folder)
+    initial_dataset = _load_for_progress(honey_paths, progress)
 
+    step = "temporal"
     try:
         _feature_clustering_time(initial_dataset,honey_paths)
+        progress.step_done(step, len(initial_dataset))
+        step = "command_based"
         _feature_clustering_command(initial_dataset,honey_paths)
+        progress.step_done(step, len(initial_dataset))
+        step = "behavioral"
         _feature_clustering_behavior(initial_dataset,honey_paths)
+        progress.step_done(step, len(initial_dataset))
     except Exception as e:
-        logging.debug(f"errore nell'feature clustering: {e}")
+        logging.error(f"errore nell'feature clustering: {e}")
+        progress.step_done(step, failed=True)
+    progress.finish()
+
+def concurrent_clustering(honey_paths: HoneyClusterPaths, workers: int = os.cpu_count() or 1, streaming: bool = False,
+                          batch_rows: int = STREAMING_BATCH_ROWS) -> dict[str, str | None]:
+    """ i cinque clustering (globale, expertise, temporale, comandi, comportamentale) con un solo caricamento del dataset,
+        in parallelo su workers processi (vedi CLUSTERING CONCORRENTE). Restituisce clustering -> None oppure l'errore """
+    progress = StageProgress(CONCURRENT_CLUSTERING_STAGE, 1 + len(_CLUSTERING_JOBS), honey_paths.run_reports_folder)
+    initial_dataset = read_main_dataset(honey_paths.complete_dataset_file)
+    if initial_dataset.empty:
+        logging.warning("dataset vuoto")
+        progress.step_done("load", failed=True)
+        progress.finish()
+        return {job: "dataset vuoto" for job in _CLUSTERING_JOBS}
+
+    rows = len(initial_dataset)
+    with tempfile.TemporaryDirectory(prefix="shared_dataset_", dir=honey_paths.artifacts_folder) as shared_folder:
+        shared = _share_dataset(initial_dataset, Path(shared_folder))
+        del initial_dataset # da qui in poi il dataset vive solo nel file condiviso
+        progress.step_done("load", rows, get_size_bytes(honey_paths.complete_dataset_file))
+        results = _run_clustering_jobs(honey_paths, shared, workers, streaming, batch_rows, progress)
+
+    failed = {job: error for job, error in results.items() if error is not None}
+    for job, error in failed.items():
+        logging.warning(f"errore nel clustering {job}: {error}")
+    logging.info(f"clustering completed: {len(results) - len(failed)} succeeded, {len(failed)} failed")
+    progress.finish()
+    return results
+
+def _load_for_progress(honey_paths: HoneyClusterPaths, progress: StageProgress) -> pd.DataFrame:
+    """ lettura del dataset completo come primo passo dello stage. Dataset vuoto: lo stage termina con un errore """
+    initial_dataset = read_main_dataset(honey_paths.complete_dataset_file)
+
+    if initial_dataset.empty:
+        progress.step_done("load", failed=True)
+        progress.finish()
+        logging.warning("dataset vuoto")
+        raise Exception("dataset vuoto")
+
+    progress.step_done("load", len(initial_dataset), get_size_bytes(honey_paths.complete_dataset_file))
+    return initial_dataset
+
+def _global_clustering(sample_data: pd.DataFrame, honey_paths: HoneyClusterPaths) -> pd.DataFrame:
+    # recupero lo stato precedente se esiste
+    scaler = _get_scaler(honey_paths.scaler_path)
+    model = _get_model(honey_paths.model_path)
+
+    # preparo i dati (e salvo lo scaler aggiornato)
+    scaled_sample_data = _build_scaled_core_model(sample_data, honey_paths.scaler_path,scaler)  # aggiorna automaticamente lo scaler
+
+    # il dataset core che stiamo usando (è un subset, quindi è importante metterlo da parte?)
+
+    labels = _creating_clusters(scaled_sample_data, honey_paths.model_path, model)  # aggiorna automaticamente il model
+    # otteniamo una lista del tipo [1,1, 0, 2, 1].
+    # ogni sessione viene assegnata al centroide più vicino
+    # invece che analizzare milioni di file, possiamo analizzare i 'rappresentanti' dei gruppi
+
+    clustered_sample_data = sample_data.copy()
+    clustered_sample_data['cluster_global_id'] = labels  # aggiungiamo una colonna chiamata id del cluster e ci mettiamo le label
+
+    _writing_as_parquet(clustered_sample_data, honey_paths.clustered_result.with_suffix(".parquet"))
+    _writing_as_csv(clustered_sample_data, honey_paths.clustered_result.with_suffix(".csv"))
+    return clustered_sample_data
 
 """
 /////////////////////////////////////////////////EXPERTISE CLUSTERING///////////////////////////////////////////////////////////////////////////////////////
 """
 
-def _expertise_stage_1(raw_complete_dataset: pd.DataFrame) -> pd.DataFrame:
-    df = raw_complete_dataset.copy()
+def _expertise_clustering(initial_dataset: pd.DataFrame, honey_paths: HoneyClusterPaths) -> pd.DataFrame:
+    is_bot = _expertise_stage_1(initial_dataset)
+    clustered_df = _expertise_stage_2(initial_dataset, is_bot, honey_paths)
+    _writing_as_parquet(clustered_df, honey_paths.clustered_for_expertise_result.with_suffix(".parquet"))
+    _writing_as_csv(clustered_df, honey_paths.clustered_for_expertise_result.with_suffix(".csv"))
+    return clustered_df
+
+def _expertise_stage_1(raw_complete_dataset: pd.DataFrame) -> pd.Series:
+    """ maschera dei bot, senza copiare il dataset (in concurrent_clustering è il file condiviso) """
+    is_bot = _is_bot(raw_complete_dataset)
+    logging.info(f"Bot detected: {is_bot.mean() * 100:.2f}%")
+    return is_bot
 
+def _is_bot(df: pd.DataFrame) -> pd.Series:
     # Versione corretta sintatticamente
-    df['is_bot'] = (
+    return (
             (df['inter_command_timing'] < 2) &
             (df['unique_commands_ratio'] < 0.1) &
             (df['command_correction_attempts'] == 0.0)
     )
-    logging.info(f"Bot detected: {df['is_bot'].mean() * 100:.2f}%")
-    return df
 
-def _expertise_stage_2(df: pd.DataFrame, honey_paths: HoneyClusterPaths) -> pd.DataFrame:
-    """ clustering sugli attackers interattivi """
+def _expertise_stage_2(df: pd.DataFrame, is_bot: pd.Series, honey_paths: HoneyClusterPaths) -> pd.DataFrame:
+    """ clustering sugli attackers interattivi: l'unica copia è quella delle loro righe, solo con le colonne numeriche """
 
-    df_interactive = df[~df['is_bot']].copy()
-
-    feature_cols = df_interactive.drop(
-        columns=['cluster_id', 'is_bot'],
-        errors='ignore'
-    ).select_dtypes(include='number').columns
+    feature_cols = [column for column, dtype in df.dtypes.items()
+                    if column not in ('cluster_id', 'is_bot') and pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)]
+    df_interactive = df.loc[~is_bot.to_numpy(), feature_cols]
 
     scaler = _get_scaler(honey_paths.expertise_scaler_path)
     model = _get_model(honey_paths.expertise_model_path)
 
-    scaled_interactive = _build_scaled_core_model(df_interactive[feature_cols],honey_paths.expertise_scaler_path, scaler)
+    scaled_interactive = _build_scaled_core_model(df_interactive, honey_paths.expertise_scaler_path, scaler)
     labels = _creating_clusters(scaled_interactive, honey_paths.expertise_model_path, model, n_clusters = 2)
 
+    df_interactive['is_bot'] = False
     df_interactive['cluster_expertise_id'] = labels
     return df_interactive
 """
@@ -128,6 +202,8 @@ def _feature_clustering_behavior(df: pd.DataFrame, honey_paths: HoneyClusterPath
     _writing_as_parquet(clustered_df, honey_paths.clustered_for_behavior_result.with_suffix(".parquet"))
     _writing_as_csv(clustered_df, honey_paths.clustered_for_behavior_result.with_suffix(".csv"))
 
+_FEATURE_CLUSTERINGS = {"temporal": _feature_clustering_time, "command_based": _feature_clustering_command, "behavioral": _feature_clustering_behavior}
+
 def _feature_clustering(dataset: pd.DataFrame, features: list, label_name: str, honey_paths: HoneyClusterPaths):
     if dataset.empty:
         logging.warning("dataset vuoto")
@@ -149,14 +225,176 @@ def _feature_clustering(dataset: pd.DataFrame, features: list, label_name: str,
 
     return dataset
 
+"""
+//////////////////////////////////////////ETICHETTATURA DI TUTTE LE SESSIONI////////////////////////////////
+"""
+
+# i clustering scrivono le etichette solo delle righe su cui sono stati calcolati (campione o dataset caricato tutto in memoria).
+# label_all_sessions applica gli scaler e i modelli salvati a tutto il dataset completo, a blocchi di batch_rows righe,
+# e scrive in session_labels un parquet per ogni file del dataset completo (stesso nome) con:
+#   row_id: posizione della riga nel suo file (le part non cambiano una volta scritte, il file unico viene riscritto tutto)
+#   cluster_global_id, cluster_expertise_id (-1 per i bot, che l'expertise clustering esclude),
+#   cluster_temporal_id, cluster_command_based_id, cluster_behavioral_id
+# le colonne usate da ogni modello sono quelle con cui è stato addestrato il suo scaler. Un modello non ancora addestrato viene saltato.
+# Un file di etichette più recente del suo file di dati e di tutti i modelli usati non viene rifatto.
+
+_BOT_EXPERTISE_LABEL = -1
+
+def label_all_sessions(honey_paths: HoneyClusterPaths, batch_rows: int = STREAMING_BATCH_ROWS) -> int:
+    """ etichetta ogni sessione del dataset completo con tutti i modelli addestrati. Restituisce le righe etichettate (anche già fatte) """
+    parts = get_complete_dataset_files(honey_paths.complete_dataset_file)
+    progress = StageProgress(LABELING_STAGE, len(parts), honey_paths.run_reports_folder)
+    labelers = _get_labelers(honey_paths)
+    if not labelers:
+        logging.warning("nessun modello addestrato: esegui prima il clustering")
+        progress.finish()
+        return 0
+
+    labels_folder = honey_paths.session_labels_folder
+    labels_folder.mkdir(parents=True, exist_ok=True)
+    for stale in set(labels_folder.glob("*.parquet")) - {labels_folder / part.name for part in parts}: # file di dati che non esistono più
+        stale.unlink()
+
+    newest_model = max(artifact.stat().st_mtime for artifact in _labelers_artifacts(labelers))
+    rows_labeled = 0
+    for part in parts:
+        output = labels_folder / part.name
+        try:
+            if output.exists() and output.stat().st_mtime >= max(part.stat().st_mtime, newest_model):
+                rows = count_complete_dataset_rows(output) # già etichettato
+                progress.step_done(part.name, rows)
+            else:
+                with atomic_output(output) as tmp_output:
+                    rows = write_parquet_batches(_iter_labels(part, batch_rows, labelers), tmp_output)
+                    if not rows: # file di dati vuoto: etichette vuote, con le stesse colonne
+                        write_parquet(pd.DataFrame(columns=["row_id", *labelers]), tmp_output)
+                progress.step_done(part.name, rows, get_size_bytes(part))
+            rows_labeled += rows
+        except Exception as e:
+            logging.error(f"errore nell'etichettatura di {part.name}: {e}")
+            progress.step_done(part.name, failed=True)
+    progress.finish()
+    return rows_labeled
+
+def _get_labelers(honey_paths: HoneyClusterPaths) -> dict:
+    """ colonna delle etichette -> (scaler, modello, percorsi dei due file). Il globale è quello streaming se addestrato """
+    candidates = {
+        "cluster_global_id": [(honey_paths.streaming_scaler_path, honey_paths.streaming_model_path), (honey_paths.scaler_path, honey_paths.model_path)],
+        "cluster_expertise_id": [(honey_paths.expertise_scaler_path, honey_paths.expertise_model_path)],
+    }
+    for label_name in ("temporal", "command_based", "behavioral"):
+        candidates[f"cluster_{label_name}_id"] = [(honey_paths.scalers_folder.joinpath(label_name + ".joblib"), honey_paths.models_folder.joinpath(label_name + ".joblib"))]
+
+    labelers = {}
+    for column, artifacts in candidates.items():
+        for scaler_path, model_path in artifacts:
+            scaler, model = _get_scaler(scaler_path), _get_model(model_path)
+            if scaler and model and hasattr(scaler, "feature_names_in_"):
+                labelers[column] = (scaler, model, (scaler_path, model_path))
+                break
+        else:
+            logging.warning(f"{column}: scaler o modello non addestrato, etichetta saltata")
+    return labelers
+
+def _labelers_artifacts(labelers: dict) -> list[Path]:
+    return [path for _, _, paths in labelers.values() for path in paths]
+
+def _iter_labels(part: Path, batch_rows: int, labelers: dict):
+    row_id = 0
+    for batch in iter_parquet_batches(part, batch_rows):
+        labels = pd.DataFrame({"row_id": np.arange(row_id, row_id + len(batch), dtype=np.int64)})
+        for column, (scaler, model, _) in labelers.items():
+            labels[column] = model.predict(scaler.transform(batch[list(scaler.feature_names_in_)]))
+        if "cluster_expertise_id" in labels:
+            labels.loc[_is_bot(batch).to_numpy(), "cluster_expertise_id"] = _BOT_EXPERTISE_LABEL
+        row_id += len(batch)
+        yield labels
+
+"""
+//////////////////////////////////////////CLUSTERING CONCORRENTE////////////////////////////////
+"""
+
+# clustering, expertise_clustering e features_clustering rileggono ognuno il dataset completo e addestrano uno scaler+KMeans alla volta.
+# concurrent_clustering legge il dataset una volta sola e lo scrive in un .npy (in ordine di colonna: ogni feature è contigua)
+# che ogni worker apre in memmap: le pagine stanno nella page cache del sistema, condivise da tutti i processi, nessuna copia per worker.
+# I cinque addestramenti sono indipendenti (scaler, modelli e risultati hanno file propri) e girano in parallelo:
+# il tempo totale è quello del più lento invece della somma (se ci sono abbastanza core: ogni worker usa cpu / processi thread
+# per OpenMP e BLAS, vedi _limit_worker_threads; bench_pipeline misura cluster_sequential contro cluster).
+# Differenza con features_clustering: lì il dataset viene modificato in sequenza e i risultati successivi contengono anche le etichette
+# dei clustering precedenti (cluster_temporal_id nel risultato dei comandi...), qui ogni risultato ha solo la propria.
+# Le etichette sono le stesse.
+
+_CLUSTERING_JOBS = ("global", "expertise", "temporal", "command_based", "behavioral")
+_worker_thread_limits = None
+
+def _share_dataset(df: pd.DataFrame, shared_folder: Path) -> tuple[Path, list[str]]:
+    shared_file = shared_folder / "dataset.npy"
+    dtype = np.result_type(*df.dtypes)
+    matrix = np.lib.format.open_memmap(shared_file, mode="w+", dtype=dtype, shape=df.shape, fortran_order=True)
+    for i, column in enumerate(df.columns): # colonna per colonna: mai una seconda copia intera in memoria
+        matrix[:, i] = df[column].to_numpy()
+    matrix.flush()
+    del matrix
+    return shared_file, list(df.columns)
+
+def _open_shared_dataset(shared: tuple[Path, list[str]]) -> pd.DataFrame:
+    shared_file, columns = shared
+    return pd.DataFrame(np.load(shared_file, mmap_mode="r"), columns=columns, copy=False)
+
+def _run_clustering_jobs(honey_paths: HoneyClusterPaths, shared: tuple[Path, list[str]], workers: int, streaming: bool, batch_rows: int,
+                         progress: StageProgress) -> dict[str, str | None]:
+    results = {}
+    if workers <= 1:
+        for job in _CLUSTERING_JOBS:
+            rows = 0
+            try:
+                rows = _run_clustering_job(job, honey_paths, shared, streaming, batch_rows)
+                results[job] = None
+            except Exception as e:
+                results[job] = f"{type(e).__name__}: {e}"
+            progress.step_done(job, rows, failed=results[job] is not None)
+    else:
+        processes = min(workers, len(_CLUSTERING_JOBS))
+        # KMeans e BLAS usano di default tutti i core in ogni processo: con più processi si contenderebbero la cpu
+        threads = max(1, (os.cpu_count() or 1) // processes)
+        with ProcessPoolExecutor(max_workers=processes, initializer=_limit_worker_threads, initargs=(threads,)) as executor:
+            futures = {executor.submit(_run_clustering_job, job, honey_paths, shared, streaming, batch_rows): job for job in _CLUSTERING_JOBS}
+            for future in as_completed(futures):
+                job = futures[future]
+                rows = 0
+                try:
+                    rows = future.result()
+                    results[job] = None
+                except Exception as e:
+                    results[job] = f"{type(e).__name__}: {e}"
+                progress.step_done(job, rows, failed=results[job] is not None)
+    return results
+
+def _limit_worker_threads(threads: int):
+    global _worker_thread_limits
+    _worker_thread_limits = threadpool_limits(limits=threads) # resta attivo per tutta la vita del worker
+
+def _run_clustering_job(job: str, honey_paths: HoneyClusterPaths, shared: tuple[Path, list[str]], streaming: bool, batch_rows: int) -> int:
+    """ eseguito nel worker: righe su cui è stato addestrato il modello """
+    if job == "global" and streaming: # legge da solo il dataset completo a blocchi, con il proprio report; se fallisce solleva e il job risulta fallito
+        return _streaming_clustering(honey_paths, batch_rows)
+    dataset = _open_shared_dataset(shared)
+    if job == "global":
+        return len(_global_clustering(_stratified_sample(dataset), honey_paths))
+    if job == "expertise":
+        return len(_expertise_clustering(dataset, honey_paths))
+    _FEATURE_CLUSTERINGS[job](dataset, honey_paths)
+    return len(dataset)
+
 """
 //////////////////////////////////////////PIPELINE CLUSTERING////////////////////////////////
 """
 
 def _extraction_of_initial_clustering_subset(complete_dataset: Path, n_samples: int = 200000) -> pd.DataFrame: # RAISES EXCEPTION!
     logging.info("Caricamento dataset principale")
-    df = read_main_dataset(complete_dataset)
+    return _stratified_sample(read_main_dataset(complete_dataset), n_samples)
 
+def _stratified_sample(df: pd.DataFrame, n_samples: int = 200000) -> pd.DataFrame: # RAISES EXCEPTION!
     if df.empty:
         logging.warning("dataset vuoto")
         raise Exception("dataset vuoto")
@@ -168,9 +406,12 @@ def _extraction_of_initial_clustering_subset(complete_dataset: Path, n_samples:
     df_interactive = df[(df['unique_commands_ratio'] > 0.3) & (df['tool_signatures'] == 0)]
     df_bots = df[df['unique_commands_ratio']<= 0.3] # i bot sono quelli che ripetono sempre gli stessi comandi
 
+    # ogni gruppo è limitato alle righe che ha: con un dataset piccolo (es. una finestra di pochi giorni)
+    # o con pochi bot il campione è più piccolo di n_samples invece di fallire
+    n_samples = min(n_samples, len(df))
     n_skilled_needed = min(len(df_skilled), int(n_samples * 0.2))
     n_interactive_needed = min(len(df_interactive), int(n_samples * 0.3))
-    n_bots_needed = n_samples - n_skilled_needed - n_interactive_needed
+    n_bots_needed = min(len(df_bots), n_samples - n_skilled_needed - n_interactive_needed)
 
     subset_skilled = df_skilled.sample(n_skilled_needed, random_state=42)
     subset_interactive = df_interactive.sample(n_interactive_needed, random_state=42)
@@ -184,6 +425,99 @@ def _extraction_of_initial_clustering_subset(complete_dataset: Path, n_samples:
     #mischiamo per non avere i dati ordinati per classe
     return df_final.sample(frac=1, random_state=42).reset_index(drop=True)
 
+"""
+//////////////////////////////////////////STREAMING CLUSTERING////////////////////////////////
+"""
+
+# il campione stratificato tiene in memoria 200k righe e ignora tutte le altre.
+# In modalità streaming scaler e centroidi imparano da TUTTE le righe del dataset completo, lette a blocchi di batch_rows:
+#   1° passata: StandardScaler.partial_fit (media e varianza di tutto il dataset)
+#   2° passata: MiniBatchKMeans.partial_fit sui blocchi scalati
+#   3° passata: etichetta ogni blocco, conta le sessioni per cluster e tiene un campione uniforme di n_samples righe etichettate,
+#               scritto in clustered_result come prima (l'analisi lo legge)
+# in memoria restano solo il blocco corrente (e la sua copia scalata), il modello e il campione:
+# il tetto di memoria dipende da batch_rows e n_samples, non dalla dimensione del dataset.
+# Scaler e modello hanno file propri (streaming_*.joblib) e, come negli altri clustering, se esistono vengono riusati.
+
+def _streaming_clustering(honey_paths: HoneyClusterPaths, batch_rows: int = STREAMING_BATCH_ROWS, n_samples: int = 200000,
+                          n_clusters: int = 3, random_state: int = 42) -> int: # RAISES EXCEPTION!
+    """ righe su cui sono stati addestrati scaler e modello """
+    progress = StageProgress(CLUSTERING_STAGE, 3, honey_paths.run_reports_folder)
+    dataset = honey_paths.complete_dataset_file
+    dataset_bytes = get_size_bytes(dataset)
+    step = "scaler"
+    try:
+        total_rows = count_complete_dataset_rows(dataset)
+        if not total_rows:
+            logging.warning("dataset vuoto")
+            raise Exception("dataset vuoto")
+
+        scaler = _get_scaler(honey_paths.streaming_scaler_path)
+        read = 0
+        if not scaler:
+            scaler = _streaming_fit_scaler(dataset, batch_rows)
+            _save_scaler(scaler, honey_paths.streaming_scaler_path)
+            read = dataset_bytes
+        progress.step_done(step, total_rows, read)
+        step = "model"
+
+        model = _get_model(honey_paths.streaming_model_path)
+        read = 0
+        if not model:
+            model = _streaming_fit_model(dataset, batch_rows, scaler, n_clusters, random_state)
+            _save_model(model, honey_paths.streaming_model_path)
+            read = dataset_bytes
+        progress.step_done(step, total_rows, read)
+        step = "labels"
+
+        clustered_sample_data, cluster_sizes = _streaming_labels(dataset, batch_rows, scaler, model, min(1.0, n_samples / total_rows), random_state)
+        logging.info(f"streaming clustering: {total_rows} sessions, cluster sizes {cluster_sizes.tolist()}")
+
+        clustered_sample_data = clustered_sample_data.head(n_samples)
+        _writing_as_parquet(clustered_sample_data, honey_paths.clustered_result.with_suffix(".parquet"))
+        _writing_as_csv(clustered_sample_data, honey_paths.clustered_result.with_suffix(".csv"))
+        progress.step_done(step, total_rows, dataset_bytes)
+
+    except Exception as e:
+        logging.error(f"errore nello streaming clustering: {e}")
+        progress.step_done(step, failed=True)
+        progress.finish()
+        raise # nessun modello addestrato: chi chiama (clustering, concurrent_clustering) deve saperlo
+    progress.finish()
+    return total_rows
+
+def _streaming_fit_scaler(dataset: Path, batch_rows: int) -> StandardScaler:
+    scaler = StandardScaler()
+    for batch in iter_complete_dataset_batches(dataset, batch_rows):
+        scaler.partial_fit(batch)
+    return scaler
+
+def _streaming_fit_model(dataset: Path, batch_rows: int, scaler: StandardScaler, n_clusters: int, random_state: int) -> MiniBatchKMeans:
+    model = MiniBatchKMeans(
+        n_clusters=n_clusters,
+        init="k-means++", # sul primo blocco (pieno, tranne se il dataset è più piccolo di batch_rows)
+        batch_size=batch_rows,
+        random_state=random_state
+    )
+    for batch in iter_complete_dataset_batches(dataset, batch_rows):
+        model.partial_fit(scaler.transform(batch))
+    return model
+
+def _streaming_labels(dataset: Path, batch_rows: int, scaler: StandardScaler, model: MiniBatchKMeans, sample_fraction: float,
+                      random_state: int) -> tuple[pd.DataFrame, np.ndarray]:
+    """ campione uniforme (circa sample_fraction delle righe) con le etichette e numero di sessioni per cluster su tutto il dataset """
+    rng = np.random.default_rng(random_state)
+    cluster_sizes = np.zeros(model.n_clusters, dtype=np.int64)
+    samples = []
+    for batch in iter_complete_dataset_batches(dataset, batch_rows):
+        labels = model.predict(scaler.transform(batch))
+        cluster_sizes += np.bincount(labels, minlength=model.n_clusters)
+        picked = rng.random(len(batch)) < sample_fraction
+        sample = batch[picked].copy()
+        sample['cluster_global_id'] = labels[picked]
+        samples.append(sample)
+    return pd.concat(samples, ignore_index=True), cluster_sizes
+
 
 
 def _get_scaler(scaler_path: Path):
@@ -241,7 +575,8 @@ def _creating_clusters(scaled_core, model_path: Path, old_model: KMeans = None,
 def _writing_as_parquet(clustered_data: pd.DataFrame, output_path: Path):
     if isinstance(clustered_data, np.ndarray):
         clustered_data = pd.DataFrame(clustered_data)
-    clustered_data.to_parquet(output_path)
+        clustered_data.columns = clustered_data.columns.astype(str) # parquet vuole nomi di colonna stringa
+    write_parquet(clustered_data, output_path)
 
 def _writing_as_csv(clustered_data: pd.DataFrame, output_path: Path):
     """
@@ -1,3 +1,5 @@
+import hashlib
+
 # ==============================================================================
 # VOCABOLARI E FIRME PER ANALISI COMPORTAMENTALE COWRIE
 # ==============================================================================
@@ -158,4 +160,25 @@ def get_all_known_verbs():
     for sig_set in _SIGNATURES.values():
         verbs.update(sig_set)
     verbs.update(get_fast_check_set())
-    return verbs
\ No newline at end of file
+    return verbs
+
+
+def get_vocabulary_version():
+    """ Impronta di tutti i vocabolari: se cambia, i file processati vanno ricalcolati """
+    return _fingerprint(
+        sorted((name, sorted(cmds)) for name, cmds in _SIGNATURES.items()),
+        sorted(_FAST_CHECK_LONGER_VERBS),
+        sorted(SIGNATURE_WEIGHTS.items()),
+        MAX_SIGNATURE_SCORE,
+        sorted((name, sorted(cats)) for name, cats in _BEHAVIORAL_MAP.items()),
+        get_tunneling_vocabulary_version()
+    )
+
+
+def get_tunneling_vocabulary_version():
+    """ Impronta delle sole mappe usate durante la pulizia (TCP-IP Data) """
+    return _fingerprint(sorted(TLS_VERSIONS_MAP.items()), sorted(HTTP_VERBS_MAP.items()), TLS_NOT_KNOWN)
+
+
+def _fingerprint(*parts):
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+"""
+CACHE LRU A DIMENSIONE LIMITATA
+
+    il traffico dei bot ripete le stesse poche centinaia di righe di comando milioni di volte:
+    il risultato di una trasformazione pura (regex, split, verbo) viene calcolato una volta per chiave.
+    Quando è piena viene scartata la chiave usata meno di recente.
+    I contatori servono a scegliere la dimensione: molte evictions e poche hits = cache troppo piccola.
+"""
+
+DEFAULT_MAX_ENTRIES = 8192
+
+
+class BoundedCache:
+    __slots__ = ("max_entries", "hits", "misses", "evictions", "_entries")
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries # <= 0 disattiva la cache (i contatori continuano a funzionare)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get_or_compute(self, key, compute):
+        """ restituisce il valore in cache per key, altrimenti lo calcola con compute(key) e lo memorizza.
+            Il valore è condiviso tra tutte le chiamate: deve essere immutabile (tuple, str) """
+        entries = self._entries
+        value = entries.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            entries.move_to_end(key)
+            return value
+
+        self.misses += 1
+        value = compute(key)
+        if self.max_entries > 0:
+            entries[key] = value
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        self._entries.clear()
+
+    def reset_counters(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def summary(self) -> str:
+        return (f"{len(self)}/{self.max_entries} entries, {self.hits} hits, {self.misses} misses, "
+                f"{self.evictions} evictions, hit rate {self.hit_rate * 100:.1f}%")
+
+
+_MISSING = object() # None può essere un valore valido
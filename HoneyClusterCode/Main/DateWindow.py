@@ -0,0 +1,78 @@
+import hashlib
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+
+"""
+FINESTRA TEMPORALE
+
+    seleziona i file giornalieri (cyberlab_<data>.json.gz, <data>.json, <data>.parquet) in base alla data nel nome,
+    prima di aprirli. Si può indicare un intervallo (start/end, estremi inclusi, anche solo uno dei due) o una lista di giorni.
+"""
+
+_FILE_PREFIX = "cyberlab_"
+_FILE_SUFFIXES = (".json.gz", ".json", ".parquet")
+
+
+@dataclass(frozen=True)
+class DateWindow:
+    start: date | None = None
+    end: date | None = None
+    days: frozenset[date] | None = None
+
+    @classmethod
+    def between(cls, start: str | date | None = None, end: str | date | None = None) -> "DateWindow":
+        return cls(start=_to_date(start) if start else None, end=_to_date(end) if end else None)
+
+    @classmethod
+    def of_days(cls, days) -> "DateWindow":
+        return cls(days=frozenset(_to_date(day) for day in days))
+
+    def contains(self, day: date) -> bool:
+        if self.days is not None and day not in self.days:
+            return False
+        if self.start and day < self.start:
+            return False
+        if self.end and day > self.end:
+            return False
+        return True
+
+    def label(self) -> str:
+        """ nome della cartella dei risultati relativi a questa finestra """
+        if self.days is not None:
+            days = sorted(self.days)
+            digest = hashlib.sha1(",".join(d.isoformat() for d in days).encode()).hexdigest()[:8]
+            first_last = f"{days[0]}_{days[-1]}_" if days else ""
+            return f"days_{first_last}{len(days)}_{digest}"
+        return f"{self.start or 'begin'}_to_{self.end or 'end'}"
+
+
+def get_date_of_file(filename: str) -> date | None:
+    name = filename.removeprefix(_FILE_PREFIX)
+    for suffix in _FILE_SUFFIXES:
+        if name.endswith(suffix):
+            name = name.removesuffix(suffix)
+            break
+    try:
+        return date.fromisoformat(name)
+    except ValueError:
+        return None
+
+def get_day_of_gz_file(filename: str) -> str:
+    """ giorno di un log zenodo (cyberlab_<data>.json.gz -> <data>), usato come nome dei file puliti e processati """
+    return filename.removesuffix(".json.gz").removeprefix(_FILE_PREFIX)
+
+def select_files_in_window(files, date_window: DateWindow | None = None) -> list[Path]:
+    """ ordina i file e, se c'è una finestra, tiene solo quelli la cui data nel nome vi ricade """
+    files = sorted(files)
+    if date_window is None:
+        return files
+    selected = []
+    for file in files:
+        day = get_date_of_file(file.name)
+        if day is not None and date_window.contains(day):
+            selected.append(file)
+    return selected
+
+def _to_date(day: str | date) -> date:
+    return day if isinstance(day, date) else date.fromisoformat(day)
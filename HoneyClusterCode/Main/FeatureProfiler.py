@@ -0,0 +1,137 @@
+import json
+import logging
+from contextlib import nullcontext
+from pathlib import Path
+from time import perf_counter
+
+from Main.RunManifest import atomic_output
+
+"""
+PROFILING DEL PROCESSING (opzionale)
+
+    per ogni file processato registra tempo cumulativo e numero di chiamate:
+        - per fase: lettura/parsing delle sessioni, appiattimento in array (con dentro estrazione dei verbi e i tempi di inizio/fine),
+          calcolo delle feature (con dentro la conversione in blocco dei tempi degli eventi), scrittura del parquet, totale.
+          timestamp_parsing somma entrambe le conversioni dei tempi
+        - per feature di HoneyClusterData
+        - conteggi del file: sessioni, eventi, verbi
+    e li scrive in un json per file (artifacts/profiles/<file>.profile.json).
+    Disattivato si usa NULL_PROFILER: timed e timed_iter restituiscono la funzione / l'iterabile originali,
+    gli altri metodi non fanno nulla. Nessun costo per evento, solo qualche chiamata vuota per file.
+"""
+
+PHASES = "phases"
+FEATURES = "features"
+_THROUGHPUT_COUNTS = ("sessions", "events", "input_bytes") # conteggi riportati anche al secondo sul tempo totale
+
+
+class FeatureProfiler:
+    enabled = True
+
+    def __init__(self, name: str):
+        self.name = name
+        self._timings: dict[str, dict[str, list]] = {PHASES: {}, FEATURES: {}} # sezione -> nome -> [secondi, chiamate]
+        self._counts: dict[str, int] = {}
+
+    def phase(self, name: str, calls: int = 1) -> "_Timer":
+        return _Timer(self._timing(PHASES, name), calls)
+
+    def feature(self, name: str, calls: int = 1) -> "_Timer":
+        return _Timer(self._timing(FEATURES, name), calls)
+
+    def timed(self, function, name: str):
+        """ function con il tempo di ogni chiamata sommato alla fase name """
+        timing = self._timing(PHASES, name)
+
+        def profiled(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timing[0] += perf_counter() - start
+                timing[1] += 1
+        return profiled
+
+    def timed_iter(self, iterable, name: str):
+        """ iterabile con il tempo speso a produrre ogni elemento (non quello di chi lo consuma) sommato alla fase name """
+        timing = self._timing(PHASES, name)
+        iterator = iter(iterable)
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                timing[0] += perf_counter() - start
+                return
+            timing[0] += perf_counter() - start
+            timing[1] += 1
+            yield item
+
+    def count(self, name: str, n: int = 1):
+        self._counts[name] = self._counts.get(name, 0) + n
+
+    def to_dict(self) -> dict:
+        report = {"file": self.name, "counts": dict(self._counts)}
+        for section, timings in self._timings.items():
+            report[section] = {name: {"seconds": round(seconds, 6), "calls": calls} for name, (seconds, calls) in timings.items()}
+        total = self._timings[PHASES].get("total", [0.0])[0]
+        if total > 0:
+            report["throughput"] = {f"{name}_per_second": round(n / total, 1) for name, n in self._counts.items() if name in _THROUGHPUT_COUNTS}
+        return report
+
+    def write_report(self, profiles_folder: Path) -> Path:
+        profiles_folder = Path(profiles_folder)
+        profiles_folder.mkdir(parents=True, exist_ok=True)
+        report_path = profiles_folder / f"{self.name}.profile.json"
+        with atomic_output(report_path) as tmp:
+            with open(tmp, "w", encoding="utf-8") as out:
+                json.dump(self.to_dict(), out, indent=1)
+        logging.info(f"profile of {self.name} saved to {report_path}")
+        return report_path
+
+    def _timing(self, section: str, name: str) -> list:
+        return self._timings[section].setdefault(name, [0.0, 0])
+
+
+class _NullProfiler:
+    """ stessa interfaccia di FeatureProfiler, non misura nulla """
+    enabled = False
+    _NO_TIMER = nullcontext()
+
+    def phase(self, name: str, calls: int = 1):
+        return self._NO_TIMER
+
+    def feature(self, name: str, calls: int = 1):
+        return self._NO_TIMER
+
+    def timed(self, function, name: str):
+        return function
+
+    def timed_iter(self, iterable, name: str):
+        return iterable
+
+    def count(self, name: str, n: int = 1):
+        pass
+
+NULL_PROFILER = _NullProfiler()
+
+
+"""
+    PRIVATE FUNCTION FOR USAGE PURPOSE
+"""
+
+class _Timer:
+    __slots__ = ("_timing", "_calls", "_start")
+
+    def __init__(self, timing: list, calls: int):
+        self._timing = timing
+        self._calls = calls
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._timing[0] += perf_counter() - self._start
+        self._timing[1] += self._calls
+        return False
@@ -1,8 +1,14 @@
 from pathlib import Path
 
+from Main.DateWindow import DateWindow
+
 class HoneyClusterPaths:
-    def __init__(self, base_path):
+    def __init__(self, base_path, date_window: DateWindow = None):
         self.base_folder = Path(base_path)
+        # con una finestra temporale gli stage lavorano solo sui giorni selezionati e
+        # tutto ciò che viene dopo il processing (dataset completo, modelli, risultati) finisce in windows/<finestra>
+        self.date_window = date_window
+        self.results_folder = self.base_folder if date_window is None else Path(self.base_folder, "windows", date_window.label())
         self.original_folder = self.base_folder / "original"
         """
             ORIGINAL -> CLEANING
@@ -18,20 +24,33 @@ class HoneyClusterPaths:
         """
             PROCESSING -> CLUSTERING
         """
-        self.complete_dataset_file = Path(base_path,"complete_dataset.parquet")
-        self.artifacts_folder = Path(base_path,"artifacts")
+        self.complete_dataset_file = Path(self.results_folder,"complete_dataset.parquet")
+        self.artifacts_folder = Path(self.results_folder,"artifacts")
         self.artifacts_folder.mkdir(parents=True, exist_ok=True)
+        # REPORT DELLE ESECUZIONI: avanzamento, velocità e memoria di ogni stage (vedi Main.StageProgress)
+        self.run_reports_folder = Path(self.artifacts_folder, "run_reports")
+        # DATASET COMPLETO INCREMENTALE: file già uniti e indice degli hash delle righe
+        self.complete_dataset_state_folder = Path(self.artifacts_folder, "complete_dataset_state")
+        # RUN MANIFEST (cosa è già stato pulito/processato e con quale versione): condiviso da tutte le finestre
+        self.manifest_file = Path(base_path, "artifacts", "run_manifest.json")
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        # PROFILI DEL PROCESSING (solo se richiesti): anche questi per file di input, condivisi da tutte le finestre
+        self.profiles_folder = Path(base_path, "artifacts", "profiles")
+        # VOCABOLARIO DEI COMANDI OSSERVATI (per aggiornare command_vocabularies.py)
+        self.command_corpus_file = Path(self.artifacts_folder, "command_corpus.tsv")
         # SCALERS
         self.scalers_folder = Path(self.artifacts_folder, "scalers")
         self.scalers_folder.mkdir(parents=True, exist_ok=True)
         self.scaler_path = self.scalers_folder / "scaler.joblib"
         self.expertise_scaler_path = self.scalers_folder / "expertise_scaler.joblib"
+        self.streaming_scaler_path = self.scalers_folder / "streaming_scaler.joblib" # clustering globale addestrato su tutto il dataset
         # different scalers for different features
         # MODELS
         self.models_folder = Path(self.artifacts_folder, "models")
         self.models_folder.mkdir(parents=True, exist_ok=True)
         self.model_path = self.models_folder / "model.joblib"
         self.expertise_model_path = self.models_folder / "expertise_model.joblib"
+        self.streaming_model_path = self.models_folder / "streaming_model.joblib"
         # different models for different features
         # SAMPLED DATASET
         self.core = Path(self.artifacts_folder,"core_dataset.parquet")
@@ -46,10 +65,12 @@ class HoneyClusterPaths:
         self.clustered_for_time_result = Path(self.clustering_results_folder,"clustered_for_temporal_result")
         self.clustered_for_command_result = Path(self.clustering_results_folder,"clustered_for_command_result")
         self.clustered_for_behavior_result = Path(self.clustering_results_folder, "clustered_for_behavior_result")
+        # ETICHETTE DI TUTTE LE SESSIONI: un parquet per ogni file del dataset completo, allineato con row_id
+        self.session_labels_folder = Path(self.clustering_results_folder, "session_labels")
 
         """
             CLUSTERING -> ANALYSIS 
         """
-        self.analysis_result_folder = Path(self.base_folder,"analysis_result")
+        self.analysis_result_folder = Path(self.results_folder,"analysis_result")
         self.analysis_result_folder.mkdir(parents=True, exist_ok=True)
         self.analysis_result_path = Path(self.analysis_result_folder,"analysis_result.parquet")
\ No newline at end of file
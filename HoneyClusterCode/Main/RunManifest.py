@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+from MachineLearning.command_vocabularies import get_vocabulary_version, get_tunneling_vocabulary_version
+
+"""
+MANIFEST DELLE ESECUZIONI
+
+    per ogni stage e per ogni file di input registriamo:
+        - dimensione, mtime e sha256 dell'input (l'hash viene ricalcolato solo se dimensione o mtime cambiano)
+        - nome e dimensione dell'output prodotto
+        - la versione di codice + vocabolari con cui l'output è stato prodotto
+    un output è valido solo se tutte queste informazioni coincidono: altrimenti lo stage lo ricalcola.
+    Un output completo senza voce (scritto prima del manifest) può essere registrato con adopt invece di essere ricalcolato.
+    Tutti gli output vengono scritti con atomic_output, quindi un'interruzione non lascia mai file a metà.
+"""
+
+CLEANING_STAGE = "cleaning"
+PROCESSING_STAGE = "processing"
+
+# da incrementare quando cambia il modo in cui uno stage produce il suo output
+_STAGE_CODE_VERSIONS = {
+    CLEANING_STAGE: 1,
+    PROCESSING_STAGE: 2, # 2: pyarrow + zstd (HoneyClusterSchema)
+}
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_stage_version(stage: str) -> str:
+    # la pulizia usa solo le mappe del tunneling, il processing tutti i vocabolari
+    vocabulary = get_tunneling_vocabulary_version() if stage == CLEANING_STAGE else get_vocabulary_version()
+    return f"{stage}-v{_STAGE_CODE_VERSIONS[stage]}-{vocabulary}"
+
+
+class RunManifest:
+    def __init__(self, manifest_path: Path):
+        self.manifest_path = Path(manifest_path)
+        self._stages = self._load()
+
+    def is_up_to_date(self, stage: str, input_path: Path, output_path: Path) -> bool:
+        entry = self._stages.get(stage, {}).get(input_path.name)
+        if not entry:
+            return False
+        if entry["version"] != get_stage_version(stage):
+            logging.info(f"{input_path.name}: {stage} version changed, recomputing")
+            return False
+        if entry["output"] != output_path.name or entry["output_size"] != _size_or_none(output_path):
+            return False
+        if entry["input_sha256"] != self._fingerprint(input_path, entry):
+            logging.info(f"{input_path.name}: input changed, recomputing {stage}")
+            return False
+        entry["input_mtime_ns"] = input_path.stat().st_mtime_ns # stesso contenuto: la prossima volta non serve rileggerlo
+        return True
+
+    def record(self, stage: str, input_path: Path, output_path: Path):
+        """ da chiamare solo dopo che l'output è stato scritto per intero """
+        stat = input_path.stat()
+        old_entry = self._stages.get(stage, {}).get(input_path.name)
+        self._stages.setdefault(stage, {})[input_path.name] = {
+            "input_size": stat.st_size,
+            "input_mtime_ns": stat.st_mtime_ns,
+            "input_sha256": self._fingerprint(input_path, old_entry),
+            "output": output_path.name,
+            "output_size": _size_or_none(output_path), # None: lo stage non ha prodotto output (es. nessuna sessione)
+            "version": get_stage_version(stage),
+        }
+
+    def adopt(self, stage: str, input_path: Path, output_path: Path) -> bool:
+        """ output già presente ma senza una voce (scritto prima che esistesse il manifest): viene registrato così com'è
+            invece di ricalcolarlo. Chi chiama deve aver già verificato che l'output sia completo """
+        if input_path.name in self._stages.get(stage, {}) or not output_path.exists():
+            return False
+        self.record(stage, input_path, output_path)
+        return True
+
+    def forget(self, stage: str, input_path: Path):
+        self._stages.get(stage, {}).pop(input_path.name, None)
+
+    def save(self):
+        with atomic_output(self.manifest_path) as tmp:
+            with open(tmp, "w", encoding="utf-8") as out:
+                json.dump(self._stages, out, indent=1, sort_keys=True)
+
+    def _load(self) -> dict:
+        if not self.manifest_path.exists():
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"unreadable manifest {self.manifest_path.name}, every stage will be recomputed: {e}")
+            return {}
+
+    @staticmethod
+    def _fingerprint(input_path: Path, entry: dict | None) -> str:
+        stat = input_path.stat()
+        if entry and entry["input_size"] == stat.st_size and entry["input_mtime_ns"] == stat.st_mtime_ns:
+            return entry["input_sha256"] # file non toccato: evitiamo di rileggere GB di dati
+        return file_sha256(input_path)
+
+
+def _size_or_none(path: Path) -> int | None:
+    return path.stat().st_size if path.exists() else None
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def atomic_output(final_path: Path):
+    """ restituisce un path temporaneo su cui scrivere: viene rinominato in final_path solo se il blocco termina senza errori """
+    final_path = Path(final_path)
+    tmp_path = final_path.with_name(final_path.name + ".tmp")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, final_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from Main.RunManifest import atomic_output
+
+try:
+    import resource # solo unix
+except ImportError:
+    resource = None
+
+"""
+AVANZAMENTO DEGLI STAGE E REPORT DELLE ESECUZIONI
+
+    ogni stage (pulizia, processing, merge, clustering, etichettatura, analisi) crea uno StageProgress con il numero di passi da fare
+    (di solito i file) e a ogni passo concluso emette un evento strutturato:
+        passi fatti / totali / falliti, sessioni e byte letti (con le velocità), tempo trascorso e stimato, RSS attuale e di picco
+    gli eventi passano dal logger "HoneyCluster.progress": il messaggio è il json dell'evento, il dict è in record.progress
+    (chi vuole una barra o una dashboard aggiunge un handler a quel logger).
+    A fine stage tutti gli eventi e il riepilogo vengono scritti in artifacts/run_reports/<inizio>_<stage>.json.
+    RSS: quello attuale è del processo principale, il picco comprende anche i worker già terminati.
+"""
+
+PROGRESS_LOGGER = logging.getLogger("HoneyCluster.progress")
+
+# stage senza una voce nel manifest (pulizia e processing usano CLEANING_STAGE e PROCESSING_STAGE di RunManifest)
+MERGE_STAGE = "merge"
+CLUSTERING_STAGE = "clustering"
+EXPERTISE_CLUSTERING_STAGE = "expertise_clustering"
+FEATURES_CLUSTERING_STAGE = "features_clustering"
+CONCURRENT_CLUSTERING_STAGE = "concurrent_clustering"
+LABELING_STAGE = "labeling"
+ANALYSIS_STAGE = "analysis"
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError): # windows
+    _PAGE_SIZE = 4096
+
+
+class StageProgress:
+    def __init__(self, stage: str, total: int, reports_folder: Path = None):
+        self.stage = stage
+        self.total = total
+        self.reports_folder = reports_folder
+        self.done = 0
+        self.failed = 0
+        self.sessions = 0
+        self.bytes_read = 0
+        self.events: list[dict] = []
+        self._started_at = datetime.now()
+        self._start = time.perf_counter()
+        self._emit("started")
+
+    def step_done(self, name: str, sessions: int = 0, bytes_read: int = 0, failed: bool = False):
+        """ un passo concluso (di solito un file): sessioni prodotte e byte letti dal passo """
+        self.done += 1
+        self.failed += failed
+        self.sessions += sessions
+        self.bytes_read += bytes_read
+        self._emit("failed" if failed else "step", name)
+
+    def finish(self) -> dict:
+        """ ultimo evento + report in reports_folder (se indicato). Restituisce il riepilogo """
+        summary = self._emit("finished")
+        if self.reports_folder is not None:
+            try:
+                self._write_report(summary)
+            except OSError as e: # il report non deve far fallire lo stage
+                logging.warning(f"unable to write the run report of {self.stage}: {e}")
+        return summary
+
+    def _emit(self, kind: str, name: str = None) -> dict:
+        elapsed = time.perf_counter() - self._start
+        event = {
+            "stage": self.stage,
+            "event": kind,
+            "done": self.done,
+            "total": self.total,
+            "failed": self.failed,
+            "elapsed_s": round(elapsed, 3),
+            "sessions": self.sessions,
+            "bytes_read": self.bytes_read,
+            "rss_mb": get_current_rss_mb(),
+            "peak_rss_mb": get_peak_rss_mb(),
+        }
+        if name is not None:
+            event["item"] = name
+        if elapsed > 0 and self.done:
+            event["sessions_per_second"] = round(self.sessions / elapsed, 1)
+            event["mb_per_second"] = round(self.bytes_read / 1e6 / elapsed, 2)
+            if self.done < self.total:
+                event["eta_s"] = round(elapsed / self.done * (self.total - self.done), 1)
+        self.events.append(event)
+        PROGRESS_LOGGER.info(json.dumps(event), extra={"progress": event})
+        return event
+
+    def _write_report(self, summary: dict):
+        self.reports_folder.mkdir(parents=True, exist_ok=True)
+        report_path = self.reports_folder / f"{self._started_at:%Y%m%d-%H%M%S}_{self.stage}.json"
+        report = {"stage": self.stage, "started": self._started_at.isoformat(timespec="seconds"),
+                  "finished": datetime.now().isoformat(timespec="seconds"), "summary": summary, "events": self.events}
+        with atomic_output(report_path) as tmp:
+            with open(tmp, "w", encoding="utf-8") as out:
+                json.dump(report, out, indent=1)
+        logging.info(f"run report of {self.stage} saved to {report_path}")
+
+
+def get_size_bytes(path: Path) -> int:
+    """ dimensione di un file o di tutti i file di una cartella (es. il dataset completo incrementale), 0 se non esiste """
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    return 0
+
+def get_current_rss_mb() -> float | None:
+    try:
+        with open("/proc/self/statm", "r") as f: # linux: pagine residenti nel secondo campo
+            return round(int(f.read().split()[1]) * _PAGE_SIZE / 1e6, 1)
+    except (OSError, ValueError, IndexError):
+        return None
+
+def get_peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak * (1 if sys.platform == "darwin" else 1024) / 1e6, 1) # macOS in byte, linux in KB
+
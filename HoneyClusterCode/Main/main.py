@@ -2,9 +2,10 @@ import logging
 import os
 from Zenodo.ZenodoCleaner import clean_zenodo_dataset
 from Zenodo.ZenodoProcesser import process_dataset
-from MachineLearning.HoneyClustering import clustering, expertise_clustering, features_clustering
+from MachineLearning.HoneyClustering import concurrent_clustering, label_all_sessions
 from MachineLearning.DataDistributionObserver import analizing
-from HoneyCluster import HoneyClusterPaths
+from Main.HoneyCluster import HoneyClusterPaths
+from Main.DateWindow import DateWindow
 from pathlib import Path
 
 
@@ -16,7 +17,7 @@ def _print_menu():
     print("4 = cluster you processed files ")
     print("5 = see the graphs resulting from the clustering process")
     print("6 = abort operation")
-    print("Remember: you can stop and continue the cleaning and processing whenever you want\njust remember to erase (JUST) the last modified file")
+    print("Remember: you can stop and continue the cleaning and processing whenever you want\ninterrupted files are detected and recomputed automatically")
     print("\n\nenter your number:")
 
 def _ask_number()-> int | None :
@@ -62,31 +63,47 @@ def _ask_path() -> Path | None :
 
         return input_path
 
-def set_base_folderpath(input_path: Path) -> HoneyClusterPaths:
-    return HoneyClusterPaths(input_path)
+def _ask_date_window() -> DateWindow | None :
+    while True:
+        print("Optionally, restrict the work to a date window (days are YYYY-MM-DD):")
+        print("start:end for a range (either side can be empty, e.g. 2019-05-18: ), or a comma separated list of days")
+        print("press enter to use the whole dataset")
+        typed_input = input().strip()
+        if not typed_input:
+            return None
+        try:
+            if ":" in typed_input:
+                start, _, end = typed_input.partition(":")
+                return DateWindow.between(start.strip() or None, end.strip() or None)
+            return DateWindow.of_days(day.strip() for day in typed_input.split(",") if day.strip())
+        except ValueError:
+            print("invalid date. Please re-try")
+
+def set_base_folderpath(input_path: Path, date_window: DateWindow = None) -> HoneyClusterPaths:
+    return HoneyClusterPaths(input_path, date_window)
 
-def cleaning(paths : HoneyClusterPaths | None):
+def cleaning(paths : HoneyClusterPaths | None, workers: int = os.cpu_count() or 1):
     if paths is None :
         print("set base folder path first!")
         return
-    clean_zenodo_dataset(paths)
+    clean_zenodo_dataset(paths, workers)
 
-def processing(paths : HoneyClusterPaths | None):
+def processing(paths : HoneyClusterPaths | None, fused: bool = False, workers: int = os.cpu_count() or 1, incremental: bool = False, profile: bool = False):
+    """ incremental = True cambia il formato di complete_dataset.parquet da file a cartella di part (vedi process_dataset) """
     if paths is None:
         print("set base folder path first!")
         return
-    process_dataset(paths)
+    process_dataset(paths, fused, workers=workers, incremental=incremental, profile=profile)
 
-def compute_clustering(paths : HoneyClusterPaths | None):
+def compute_clustering(paths : HoneyClusterPaths | None, streaming: bool = False, label_sessions: bool = False, workers: int = os.cpu_count() or 1):
     if paths is None :
         print("set base folder path first!")
         return
-    print("computing global clustering...")
-    clustering(paths)
-    logging.info("computing expertise clustering...")
-    expertise_clustering(paths)
-    logging.info("computing features clustering...")
-    features_clustering(paths)
+    print("computing global, expertise and features clustering...")
+    concurrent_clustering(paths, workers, streaming)
+    if label_sessions:
+        logging.info("labeling every session...")
+        label_all_sessions(paths)
 
 def analysis(paths: HoneyClusterPaths | None):
     if paths is None :
@@ -95,13 +112,15 @@ def analysis(paths: HoneyClusterPaths | None):
     analizing(paths, True)
 
 if __name__ == "__main__":
+    # a INFO si vedono i messaggi degli stage e gli eventi di avanzamento (logger "HoneyCluster.progress", vedi StageProgress)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     important_paths = None
     while True:
         number = _ask_number()
         if number == 1:
             path_selected = _ask_path()
             if path_selected:
-                important_paths = set_base_folderpath(path_selected)
+                important_paths = set_base_folderpath(path_selected, _ask_date_window())
         elif number == 2:
             cleaning(important_paths)
         elif number == 3:
@@ -1,150 +1,324 @@
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import gzip
 import json
 import ijson
 
-import ZenodoDataReader as ZK
+from Zenodo import ZenodoDataReader as ZK
 from Main.HoneyCluster import HoneyClusterPaths
-
-
-def clean_zenodo_dataset(paths :HoneyClusterPaths):
-    extract_and_clean_all_zenodo_logs_in_folder(paths.original_folder, paths.cleaned_folder)
-
-def extract_and_clean_all_zenodo_logs_in_folder(originals_path: Path, cleaned_path: Path): # cleans all gz zenodo files in a directory
-    for filename in originals_path.glob("*.json.gz"):
-        clean_zenodo_gz(filename, cleaned_path)
-
-def clean_zenodo_gz(gz_path: Path, cleaned_path: Path) -> bool: # cleans single file
-    log_date = _parse_date_from_gz_filename(gz_path.name)
-    out_file = (cleaned_path / log_date).with_suffix(".json")
-
-    if out_file.exists():
+from Main.RunManifest import RunManifest, atomic_output, CLEANING_STAGE
+from Main.DateWindow import DateWindow, select_files_in_window, get_day_of_gz_file
+from Main.StageProgress import StageProgress
+from Zenodo.ZenodoPipeline import clean_gz_pipelined, log_pipeline_stats
+
+# dal più veloce al più lento: yajl2_c è l'estensione C, python è il fallback puro
+_IJSON_BACKENDS_BY_SPEED = ("yajl2_c", "yajl2_cffi", "yajl2", "yajl", "python")
+
+def _load_fastest_ijson_backend():
+    for name in _IJSON_BACKENDS_BY_SPEED:
+        try:
+            return ijson.get_backend(name)
+        except ImportError:
+            continue
+    return ijson
+
+IJSON_BACKEND = _load_fastest_ijson_backend()
+# i numeri vengono letti direttamente come float (gli interi restano int): niente Decimal da riconvertire dopo
+IJSON_USE_FLOAT = True
+
+
+def clean_zenodo_dataset(paths :HoneyClusterPaths, workers: int = 1, streaming: bool = False, pipelined: bool = False):
+    manifest = RunManifest(paths.manifest_file)
+    extract_and_clean_all_zenodo_logs_in_folder(paths.original_folder, paths.cleaned_folder, workers, streaming, manifest, pipelined, paths.date_window, paths.run_reports_folder)
+
+def extract_and_clean_all_zenodo_logs_in_folder(originals_path: Path, cleaned_path: Path, workers: int = 1, streaming: bool = False, manifest: RunManifest = None, pipelined: bool = False, date_window: DateWindow = None, reports_folder: Path = None) -> dict[str, bool]: # cleans all gz zenodo files in a directory
+    """ con workers > 1 ogni file viene pulito in un processo separato. Restituisce l'esito per ogni file.
+        Con il manifest vengono saltati solo i file il cui output è registrato e ancora valido, gli altri vengono riscritti;
+        un output completo senza voce nel manifest (pulito prima che esistesse) viene registrato e saltato.
+        Con date_window vengono puliti solo i giorni della finestra.
+        L'avanzamento viene emesso file per file, con reports_folder anche il report finale (vedi Main.StageProgress) """
+    gz_files = select_files_in_window(originals_path.glob("*.json.gz"), date_window)
+    results = {}
+    logging.info(f"ijson backend in use: {get_ijson_backend_name()}")
+    if get_ijson_backend_name() == "python":
+        logging.warning("ijson C backend not available: parsing will be much slower")
+
+    overwrite = manifest is not None
+    if manifest is not None:
+        to_clean = []
+        for filename in gz_files:
+            if manifest.is_up_to_date(CLEANING_STAGE, filename, get_cleaned_output_path(filename, cleaned_path)):
+                logging.info(f"skipping {filename.name}. It has already been cleaned")
+                results[filename.name] = True
+            elif _adopt_cleaned_output(manifest, filename, cleaned_path):
+                logging.info(f"skipping {filename.name}. It was cleaned before the manifest existed, now it is registered")
+                results[filename.name] = True
+            else:
+                to_clean.append(filename)
+        gz_files = to_clean
+
+    progress = StageProgress(CLEANING_STAGE, len(gz_files), reports_folder)
+    if workers <= 1 or len(gz_files) <= 1:
+        for filename in gz_files:
+            results[filename.name], sessions = _clean_zenodo_gz_counting(filename, cleaned_path, streaming, overwrite, pipelined)
+            _record_cleaning(manifest, filename, cleaned_path, results[filename.name])
+            progress.step_done(filename.name, sessions, filename.stat().st_size, not results[filename.name])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_clean_zenodo_gz_counting, filename, cleaned_path, streaming, overwrite, pipelined): filename for filename in gz_files}
+            for future in as_completed(futures):
+                filename = futures[future]
+                sessions = 0
+                try:
+                    results[filename.name], sessions = future.result()
+                except Exception as e: # il worker è morto prima di poter restituire l'esito
+                    logging.error(f"worker failed on {filename.name}: {e}")
+                    results[filename.name] = False
+                _record_cleaning(manifest, filename, cleaned_path, results[filename.name])
+                progress.step_done(filename.name, sessions, filename.stat().st_size, not results[filename.name])
+
+    _log_cleaning_summary(results)
+    progress.finish()
+    return results
+
+def clean_zenodo_gz(gz_path: Path, cleaned_path: Path, streaming: bool = False, overwrite: bool = False, pipelined: bool = False) -> bool: # cleans single file
+    """ pipelined = True: decompressione, parsing e scrittura girano in parallelo (vedi ZenodoPipeline) """
+    return _clean_zenodo_gz_counting(gz_path, cleaned_path, streaming, overwrite, pipelined)[0]
+
+def _clean_zenodo_gz_counting(gz_path: Path, cleaned_path: Path, streaming: bool = False, overwrite: bool = False, pipelined: bool = False) -> tuple[bool, int]:
+    """ come clean_zenodo_gz, restituisce anche il numero di sessioni scritte (per l'avanzamento dello stage) """
+    log_date = get_day_of_gz_file(gz_path.name)
+    out_file = get_cleaned_output_path(gz_path, cleaned_path)
+
+    if out_file.exists() and not overwrite:
         logging.info(f"skipping {log_date}. It has already been cleaned")
-        return True
+        return True, 0
 
     try:
         logging.info(f"cleaning {log_date} to {out_file}")
 
-        with gzip.open(gz_path, "rb") as f, open(out_file, "w", encoding="utf-8") as out:
-            out.write('[\n')  # inizio lista JSON
-            first_session = True
+        # scriviamo su un file temporaneo, rinominato solo a fine lavoro: cleaned/ contiene solo file completi
+        with atomic_output(out_file) as tmp_file:
+            if pipelined:
+                with open(tmp_file, "w", encoding="utf-8") as out:
+                    stats = clean_gz_pipelined(gz_path, out, lambda f: iter_cleaned_sessions(f, streaming))
+                log_pipeline_stats(log_date, stats)
+                sessions = stats.sessions
+            else:
+                sessions = 0
+                with gzip.open(gz_path, "rb") as f, open(tmp_file, "w", encoding="utf-8") as out:
+                    for _ in write_cleaned_sessions(iter_cleaned_sessions(f, streaming), out):
+                        sessions += 1
+
+        logging.info(f"{log_date} {ZK.get_command_caches_summary()}")
+        return True, sessions
 
-            # Iteriamo sugli oggetti principali del JSON
-            for session in ijson.items(f, "item"):
-                for _, events in session.items():  # ignoriamo session_id
-                    if not events:
-                        continue
+    except Exception as e:
+        logging.error(f"error cleaning {gz_path.name}: {e}")
+        return False, 0
 
-                    cleaned_events = []
-                    has_real_activity = False
 
-                    for e in events:
-                        ce = _clean_event(e)
-                        if ce:
-                            cleaned_events.append(ce)
-                            has_real_activity = True
+def get_cleaned_output_path(gz_path: Path, cleaned_path: Path) -> Path:
+    return (cleaned_path / get_day_of_gz_file(gz_path.name)).with_suffix(".json")
 
-                    if has_real_activity:
-                        session_data = {
-                            ZK.Cleaned_Attr.START_TIME.value: events[0].get(ZK.Useful_Cowrie_Attr.TIME.value),
-                            ZK.Cleaned_Attr.END_TIME.value: events[-1].get(ZK.Useful_Cowrie_Attr.TIME.value),
-                            ZK.Cleaned_Attr.EVENTS.value: cleaned_events
-                        }
+def get_ijson_backend_name() -> str:
+    return IJSON_BACKEND.backend_name
 
-                        if not first_session:
-                            out.write(",\n")
+def iter_cleaned_sessions(f, streaming: bool = False):
+    """ restituisce le sessioni pulite di un file zenodo aperto in binario.
+        streaming = True usa gli eventi di basso livello del parser e non costruisce gli eventi da scartare """
+    if streaming:
+        return _iter_cleaned_sessions_streaming(f)
+    return _iter_cleaned_sessions_items(f)
 
-                        # scriviamo la sessione direttamente
-                        out.write(json.dumps(session_data, ensure_ascii=False))
-                        first_session = False
+def write_cleaned_sessions(sessions, out):
+    """ scrive le sessioni pulite come lista JSON man mano che passano e le restituisce, così chi le consuma può anche elaborarle """
+    out.write('[\n')  # inizio lista JSON
+    first_session = True
+    for session_data in sessions:
+        if not first_session:
+            out.write(",\n")
 
-            out.write('\n]')  # chiusura lista JSON
+        # scriviamo la sessione direttamente
+        out.write(json.dumps(session_data, ensure_ascii=False))
+        first_session = False
+        yield session_data
+    out.write('\n]')  # chiusura lista JSON
 
-        return True
+"""
+    PRIVATE FUNCTION FOR USAGE PURPOSE
 
-    except Exception as e:
-        logging.error(f"error cleaning {gz_path.name}: {e}")
-        if out_file.exists():
-            out_file.unlink()
-        return False
+"""
 
+def _build_session_data(start_time, end_time, cleaned_events: list[dict]) -> dict:
+    return {
+        ZK.Cleaned_Attr.START_TIME.value: start_time,
+        ZK.Cleaned_Attr.END_TIME.value: end_time,
+        ZK.Cleaned_Attr.EVENTS.value: cleaned_events
+    }
 
+def _iter_cleaned_sessions_items(f):
+    # Iteriamo sugli oggetti principali del JSON
+    for session in IJSON_BACKEND.items(f, "item", use_float=IJSON_USE_FLOAT):
+        for _, events in session.items():  # ignoriamo session_id
+            if not events:
+                continue
+
+            cleaned_events = []
+            for e in events:
+                ce = _clean_event(e)
+                if ce:
+                    cleaned_events.append(ce)
+
+            if cleaned_events: # la sessione ha attività reale
+                yield _build_session_data(
+                    events[0].get(ZK.Useful_Cowrie_Attr.TIME.value),
+                    events[-1].get(ZK.Useful_Cowrie_Attr.TIME.value),
+                    cleaned_events
+                )
 
 """
-    PRIVATE FUNCTION FOR USAGE PURPOSE
+STREAMING PARSER
 
+    json zenodo: [ { session_id : [ {evento}, ... ] }, ... ]
+    lavoriamo sugli eventi (start_map, map_key, string, ...) di basic_parse:
+    di ogni evento teniamo solo gli scalari che possono servire, i sotto-alberi vengono saltati senza costruirli
 """
 
-
-def _clean_event(e:dict) -> dict | None: # elimina i None, converte i Decimal in Float ed elimina session id che è già usato come chiave
-    eventid = e.get(ZK.Useful_Cowrie_Attr.EVENTID.value)
-    if not eventid:
+_TIME_KEY = ZK.Useful_Cowrie_Attr.TIME.value
+_EVENTID_KEY = ZK.Useful_Cowrie_Attr.EVENTID.value
+# chiavi lette da ZK.EVENT_DISPATCH (oltre a timestamp, che serve anche per gli eventi scartati)
+_EXTRACTED_KEYS = frozenset({
+    ZK.Useful_Cowrie_Attr.USER.value, ZK.Useful_Cowrie_Attr.PASS.value,
+    ZK.Useful_Cowrie_Attr.MSG.value, ZK.Useful_Cowrie_Attr.DATA.value
+})
+
+def _iter_cleaned_sessions_streaming(f):
+    parser = IJSON_BACKEND.basic_parse(f, use_float=IJSON_USE_FLOAT)
+    for event, _ in parser: # lista principale
+        if event != "start_map":
+            continue
+        for event, _ in parser: # sessione: { session_id : [eventi] }
+            if event == "end_map":
+                break
+            event, _ = next(parser) # valore del session_id
+            if event != "start_array":
+                _skip_value(parser, event)
+                continue
+            session_data = _read_session_events(parser)
+            if session_data:
+                yield session_data
+
+def _read_session_events(parser) -> dict | None:
+    cleaned_events = []
+    start_time = end_time = None
+    is_first = True
+
+    for event, _ in parser:
+        if event == "end_array":
+            break
+        if event == "start_map":
+            dispatch, fields = _read_event(parser)
+            timestamp = fields.get(_TIME_KEY)
+            if dispatch is not None:
+                cleaned_events.append(dispatch[1](fields))
+        else: # un evento che non è un oggetto non ha timestamp
+            _skip_value(parser, event)
+            timestamp = None
+
+        if is_first:
+            start_time = timestamp
+            is_first = False
+        end_time = timestamp
+
+    if not cleaned_events:
         return None
-
-    status = ZK.get_status(eventid)
-    if not ZK.status_is_interesting(status):
+    return _build_session_data(start_time, end_time, cleaned_events)
+
+def _read_event(parser) -> tuple:
+    """ legge un singolo evento fino alla sua end_map.
+        Restituisce (dispatch o None, campi scalari utili). Se l'eventid non è interessante resta solo il timestamp """
+    fields = {}
+    dispatch = None
+    ignored = False
+
+    for event, value in parser:
+        if event == "end_map":
+            break
+        key = value # map_key
+        event, value = next(parser)
+        if event == "start_map" or event == "start_array":
+            _skip_container(parser)
+            continue
+
+        if key == _TIME_KEY:
+            fields[key] = value
+        elif key == _EVENTID_KEY:
+            dispatch = ZK.EVENT_DISPATCH.get(value)
+            ignored = dispatch is None
+        elif not ignored and key in _EXTRACTED_KEYS:
+            fields[key] = value
+
+    return dispatch, fields
+
+def _skip_value(parser, event: str):
+    if event == "start_map" or event == "start_array":
+        _skip_container(parser)
+
+def _skip_container(parser):
+    depth = 1
+    for event, _ in parser:
+        if event == "start_map" or event == "start_array":
+            depth += 1
+        elif event == "end_map" or event == "end_array":
+            depth -= 1
+            if depth == 0:
+                return
+
+
+def _clean_event(e:dict) -> dict | None: # tiene solo gli eventi interessanti ed elimina session id che è già usato come chiave
+    dispatch = ZK.EVENT_DISPATCH.get(e.get(ZK.Useful_Cowrie_Attr.EVENTID.value))
+    if dispatch is None:
         return None
+    return dispatch[1](e)
 
-    cleaned = {
-        ZK.Cleaned_Attr.STATUS.value : status,
-        ZK.Cleaned_Attr.TIME.value: e.get(ZK.Useful_Cowrie_Attr.TIME.value)
-    }
-
-    specific_data = ZK.get_interesting_data_by_status(status, e)
-    if specific_data:
-        cleaned.update(specific_data)
-
-    return _convert_decimals(cleaned)
-
-
-def _convert_decimals(obj):
-    if isinstance(obj, dict):
-        return {k: _convert_decimals(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [_convert_decimals(i) for i in obj]
-    elif type(obj).__name__ == "Decimal":
-        return float(obj)
+def _record_cleaning(manifest: RunManifest | None, gz_path: Path, cleaned_path: Path, success: bool):
+    if manifest is None:
+        return
+    if success:
+        manifest.record(CLEANING_STAGE, gz_path, get_cleaned_output_path(gz_path, cleaned_path))
     else:
-        return obj
+        manifest.forget(CLEANING_STAGE, gz_path)
+    manifest.save() # salviamo subito: se il processo si interrompe, il lavoro fatto resta registrato
 
-def _parse_date_from_gz_filename(filename:str) -> str:
-    return filename.removesuffix(".json.gz").removeprefix("cyberlab_")
+def _adopt_cleaned_output(manifest: RunManifest, gz_path: Path, cleaned_path: Path) -> bool:
+    out_file = get_cleaned_output_path(gz_path, cleaned_path)
+    if not _is_complete_cleaned_file(out_file) or not manifest.adopt(CLEANING_STAGE, gz_path, out_file):
+        return False
+    manifest.save()
+    return True
 
-"""
-GET COMMANDS
-"""
-def DEBUG_from_all_files_print_commands(jsonpath : Path, out_commands: Path) -> None:
-    for gz_path in jsonpath.glob("*.json.gz"):
-        with gzip.open(gz_path, "rb") as f:
-
-            # Iteriamo sugli oggetti principali del JSON
-            for session in ijson.items(f, "item"):
-                commands = []
-                for _, events in session.items():  # ignoriamo session_id
-                    if not events:
-                        continue
-                    for event in events:
-                        eventid = event.get(ZK.Useful_Cowrie_Attr.EVENTID.value)
-                        status = ZK.get_status(eventid)
-                        if ZK.is_only_command(status):
-                            msg = event.get(ZK.Useful_Cowrie_Attr.MSG.value)
-                            if msg:
-                                commands.append(msg)
-                        if status == ZK.Event.TCPIP_DATA:
-                            logging.info(f"Data {status}")
-                            data = event.get(ZK.Useful_Cowrie_Attr.DATA.value)
-                            logging.debug(data)
-                            if msg:
-                                commands.append(data)
-                if commands:
-                    with open(out_commands, "a", encoding="utf-8") as out:
-                        out.writelines('\n\n'.join(commands))
+def _is_complete_cleaned_file(out_file: Path) -> bool:
+    """ un file pulito interrotto (scritto senza atomic_output, prima del manifest) non arriva alla chiusura della lista JSON """
+    try:
+        with open(out_file, "rb") as f:
+            f.seek(max(0, out_file.stat().st_size - 16))
+            return f.read().rstrip().endswith(b"]")
+    except OSError:
+        return False
+
+def _log_cleaning_summary(results: dict[str, bool]):
+    for name, success in sorted(results.items()):
+        logging.info(f"{name}: {'cleaned' if success else 'FAILED'}")
+    failed = [name for name, success in results.items() if not success]
+    logging.info(f"cleaning completed: {len(results) - len(failed)} succeeded, {len(failed)} failed")
+    if failed:
+        logging.warning(f"files to retry: {', '.join(sorted(failed))}")
 
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
     clean_zenodo_dataset(HoneyClusterPaths(Path("C:\\Users\\Sveva\\Documents\\GitHub\\zenodo_dataset")))
-    #DEBUG_from_all_files_print_commands(Path("C:\\Users\\Sveva\\Documents\\GitHub\\zenodo_dataset\\original"), Path("C:\\Users\\Sveva\\Desktop\\comandi.txt"))
 
@@ -0,0 +1,145 @@
+import gzip
+import logging
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import Zenodo.ZenodoDataReader as ZDR
+from Main.HoneyCluster import HoneyClusterPaths
+from Main.RunManifest import atomic_output
+from Main.DateWindow import DateWindow, select_files_in_window
+from Zenodo.ZenodoCleaner import iter_cleaned_sessions
+from MachineLearning.command_vocabularies import _SIGNATURES, _FAST_CHECK_LONGER_VERBS, SIGNATURE_WEIGHTS
+
+"""
+CORPUS DEI COMANDI
+
+    conta in memoria i comandi (normalizzati) e i verbi che il processing vede davvero nei gz originali,
+    e scrive un vocabolario ordinato per frequenza con la copertura di _SIGNATURES e _FAST_CHECK_LONGER_VERBS.
+    Serve a tenere command_vocabularies.py allineato al traffico reale.
+    I comandi sono contati per evento come nel processing (input + success/failed dello stesso comando contano due volte).
+"""
+
+_WHITESPACES = re.compile(r"\s+")
+DEFAULT_TOP_COMMANDS = 5000 # i comandi distinti sono milioni (url, hash...): nel file scriviamo solo i più frequenti
+
+
+def mine_commands(paths: HoneyClusterPaths, workers: int = 1, top_commands: int = DEFAULT_TOP_COMMANDS):
+    mine_command_corpus(paths.original_folder, paths.command_corpus_file, workers, top_commands, date_window=paths.date_window)
+
+def mine_command_corpus(originals_path: Path, output_file: Path, workers: int = 1, top_commands: int = DEFAULT_TOP_COMMANDS, streaming: bool = True, date_window: DateWindow = None) -> tuple[Counter, Counter]:
+    """ restituisce (conteggio comandi, conteggio verbi) dei gz della cartella (o della finestra) e scrive il vocabolario in output_file """
+    gz_files = select_files_in_window(originals_path.glob("*.json.gz"), date_window)
+    commands = Counter()
+    verbs = Counter()
+    failed = []
+
+    if workers <= 1 or len(gz_files) <= 1:
+        for gz_path in gz_files:
+            try:
+                file_commands, file_verbs = count_commands_in_gz(gz_path, streaming)
+                commands.update(file_commands)
+                verbs.update(file_verbs)
+            except Exception as e:
+                logging.error(f"error mining {gz_path.name}: {e}")
+                failed.append(gz_path.name)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(count_commands_in_gz, gz_path, streaming): gz_path for gz_path in gz_files}
+            for future in as_completed(futures):
+                gz_path = futures[future]
+                try:
+                    file_commands, file_verbs = future.result()
+                    commands.update(file_commands)
+                    verbs.update(file_verbs)
+                except Exception as e:
+                    logging.error(f"error mining {gz_path.name}: {e}")
+                    failed.append(gz_path.name)
+
+    if failed:
+        logging.warning(f"files not mined: {', '.join(sorted(failed))}")
+
+    write_command_vocabulary(commands, verbs, output_file, len(gz_files) - len(failed), top_commands)
+    logging.info(f"command vocabulary written to {output_file}")
+    return commands, verbs
+
+def count_commands_in_gz(gz_path: Path, streaming: bool = True) -> tuple[Counter, Counter]:
+    commands = Counter()
+    verbs = Counter()
+    msg_key = ZDR.Cleaned_Attr.MSG.value
+    status_key = ZDR.Cleaned_Attr.STATUS.value
+
+    with gzip.open(gz_path, "rb") as f:
+        for session_data in iter_cleaned_sessions(f, streaming):
+            for event in session_data[ZDR.Cleaned_Attr.EVENTS.value]:
+                msg = event.get(msg_key)
+                if not msg:
+                    continue
+                if ZDR.is_tunneling_data(event[status_key]): # etichetta del protocollo (TLS_1.2, HTTP_GET...)
+                    verbs[msg] += 1
+                    continue
+                for command in msg:
+                    command = normalize_command(command)
+                    if not command:
+                        continue
+                    commands[command] += 1
+                    verb = ZDR.get_verb_of_command(command)
+                    if verb:
+                        verbs[verb] += 1
+    return commands, verbs
+
+def normalize_command(command: str) -> str:
+    return _WHITESPACES.sub(" ", command).strip()
+
+
+"""
+    VOCABOLARIO E COPERTURA
+"""
+
+def write_command_vocabulary(commands: Counter, verbs: Counter, output_file: Path, n_files: int, top_commands: int = DEFAULT_TOP_COMMANDS):
+    categories = _get_categories_by_verb()
+    fast_check = set(_FAST_CHECK_LONGER_VERBS)
+    signature_verbs = set(categories)
+
+    total_verbs = sum(verbs.values())
+    signature_hits = sum(count for verb, count in verbs.items() if verb in signature_verbs)
+    fast_check_hits = sum(count for verb, count in verbs.items() if verb in fast_check)
+    tunneling_hits = sum(count for verb, count in verbs.items() if verb in SIGNATURE_WEIGHTS)
+    unseen_signatures = sorted(signature_verbs - verbs.keys())
+    unseen_fast_check = sorted(fast_check - verbs.keys())
+
+    with atomic_output(output_file) as tmp_file, open(tmp_file, "w", encoding="utf-8") as out:
+        out.write(f"# files: {n_files}\n")
+        out.write(f"# command occurrences: {sum(commands.values())}, distinct commands: {len(commands)}\n")
+        out.write(f"# verb occurrences: {total_verbs}, distinct verbs: {len(verbs)}\n")
+        out.write(f"# coverage _SIGNATURES: {_percentage(signature_hits, total_verbs)} of verb occurrences, {len(signature_verbs) - len(unseen_signatures)}/{len(signature_verbs)} entries seen\n")
+        out.write(f"# coverage _FAST_CHECK_LONGER_VERBS: {_percentage(fast_check_hits, total_verbs)} of verb occurrences, {len(fast_check) - len(unseen_fast_check)}/{len(fast_check)} entries seen\n")
+        out.write(f"# tunneling labels: {_percentage(tunneling_hits, total_verbs)} of verb occurrences\n")
+        out.write(f"# _SIGNATURES entries never seen: {', '.join(unseen_signatures)}\n")
+        out.write(f"# _FAST_CHECK_LONGER_VERBS entries never seen: {', '.join(unseen_fast_check)}\n")
+
+        out.write("\n[verbs]\ncount\tshare\tcategories\tverb\n")
+        for verb, count in verbs.most_common():
+            verb_categories = ",".join(sorted(categories.get(verb, ()))) or ("tunneling" if verb in SIGNATURE_WEIGHTS else "-")
+            out.write(f"{count}\t{_percentage(count, total_verbs)}\t{verb_categories}\t{verb}\n")
+
+        out.write(f"\n[commands] (top {top_commands})\ncount\tverb\tcommand\n")
+        for command, count in commands.most_common(top_commands):
+            out.write(f"{count}\t{ZDR.get_verb_of_command(command)}\t{command}\n")
+
+def _get_categories_by_verb() -> dict[str, set[str]]:
+    categories = {}
+    for sig_name, sig_commands in _SIGNATURES.items():
+        for verb in sig_commands:
+            categories.setdefault(verb, set()).add(sig_name)
+    return categories
+
+def _percentage(part: int, total: int) -> str:
+    return f"{100 * part / total:.2f}%" if total else "0.00%"
+
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    mine_commands(HoneyClusterPaths(Path("C:\\Users\\Sveva\\Documents\\GitHub\\zenodo_dataset")))
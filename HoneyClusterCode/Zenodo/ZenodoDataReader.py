@@ -1,19 +1,22 @@
 
 import re
-from datetime import datetime
-from typing import Tuple
+from datetime import datetime, date, timezone
+from typing import Tuple, Callable
+
+import numpy as np
 
 from MachineLearning.command_vocabularies import get_fast_check_set, TLS_VERSIONS_MAP, HTTP_VERBS_MAP, TLS_NOT_KNOWN
 from Zenodo.Zenodo_keys import Status, Event, Useful_Cowrie_Attr, Cleaned_Attr
+from Main.BoundedCache import BoundedCache
 """
 /////////////////////////////////////////////////ALWAYS_USEFUL///////////////////////////////////////////////////////
 """
 
 def get_status(event_id: str) -> int:
-    for e in Event:
-        if event_id == e.value:
-            return Status[e.name].value
-    return Status.IGNORED.value
+    dispatch = EVENT_DISPATCH.get(event_id)
+    if dispatch is None:
+        return Status.IGNORED.value
+    return dispatch[0]
 
 def status_is_interesting(status: int) -> bool :
     return status != Status.IGNORED.value
@@ -28,6 +31,58 @@ def get_datetime(timestamp: str) -> datetime | None:
     except ValueError:
         return None
 
+"""
+    TIMESTAMP COME EPOCH IN MICROSECONDI (int)
+    cowrie usa sempre lo stesso formato: "2019-05-18T00:00:16.582846Z". Lo leggiamo a pezzi fissi,
+    la parte della data viene convertita una volta sola per giorno. Altri formati passano da get_datetime
+"""
+US_PER_SECOND = 1_000_000
+EPOCH_US_MISSING = np.iinfo(np.int64).min # timestamp mancante o illeggibile negli array int64 (è il NaT di datetime64[us])
+_US_PER_DAY = 86_400 * US_PER_SECOND
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_day_start_us_cache: dict[str, int] = {}
+
+def get_epoch_us(timestamp: str) -> int | None:
+    if not timestamp:
+        return None
+    try:
+        if len(timestamp) >= 20 and timestamp[10] == "T" and timestamp[-1] == "Z" and timestamp[13] == ":" and timestamp[16] == ":":
+            day = timestamp[:10]
+            day_start = _day_start_us_cache.get(day)
+            if day_start is None:
+                day_start = (date.fromisoformat(day).toordinal() - _EPOCH_ORDINAL) * _US_PER_DAY
+                _day_start_us_cache[day] = day_start
+            seconds = int(timestamp[11:13]) * 3600 + int(timestamp[14:16]) * 60 + int(timestamp[17:19])
+            fraction = timestamp[20:-1] if timestamp[19] == "." else ""
+            micros = int(fraction[:6].ljust(6, "0")) if fraction else 0
+            return day_start + seconds * US_PER_SECOND + micros
+    except ValueError:
+        pass
+    return _datetime_to_epoch_us(get_datetime(timestamp))
+
+def get_epoch_us_batch(timestamps: list[str]) -> np.ndarray:
+    """ conversione vettoriale con datetime64 di NumPy: int64 in microsecondi, i timestamp mancanti diventano NaT (EPOCH_US_MISSING).
+        Se NumPy non riesce a leggerne qualcuno, il blocco viene convertito uno per uno con get_epoch_us (illeggibili -> EPOCH_US_MISSING) """
+    naive = ["NaT" if not t else _strip_utc_suffix(t) for t in timestamps] # il tempo di zenodo è sempre UTC
+    try:
+        return np.array(naive, dtype="datetime64[us]").astype(np.int64)
+    except ValueError:
+        epochs = (get_epoch_us(t) for t in timestamps)
+        return np.fromiter((EPOCH_US_MISSING if epoch is None else epoch for epoch in epochs), dtype=np.int64, count=len(timestamps))
+
+def _strip_utc_suffix(timestamp: str) -> str:
+    if timestamp.endswith("Z"):
+        return timestamp[:-1]
+    return timestamp.removesuffix("+00:00")
+
+def _datetime_to_epoch_us(dt: datetime | None) -> int | None:
+    if dt is None:
+        return None
+    if dt.tzinfo is None: # il timestamp in zenodo è universale
+        dt = dt.replace(tzinfo=timezone.utc)
+    delta = dt - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return (delta.days * 86_400 + delta.seconds) * US_PER_SECOND + delta.microseconds
+
 def get_interesting_data_by_status(status: int, event: dict) -> dict | None:
     if is_login(status):
         return get_login_data(event)
@@ -106,7 +161,7 @@ def get_tcpip_data(event_dict: dict):
     # Inizializziamo solo ciò che troviamo
     data_extracted = {}
     if lines:
-        data_extracted[Cleaned_Attr.MSG.value] = clean_tcip_message(lines[0])
+        data_extracted[Cleaned_Attr.MSG.value] = TCPIP_MESSAGE_CACHE.get_or_compute(lines[0], clean_tcip_message)
 
     return data_extracted
 
@@ -144,9 +199,26 @@ def is_command(status: int) -> bool:
 def is_only_command(status: int) -> bool:
     return status < 0 and status != Status.TCPIP_DATA.value
 
+"""
+    CACHE DEI COMANDI (vedi Main.BoundedCache): una per processo, quindi una per worker
+"""
+# messaggio grezzo -> comandi separati
+COMMAND_CACHE = BoundedCache()
+# prima riga del payload tcp-ip -> etichetta del protocollo
+TCPIP_MESSAGE_CACHE = BoundedCache()
+# comandi separati di un evento -> verbi (solo con VERB_TRIE, gli altri matcher non vengono memorizzati)
+VERBS_CACHE = BoundedCache()
+
+def get_command_caches_summary() -> str:
+    return (f"command cache: {COMMAND_CACHE.summary()} | tcp-ip cache: {TCPIP_MESSAGE_CACHE.summary()}"
+            f" | verbs cache: {VERBS_CACHE.summary()}")
+
 def clean_command(message: str) -> list[str]:
+    return list(COMMAND_CACHE.get_or_compute(message, _clean_command))
+
+def _clean_command(message: str) -> tuple[str, ...]:
     cmd_isolated = _isolate_command(message)
-    return _get_multiple_commands(cmd_isolated)
+    return tuple(_get_multiple_commands(cmd_isolated))
 
 def _isolate_command(message: str) -> str:
     s = message.strip()
@@ -167,18 +239,112 @@ def get_command_data(event_dict: dict)-> dict | None:
     }
 
 
-def get_verb_of_command(cmd: str = None, fast_check_set: set[str] = None) -> str: # prendiamo il verbo del comando ovvero : uname -a -> uname
+"""
+//////////////////////////////////////////////////DISPATCH EVENTID -> STATUS, EXTRACTOR/////////////////////////////
+"""
+EventExtractor = Callable[[dict], dict]
+
+def _build_extractor(status: int, specific_data: Callable[[dict], dict | None] | None) -> EventExtractor:
+    """ costruisce la funzione che trasforma l'evento grezzo in evento pulito, già specializzata sullo status """
+    status_key = Cleaned_Attr.STATUS.value
+    time_key = Cleaned_Attr.TIME.value
+    cowrie_time_key = Useful_Cowrie_Attr.TIME.value
+
+    if specific_data is None:
+        def extractor(event: dict) -> dict:
+            return {status_key: status, time_key: event.get(cowrie_time_key)}
+    else:
+        def extractor(event: dict) -> dict:
+            cleaned = {status_key: status, time_key: event.get(cowrie_time_key)}
+            data = specific_data(event)
+            if data:
+                cleaned.update(data)
+            return cleaned
+    return extractor
+
+def _specific_data_of(status: int) -> Callable[[dict], dict | None] | None: # stessa scelta di get_interesting_data_by_status, fatta una volta sola
+    if is_login(status):
+        return get_login_data
+    if is_only_command(status):
+        return get_command_data
+    if is_tunneling_data(status):
+        return get_tcpip_data
+    return None
+
+def _build_event_dispatch() -> dict[str, tuple[int, EventExtractor]]:
+    dispatch = {}
+    for e in Event:
+        status = Status[e.name].value
+        if status_is_interesting(status):
+            dispatch[e.value] = (status, _build_extractor(status, _specific_data_of(status)))
+    return dispatch
+
+# eventid -> (status, extractor). Gli eventid non presenti sono da ignorare
+EVENT_DISPATCH: dict[str, tuple[int, EventExtractor]] = _build_event_dispatch()
+
+
+"""
+    VERBI LUNGHI COME TRIE: un solo passaggio sui caratteri del comando invece di uno startswith per ogni verbo lungo
+"""
+
+class VerbTrie:
+    """ prefisso più lungo tra i verbi dati: stesso risultato dello startswith sulla lista ordinata per lunghezza decrescente """
+    __slots__ = ("_root",)
+    _VERB = "" # chiave del nodo che chiude un verbo (non è mai un carattere)
+
+    def __init__(self, verbs):
+        self._root = {}
+        for verb in verbs:
+            node = self._root
+            for ch in verb:
+                node = node.setdefault(ch, {})
+            node[self._VERB] = verb
+
+    def longest_prefix(self, text: str) -> str | None:
+        node = self._root
+        match = None
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            match = node.get(self._VERB, match)
+        return match
+
+# costruito una volta all'import: i worker lo ereditano (fork) o lo ricostruiscono una volta per processo (spawn)
+VERB_TRIE = VerbTrie(get_fast_check_set())
+
+def get_verb_of_command(cmd: str = None, fast_check_set: VerbTrie | list[str] = None) -> str: # prendiamo il verbo del comando ovvero : uname -a -> uname
+    """ fast_check_set: un VerbTrie (di default VERB_TRIE) oppure la lista dei verbi lunghi ordinata per lunghezza decrescente """
     # strip elimina gli spazi all'inizio e alla fine
     # split divide in sottostringhe secondo un delimitatore. Senza nulla dentro, divide per spazi
     if not cmd:
         return ""
     cmd_clean = cmd.strip()
     # 1. Controlliamo prima i "pezzi grossi"
-    if not fast_check_set:
-        fast_check_set = get_fast_check_set()
-    for long_verb in fast_check_set:
-        if cmd_clean.startswith(long_verb):
+    if fast_check_set is None:
+        fast_check_set = VERB_TRIE
+    if isinstance(fast_check_set, VerbTrie):
+        long_verb = fast_check_set.longest_prefix(cmd_clean)
+        if long_verb is not None:
             return long_verb
+    else:
+        for long_verb in fast_check_set:
+            if cmd_clean.startswith(long_verb):
+                return long_verb
 
     return cmd_clean.split()[0]
 
+def get_verbs_of_commands(commands: list[str], fast_check_set: VerbTrie | list[str] = None) -> tuple[str, ...]:
+    """ verbi non vuoti dei comandi di un evento, nello stesso ordine """
+    if fast_check_set is None or fast_check_set is VERB_TRIE:
+        return VERBS_CACHE.get_or_compute(tuple(commands), _get_verbs_of_commands)
+    return _get_verbs_of_commands(commands, fast_check_set)
+
+def _get_verbs_of_commands(commands, fast_check_set: VerbTrie | list[str] = None) -> tuple[str, ...]:
+    verbs = []
+    for command in commands:
+        verb = get_verb_of_command(command, fast_check_set)
+        if verb:
+            verbs.append(verb)
+    return tuple(verbs)
+
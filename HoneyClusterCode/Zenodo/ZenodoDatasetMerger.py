@@ -0,0 +1,380 @@
+import json
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from Main.RunManifest import atomic_output, file_sha256
+from MachineLearning.HoneyClusterSchema import apply_schema, write_parquet, PARQUET_COMPRESSION, ROW_GROUP_ROWS, PROCESSED_FEATURE_DTYPE
+
+"""
+DATASET COMPLETO OUT-OF-CORE
+
+    i file processati vengono letti a blocchi di righe (batch): ogni batch viene arrotondato, deduplicato
+    e scritto subito come row group del dataset completo. In memoria restano solo il batch corrente
+    e l'indice degli hash delle righe già scritte (RowHashIndex), che oltre una certa dimensione va su disco.
+    Il risultato è lo stesso di pd.concat + round(2) + drop_duplicates: stesse righe, stesso ordine, vince la prima occorrenza
+"""
+
+DEFAULT_BATCH_ROWS = 65_536
+ROUND_DECIMALS = 2
+_DROPPED_COLUMNS = ['session_id']
+
+
+def merge_processed_parquets(parquet_files: list[Path], output: Path, batch_rows: int = DEFAULT_BATCH_ROWS,
+                             max_buffered_hashes: int = None) -> int:
+    """ scrive in output le righe distinte dei file processati. Restituisce il numero di righe scritte """
+    if max_buffered_hashes is None:
+        max_buffered_hashes = DEFAULT_MAX_BUFFERED_HASHES
+
+    with tempfile.TemporaryDirectory(prefix="row_hashes_", dir=Path(output).parent) as spill_folder:
+        index = RowHashIndex(Path(spill_folder), max_buffered_hashes)
+        try:
+            with atomic_output(output) as tmp_output:
+                rows_written = _write_distinct_rows(iter_processed_batches(parquet_files, batch_rows), index, tmp_output)
+                if not rows_written: # nessuna riga: come prima, il dataset completo esiste ma è vuoto
+                    write_parquet(pd.DataFrame(), tmp_output)
+                return rows_written
+        finally:
+            index.close() # le run su disco vanno chiuse prima di cancellare la cartella (windows)
+
+def iter_processed_batches(parquet_files: list[Path], batch_rows: int = DEFAULT_BATCH_ROWS, skip_unreadable: bool = True):
+    """ batch di righe già arrotondate (a precisione piena) e senza le colonne da scartare, file dopo file """
+    for parquet_file in parquet_files:
+        try:
+            batches = pq.ParquetFile(parquet_file).iter_batches(batch_size=batch_rows)
+            for batch in batches:
+                df = batch.to_pandas()
+                df.drop(columns=_DROPPED_COLUMNS, inplace=True, errors='ignore')
+                yield apply_schema(df, PROCESSED_FEATURE_DTYPE).round(ROUND_DECIMALS)
+        except (OSError, pa.ArrowException) as e:
+            if not skip_unreadable:
+                raise
+            logging.warning(f"Errore di lettura {Path(parquet_file).name}: {e}")
+
+def drop_seen_rows(df: pd.DataFrame, index: "RowHashIndex") -> pd.DataFrame:
+    """ tiene solo le righe mai viste (né nel batch né nell'indice) e le aggiunge all'indice """
+    hashes = row_hashes(df)
+    first_in_batch = ~pd.Series(hashes, copy=False).duplicated().to_numpy()
+    new_rows = first_in_batch & ~index.contains(hashes)
+    index.add(hashes[new_rows])
+    return df[new_rows]
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """ hash a 64 bit di ogni riga. -0.0 (prodotto da round) e 0.0 sono la stessa riga anche per drop_duplicates """
+    return pd.util.hash_pandas_object(df + 0.0, index=False).to_numpy()
+
+
+"""
+    INDICE DEGLI HASH DELLE RIGHE
+    gli hash nuovi stanno in un set in memoria; quando è pieno diventa una run ordinata su disco (.npy, letta in memmap).
+    Le run di dimensione simile vengono fuse (merge di array ordinati) così il numero di run resta logaritmico:
+    è un external sort degli hash fatto un pezzo alla volta.
+    La ricerca nelle run è una searchsorted vettoriale per batch
+"""
+
+DEFAULT_MAX_BUFFERED_HASHES = 2_000_000 # ~150 MB di set python
+DEFAULT_MAX_RUN_HASHES = 64 * 1024 * 1024 # 512 MB: run più grandi non vengono più fuse (la fusione le carica in memoria)
+
+
+class RowHashIndex:
+    """ run_names: run già presenti in folder da riaprire (indice persistito).
+        keep_replaced_runs = True: le run sostituite da una fusione restano su disco finché non si chiama remove_replaced_runs,
+        così chi ha salvato l'elenco precedente delle run resta consistente fino al proprio commit """
+    def __init__(self, folder: Path, max_buffered_hashes: int = DEFAULT_MAX_BUFFERED_HASHES, max_run_hashes: int = DEFAULT_MAX_RUN_HASHES,
+                 run_names: list[str] = None, keep_replaced_runs: bool = False):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_buffered_hashes = max_buffered_hashes
+        self.max_run_hashes = max_run_hashes
+        self.keep_replaced_runs = keep_replaced_runs
+        self._buffer = set()
+        self._runs: list[np.ndarray] = [] # memmap ordinati, dal più vecchio (e grande) al più recente
+        self._run_paths: list[Path] = []
+        self._replaced_run_paths: list[Path] = []
+        self._next_run_id = 1 + max((_run_id(run_path) for run_path in self.folder.glob("run_*.npy")), default=-1)
+        for run_name in run_names or []:
+            self._run_paths.append(self.folder / run_name)
+            self._runs.append(np.load(self.folder / run_name, mmap_mode='r'))
+
+    @property
+    def run_names(self) -> list[str]:
+        return [run_path.name for run_path in self._run_paths]
+
+    def __len__(self) -> int:
+        return len(self._buffer) + sum(len(run) for run in self._runs)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        buffer = self._buffer
+        found = np.fromiter((h in buffer for h in hashes.tolist()), dtype=bool, count=len(hashes))
+        for run in self._runs:
+            positions = np.searchsorted(run, hashes)
+            np.minimum(positions, len(run) - 1, out=positions)
+            found |= run[positions] == hashes
+        return found
+
+    def add(self, hashes: np.ndarray):
+        """ hashes non devono essere già presenti (vedi contains) """
+        self._buffer.update(hashes.tolist())
+        if len(self._buffer) >= self.max_buffered_hashes:
+            self.flush()
+
+    def flush(self):
+        """ porta su disco gli hash in memoria """
+        if not self._buffer:
+            return
+        run = np.fromiter(self._buffer, dtype=np.uint64, count=len(self._buffer))
+        run.sort()
+        self._buffer.clear()
+        self._append_run(run)
+        self._compact()
+
+    def close(self):
+        self._runs.clear() # rilascia i memmap
+
+    def remove_replaced_runs(self):
+        for run_path in self._replaced_run_paths:
+            run_path.unlink(missing_ok=True)
+        self._replaced_run_paths.clear()
+
+    def _append_run(self, run: np.ndarray):
+        run_path = self.folder / f"run_{self._next_run_id:06d}.npy"
+        self._next_run_id += 1
+        np.save(run_path, run)
+        self._runs.append(np.load(run_path, mmap_mode='r'))
+        self._run_paths.append(run_path)
+
+    def _compact(self):
+        while (len(self._runs) >= 2 and len(self._runs[-2]) <= 2 * len(self._runs[-1])
+               and len(self._runs[-2]) + len(self._runs[-1]) <= self.max_run_hashes):
+            merged = np.concatenate((self._runs[-2], self._runs[-1])) # le run sono disgiunte: basta riordinare
+            merged.sort(kind='stable')
+            del self._runs[-2:]
+            self._replaced_run_paths.extend(self._run_paths[-2:])
+            del self._run_paths[-2:]
+            if not self.keep_replaced_runs:
+                self.remove_replaced_runs()
+            self._append_run(merged)
+
+
+"""
+DATASET COMPLETO INCREMENTALE
+
+    complete_dataset.parquet diventa una cartella (come fa spark): un part-<giorno>.parquet per ogni file processato unito.
+    In state_folder ci sono l'indice degli hash delle righe (row_hashes/) e merge_state.json, che è il punto di commit:
+    file uniti con la loro impronta, part prodotta e run dell'indice valide. Quello che non è in merge_state.json
+    (part o run rimaste da un'esecuzione interrotta) viene cancellato alla successiva.
+    Aggiungere un giorno costa quanto quel giorno: si deduplica contro l'indice persistito senza rileggere la storia.
+    Le righe di un file già unito non si possono togliere: se il file cambia o sparisce si ricostruisce tutto.
+"""
+
+# da incrementare quando cambia il contenuto delle part (arrotondamento, hash delle righe, schema)
+_MERGE_FORMAT_VERSION = 2
+_MERGE_STATE_FILE = "merge_state.json"
+_INDEX_FOLDER = "row_hashes"
+_PART_PREFIX = "part-"
+
+
+def append_processed_parquets(parquet_files: list[Path], dataset_folder: Path, state_folder: Path, batch_rows: int = DEFAULT_BATCH_ROWS,
+                              max_buffered_hashes: int = None) -> int:
+    """ unisce al dataset incrementale solo i file processati non ancora uniti. Restituisce il numero di righe aggiunte """
+    if max_buffered_hashes is None:
+        max_buffered_hashes = DEFAULT_MAX_BUFFERED_HASHES
+    dataset_folder, state_folder = Path(dataset_folder), Path(state_folder)
+
+    state = _load_merge_state(state_folder)
+    if not _is_merge_state_reusable(state, parquet_files, dataset_folder):
+        _reset_incremental_dataset(dataset_folder, state_folder)
+        state = _empty_merge_state()
+    dataset_folder.mkdir(parents=True, exist_ok=True)
+    _discard_uncommitted(state, dataset_folder, state_folder / _INDEX_FOLDER)
+
+    index = RowHashIndex(state_folder / _INDEX_FOLDER, max_buffered_hashes, run_names=state["runs"], keep_replaced_runs=True)
+    rows_added = 0
+    try:
+        for parquet_file in parquet_files:
+            if parquet_file.name in state["files"]:
+                continue
+            part = dataset_folder / f"{_PART_PREFIX}{parquet_file.stem}.parquet"
+            try:
+                with atomic_output(part) as tmp_part:
+                    rows = _write_distinct_rows(iter_processed_batches([parquet_file], batch_rows, skip_unreadable=False), index, tmp_part)
+                    if not rows:
+                        tmp_part.touch() # nessuna riga nuova: la part vuota viene eliminata subito dopo il rename
+            except (OSError, pa.ArrowException) as e:
+                # gli hash del file sono già nell'indice in memoria: ci fermiamo, il file verrà unito alla prossima esecuzione
+                logging.error(f"Errore di lettura {parquet_file.name}, merge interrupted: {e}")
+                break
+            if not rows:
+                part.unlink()
+            index.flush()
+
+            # commit: da qui in poi il file risulta unito
+            state["files"][parquet_file.name] = {**_file_fingerprint(parquet_file), "part": part.name if rows else None, "rows": rows}
+            state["runs"] = index.run_names
+            _save_merge_state(state, state_folder)
+            index.remove_replaced_runs()
+
+            rows_added += rows
+            logging.info(f"merged {parquet_file.name}: {rows} new distinct sessions")
+    finally:
+        index.close()
+    return rows_added
+
+def get_complete_dataset_files(complete_dataset: Path) -> list[Path]:
+    """ i file parquet del dataset completo: sé stesso, oppure le part in ordine se è una cartella (modalità incrementale) """
+    complete_dataset = Path(complete_dataset)
+    if complete_dataset.is_dir():
+        return sorted(complete_dataset.glob(f"{_PART_PREFIX}*.parquet"))
+    return [complete_dataset] if complete_dataset.exists() else []
+
+def count_complete_dataset_rows(complete_dataset: Path) -> int:
+    """ righe del dataset completo lette dai metadati dei parquet, senza leggere i dati """
+    return sum(pq.ParquetFile(part).metadata.num_rows for part in get_complete_dataset_files(complete_dataset))
+
+def iter_complete_dataset_batches(complete_dataset: Path, batch_rows: int = DEFAULT_BATCH_ROWS, columns: list[str] = None):
+    """ il dataset completo (file unico o part) a blocchi di batch_rows righe con lo schema applicato; solo l'ultimo può essere più corto.
+        I blocchi attraversano i confini tra le part, così anche i giorni con poche sessioni danno blocchi pieni """
+    pending, pending_rows = [], 0
+    for part in get_complete_dataset_files(complete_dataset):
+        for batch in pq.ParquetFile(part).iter_batches(batch_size=batch_rows, columns=columns):
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            while pending_rows >= batch_rows:
+                table = pa.Table.from_batches(pending)
+                yield apply_schema(table.slice(0, batch_rows).to_pandas())
+                rest = table.slice(batch_rows)
+                pending, pending_rows = rest.to_batches(), rest.num_rows
+    if pending_rows:
+        yield apply_schema(pa.Table.from_batches(pending).to_pandas())
+
+def iter_parquet_batches(parquet_file: Path, batch_rows: int = DEFAULT_BATCH_ROWS, columns: list[str] = None):
+    """ un solo file parquet a blocchi di batch_rows righe con lo schema applicato, nell'ordine del file """
+    for batch in pq.ParquetFile(parquet_file).iter_batches(batch_size=batch_rows, columns=columns):
+        yield apply_schema(batch.to_pandas())
+
+def read_incremental_dataset(dataset_folder: Path) -> pd.DataFrame:
+    parts = get_complete_dataset_files(dataset_folder)
+    if not parts:
+        return pd.DataFrame()
+    return apply_schema(pq.read_table(parts).to_pandas())
+
+def remove_incremental_dataset(dataset_folder: Path, state_folder: Path):
+    """ da chiamare prima di scrivere il dataset completo come file unico """
+    if Path(dataset_folder).is_dir():
+        shutil.rmtree(dataset_folder)
+    shutil.rmtree(state_folder, ignore_errors=True)
+
+
+"""
+    PRIVATE FUNCTION FOR USAGE PURPOSE
+"""
+
+def _empty_merge_state() -> dict:
+    return {"version": _MERGE_FORMAT_VERSION, "files": {}, "runs": []}
+
+def _load_merge_state(state_folder: Path) -> dict | None:
+    state_file = state_folder / _MERGE_STATE_FILE
+    if not state_file.exists():
+        return None
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"unreadable {state_file.name}, the complete dataset will be rebuilt: {e}")
+        return None
+
+def _save_merge_state(state: dict, state_folder: Path):
+    with atomic_output(state_folder / _MERGE_STATE_FILE) as tmp:
+        with open(tmp, "w", encoding="utf-8") as out:
+            json.dump(state, out, indent=1, sort_keys=True)
+
+def _is_merge_state_reusable(state: dict | None, parquet_files: list[Path], dataset_folder: Path) -> bool:
+    if state is None or not dataset_folder.is_dir():
+        return False
+    if state.get("version") != _MERGE_FORMAT_VERSION:
+        logging.info("complete dataset format changed, rebuilding it")
+        return False
+    current = {parquet_file.name: parquet_file for parquet_file in parquet_files}
+    for name, entry in state["files"].items():
+        parquet_file = current.get(name)
+        if parquet_file is None:
+            logging.info(f"{name} is no longer among the processed files, rebuilding the complete dataset")
+            return False
+        if not _same_file(parquet_file, entry):
+            logging.info(f"{name} changed after being merged, rebuilding the complete dataset")
+            return False
+        if entry["part"] and not (dataset_folder / entry["part"]).exists():
+            logging.info(f"{entry['part']} is missing, rebuilding the complete dataset")
+            return False
+    return True
+
+def _reset_incremental_dataset(dataset_folder: Path, state_folder: Path):
+    if dataset_folder.is_dir():
+        shutil.rmtree(dataset_folder)
+    elif dataset_folder.exists(): # dataset completo scritto come file unico
+        dataset_folder.unlink()
+    shutil.rmtree(state_folder, ignore_errors=True)
+    state_folder.mkdir(parents=True, exist_ok=True)
+
+def _discard_uncommitted(state: dict, dataset_folder: Path, index_folder: Path):
+    committed_parts = {entry["part"] for entry in state["files"].values()}
+    for part in dataset_folder.iterdir():
+        if part.name not in committed_parts:
+            part.unlink()
+    committed_runs = set(state["runs"])
+    if index_folder.exists():
+        for run_path in index_folder.iterdir():
+            if run_path.name not in committed_runs:
+                run_path.unlink()
+
+def _file_fingerprint(path: Path) -> dict:
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(path)}
+
+def _same_file(path: Path, entry: dict) -> bool:
+    stat = path.stat()
+    if stat.st_size != entry["size"]:
+        return False
+    if stat.st_mtime_ns == entry["mtime_ns"]:
+        return True # file non toccato: evitiamo di rileggerlo
+    return file_sha256(path) == entry["sha256"]
+
+def _run_id(run_path: Path) -> int:
+    try:
+        return int(run_path.stem.removeprefix("run_"))
+    except ValueError:
+        return -1
+
+def _write_distinct_rows(batches, index: RowHashIndex, output: Path) -> int:
+    rows_written = 0
+    writer = None
+    pending, pending_rows = [], 0 # batch accumulati fino a un row group intero
+    try:
+        for df in batches:
+            df = drop_seen_rows(df, index)
+            if df.empty:
+                continue
+            table = pa.Table.from_pandas(apply_schema(df), preserve_index=False) # schema compatto solo dopo arrotondamento e deduplica
+            if writer is None:
+                writer = pq.ParquetWriter(output, table.schema, compression=PARQUET_COMPRESSION)
+            elif not table.schema.equals(writer.schema):
+                table = table.cast(writer.schema)
+            pending.append(table)
+            pending_rows += len(df)
+            rows_written += len(df)
+            if pending_rows >= ROW_GROUP_ROWS: # la memoria resta limitata a un row group
+                writer.write_table(pa.concat_tables(pending), row_group_size=ROW_GROUP_ROWS)
+                pending, pending_rows = [], 0
+        if pending:
+            writer.write_table(pa.concat_tables(pending), row_group_size=ROW_GROUP_ROWS)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return rows_written # 0: output non creato
@@ -0,0 +1,249 @@
+import json
+import logging
+import queue
+import threading
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+
+"""
+PULIZIA A PIPELINE
+
+    inflater (thread)  ->  coda blocchi  ->  parsing + cleaning (thread chiamante)  ->  coda batch  ->  writer (thread)
+
+    zlib e la lettura da disco rilasciano il GIL, quindi la decompressione del blocco successivo
+    avviene mentre il thread chiamante fa il parsing di quello corrente.
+    Le code sono limitate: la memoria usata resta costante qualunque sia la dimensione del file.
+"""
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024 # byte compressi letti per volta
+DEFAULT_MAX_QUEUED_BLOCKS = 8
+DEFAULT_BATCH_SIZE = 512 # sessioni serializzate e scritte insieme
+DEFAULT_MAX_QUEUED_BATCHES = 8
+
+_GZIP_WBITS = zlib.MAX_WBITS | 16
+_END = None # segnala la fine di una coda
+_POLL_SECONDS = 0.1
+
+
+@dataclass
+class PipelineStats:
+    # tempo effettivamente speso a lavorare da ogni stage (secondi)
+    inflate_busy: float = 0.0
+    parse_busy: float = 0.0
+    write_busy: float = 0.0
+    # tempo speso in attesa: inflate/parse bloccati su coda piena, parse/write bloccati su coda vuota
+    inflate_wait: float = 0.0
+    parse_wait: float = 0.0
+    write_wait: float = 0.0
+    # profondità delle code, campionata a ogni inserimento
+    max_block_queue_depth: int = 0
+    block_queue_depth_sum: int = 0
+    max_batch_queue_depth: int = 0
+    batch_queue_depth_sum: int = 0
+    # volumi
+    blocks: int = 0
+    batches: int = 0
+    sessions: int = 0
+    compressed_bytes: int = 0
+    inflated_bytes: int = 0
+    wall_time: float = 0.0
+
+    @property
+    def mean_block_queue_depth(self) -> float:
+        return self.block_queue_depth_sum / self.blocks if self.blocks else 0.0
+
+    @property
+    def mean_batch_queue_depth(self) -> float:
+        return self.batch_queue_depth_sum / self.batches if self.batches else 0.0
+
+    def summary(self) -> str:
+        return (f"wall {self.wall_time:.2f}s | busy inflate {self.inflate_busy:.2f}s, parse {self.parse_busy:.2f}s, write {self.write_busy:.2f}s"
+                f" | wait inflate {self.inflate_wait:.2f}s, parse {self.parse_wait:.2f}s, write {self.write_wait:.2f}s"
+                f" | block queue max {self.max_block_queue_depth} mean {self.mean_block_queue_depth:.1f}"
+                f" | batch queue max {self.max_batch_queue_depth} mean {self.mean_batch_queue_depth:.1f}"
+                f" | {self.sessions} sessions, {self.compressed_bytes} -> {self.inflated_bytes} bytes")
+
+
+class _PipelineAborted(Exception):
+    """ un altro stage è fallito: chi è in attesa su una coda smette di aspettare """
+
+
+def clean_gz_pipelined(gz_path: Path, out, sessions_of, block_size: int = DEFAULT_BLOCK_SIZE, max_queued_blocks: int = DEFAULT_MAX_QUEUED_BLOCKS,
+                       batch_size: int = DEFAULT_BATCH_SIZE, max_queued_batches: int = DEFAULT_MAX_QUEUED_BATCHES) -> PipelineStats:
+    """ scrive su out (aperto in testo) la lista JSON delle sessioni pulite di gz_path.
+        sessions_of: funzione che, dato un file binario, restituisce le sessioni pulite (es. ZenodoCleaner.iter_cleaned_sessions)
+        Lo stesso formato di ZenodoCleaner.write_cleaned_sessions. Solleva l'eccezione del primo stage fallito """
+    stats = PipelineStats()
+    stop = threading.Event()
+    errors = []
+    blocks = queue.Queue(max_queued_blocks)
+    batches = queue.Queue(max_queued_batches)
+
+    inflater = threading.Thread(target=_inflate_stage, args=(gz_path, blocks, block_size, stop, stats, errors), name="gz-inflater", daemon=True)
+    writer = threading.Thread(target=_write_stage, args=(out, batches, stop, stats, errors), name="json-writer", daemon=True)
+
+    start = perf_counter()
+    inflater.start()
+    writer.start()
+    try:
+        reader = _BlockReader(blocks, stop, stats)
+        batch = []
+        for session_data in sessions_of(reader):
+            batch.append(session_data)
+            if len(batch) >= batch_size:
+                _put_batch(batches, batch, stop, stats)
+                batch = []
+        if batch:
+            _put_batch(batches, batch, stop, stats)
+        stats.parse_wait += _put(batches, _END, stop)
+        writer.join()
+    except BaseException as e:
+        if not isinstance(e, _PipelineAborted):
+            errors.append(e)
+    finally:
+        stop.set() # libera l'inflater anche se il parser ha finito senza leggere la fine dei blocchi
+        inflater.join()
+        writer.join()
+        stats.wall_time = perf_counter() - start
+        stats.parse_busy = max(stats.wall_time - stats.parse_wait, 0.0)
+
+    if errors:
+        raise errors[0]
+    return stats
+
+
+"""
+    STAGES
+"""
+
+def _inflate_stage(gz_path: Path, blocks: queue.Queue, block_size: int, stop: threading.Event, stats: PipelineStats, errors: list):
+    try:
+        decompressor = zlib.decompressobj(_GZIP_WBITS)
+        with open(gz_path, "rb") as raw:
+            while True:
+                t = perf_counter()
+                compressed = raw.read(block_size)
+                if not compressed:
+                    break
+                data = decompressor.decompress(compressed)
+                while decompressor.eof and decompressor.unused_data: # gz con più membri concatenati
+                    remaining = decompressor.unused_data
+                    decompressor = zlib.decompressobj(_GZIP_WBITS)
+                    data += decompressor.decompress(remaining)
+                stats.inflate_busy += perf_counter() - t
+                stats.compressed_bytes += len(compressed)
+
+                if data:
+                    stats.inflated_bytes += len(data)
+                    stats.blocks += 1
+                    stats.inflate_wait += _put(blocks, data, stop)
+                    depth = blocks.qsize()
+                    stats.block_queue_depth_sum += depth
+                    stats.max_block_queue_depth = max(stats.max_block_queue_depth, depth)
+
+        if not decompressor.eof:
+            raise EOFError(f"{gz_path.name} ended before the end-of-stream marker was reached")
+        stats.inflate_wait += _put(blocks, _END, stop)
+    except _PipelineAborted:
+        pass
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+
+def _write_stage(out, batches: queue.Queue, stop: threading.Event, stats: PipelineStats, errors: list):
+    try:
+        out.write('[\n')  # inizio lista JSON
+        first_session = True
+        while True:
+            batch, waited = _get(batches, stop)
+            stats.write_wait += waited
+            if batch is _END:
+                break
+
+            t = perf_counter()
+            serialized = ",\n".join(json.dumps(session_data, ensure_ascii=False) for session_data in batch)
+            if not first_session:
+                out.write(",\n")
+            out.write(serialized)
+            first_session = False
+            stats.write_busy += perf_counter() - t
+        out.write('\n]')  # chiusura lista JSON
+    except _PipelineAborted:
+        pass
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+
+
+"""
+    PRIVATE FUNCTION FOR USAGE PURPOSE
+"""
+
+class _BlockReader:
+    """ file binario in sola lettura sopra la coda dei blocchi decompressi, è quello che legge ijson """
+    def __init__(self, blocks: queue.Queue, stop: threading.Event, stats: PipelineStats):
+        self._blocks = blocks
+        self._stop = stop
+        self._stats = stats
+        self._block = b""
+        self._offset = 0
+        self._finished = False
+
+    def read(self, size: int = -1) -> bytes:
+        if size == 0:
+            return b""
+        if self._offset >= len(self._block):
+            if self._finished:
+                return b""
+            block, waited = _get(self._blocks, self._stop)
+            self._stats.parse_wait += waited
+            if block is _END:
+                self._finished = True
+                return b""
+            self._block, self._offset = block, 0
+
+        if size < 0:
+            end = len(self._block)
+        else:
+            end = min(self._offset + size, len(self._block))
+        data = self._block[self._offset:end]
+        self._offset = end
+        return data
+
+def _put_batch(batches: queue.Queue, batch: list, stop: threading.Event, stats: PipelineStats):
+    stats.parse_wait += _put(batches, batch, stop)
+    stats.batches += 1
+    stats.sessions += len(batch)
+    depth = batches.qsize()
+    stats.batch_queue_depth_sum += depth
+    stats.max_batch_queue_depth = max(stats.max_batch_queue_depth, depth)
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> float:
+    """ inserisce item aspettando finché c'è posto, a meno che la pipeline non sia stata fermata. Restituisce il tempo atteso """
+    start = perf_counter()
+    while True:
+        if stop.is_set():
+            raise _PipelineAborted()
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return perf_counter() - start
+        except queue.Full:
+            continue
+
+def _get(q: queue.Queue, stop: threading.Event):
+    """ restituisce (elemento, tempo atteso) """
+    start = perf_counter()
+    while True:
+        if stop.is_set():
+            raise _PipelineAborted()
+        try:
+            item = q.get(timeout=_POLL_SECONDS)
+            return item, perf_counter() - start
+        except queue.Empty:
+            continue
+
+
+def log_pipeline_stats(name: str, stats: PipelineStats):
+    logging.info(f"{name} pipeline: {stats.summary()}")
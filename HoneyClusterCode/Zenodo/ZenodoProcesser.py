@@ -1,16 +1,24 @@
 from pathlib import Path
 
+import gzip
 import logging
 import os
-import ijson
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 
 import Zenodo.ZenodoDataReader as ZDR
 import MachineLearning.HoneyClusterData as HCD
+import MachineLearning.HoneyClusterBatch as HCB
+import MachineLearning.HoneyClusterSchema as HCS
 from Main.HoneyCluster import HoneyClusterPaths
-from Zenodo.ZenodoDataReader import Cleaned_Attr
+from Zenodo.ZenodoCleaner import IJSON_BACKEND, IJSON_USE_FLOAT, iter_cleaned_sessions, write_cleaned_sessions, get_cleaned_output_path
+from Main.RunManifest import RunManifest, atomic_output, CLEANING_STAGE, PROCESSING_STAGE
+from Main.DateWindow import DateWindow, select_files_in_window, get_day_of_gz_file
+from Main.FeatureProfiler import FeatureProfiler, NULL_PROFILER
+from Main.StageProgress import StageProgress, get_size_bytes, MERGE_STAGE
+from Zenodo.ZenodoDatasetMerger import merge_processed_parquets, append_processed_parquets, remove_incremental_dataset, read_incremental_dataset
 
-from MachineLearning.command_vocabularies import get_all_known_verbs, get_recon_exploit_flat, get_fast_check_set
+from MachineLearning.command_vocabularies import get_all_known_verbs, get_recon_exploit_flat
 
 """
 ///////////////////////////////////////////////////////////////////////////////////////////////OTTENIMENTO DATASET COMPLETO PER ML/////////////////////////////////////////////////////////////////////////////
@@ -20,11 +28,13 @@ def get_main_dataset_from_processed(cleaned: Path, processed: Path, complete_dat
 
         logging.basicConfig(level=logging.DEBUG)
         process_cleaned_dataset(cleaned, processed)
-        complete = _concat_parquets(processed, complete_dataset_output)
-        return complete
+        _concat_parquets(processed, complete_dataset_output)
+        return read_main_dataset(complete_dataset_output)
 
 def read_main_dataset(complete_dataset_output: Path) -> pd.DataFrame:
     try:
+        if complete_dataset_output.is_dir(): # dataset costruito in modalità incrementale
+            return read_incremental_dataset(complete_dataset_output)
         m_ds = _read_parquet(complete_dataset_output)
         return m_ds
     except FileNotFoundError:
@@ -57,41 +67,194 @@ json iniziale:
 """
 ////////////////////////////////////////////////////////////PROCESSING = CALCOLO VETTORI PER ML//////////////////////////////////////////////////////////////////////////////////////
 """
-def process_dataset(paths: HoneyClusterPaths):
-    process_cleaned_dataset(paths.cleaned_folder, paths.processed_folder)
-    _concat_parquets(paths.processed_folder, paths.complete_dataset_file)
-
-
-def process_cleaned_dataset(starting_path: Path, resulting_path : Path): # processa l' intero dataset cleaned
+def process_dataset(paths: HoneyClusterPaths, fused: bool = False, keep_cleaned: bool = False, workers: int = 1, incremental: bool = False, profile: bool = False):
+    """ fused = True: si parte direttamente dai gz originali, senza passare dai file cleaned (scritti solo con keep_cleaned)
+        workers > 1: ogni file viene processato in un processo separato
+        incremental = True: al dataset completo vengono aggiunti solo i giorni nuovi (vedi ZenodoDatasetMerger).
+            ATTENZIONE: complete_dataset.parquet diventa una cartella di part-<giorno>.parquet invece di un file unico
+            (leggerlo con read_main_dataset o get_complete_dataset_files); un'esecuzione non incrementale la cancella e riscrive il file unico
+        profile = True: per ogni file processato un report dei tempi per fase e per feature in artifacts/profiles (vedi Main.FeatureProfiler) """
+    manifest = RunManifest(paths.manifest_file)
+    profiles_folder = paths.profiles_folder if profile else None
+    if fused:
+        process_original_dataset(paths.original_folder, paths.processed_folder, paths.cleaned_folder if keep_cleaned else None, manifest=manifest, date_window=paths.date_window, workers=workers, profiles_folder=profiles_folder, reports_folder=paths.run_reports_folder)
+    else:
+        process_cleaned_dataset(paths.cleaned_folder, paths.processed_folder, manifest, paths.date_window, workers, profiles_folder, paths.run_reports_folder)
+
+    progress = StageProgress(MERGE_STAGE, 1, paths.run_reports_folder)
+    processed_bytes = sum(get_size_bytes(f) for f in select_files_in_window(paths.processed_folder.glob("*.parquet"), paths.date_window))
+    if incremental:
+        rows = _append_parquets(paths.processed_folder, paths.complete_dataset_file, paths.complete_dataset_state_folder, paths.date_window)
+    else:
+        remove_incremental_dataset(paths.complete_dataset_file, paths.complete_dataset_state_folder)
+        rows = _concat_parquets(paths.processed_folder, paths.complete_dataset_file, paths.date_window)
+    progress.step_done(paths.complete_dataset_file.name, rows, processed_bytes)
+    progress.finish()
+
+
+def process_cleaned_dataset(starting_path: Path, resulting_path : Path, manifest: RunManifest = None, date_window: DateWindow = None, workers: int = 1, profiles_folder: Path = None, reports_folder: Path = None) -> dict[str, str | None]: # processa l' intero dataset cleaned (o solo i giorni della finestra)
+    """ restituisce, per ogni file processato, None se è andato a buon fine oppure l'errore """
     if not starting_path.exists():
         print(f"Errore: La cartella {starting_path} non esiste.")
-        return
+        return {}
 
     resulting_path.mkdir(parents=True, exist_ok=True)
 
-    all_known_verbs = get_all_known_verbs()  # lo calcoliamo qui per efficienza (rifarlo per tutti i dati sarebbe un incubo
-    all_recon, all_exploit = get_recon_exploit_flat()
-
-    for json_file in starting_path.glob("*.json"):
+    jobs = []
+    for json_file in select_files_in_window(starting_path.glob("*.json"), date_window):
         parquet_output = resulting_path / json_file.with_suffix('.parquet').name
-        if os.path.exists(parquet_output):
+        if _is_already_processed(manifest, json_file, parquet_output):
             logging.info(f"skipping {parquet_output}.")
             continue
+        jobs.append((json_file, parquet_output, None, False, profiles_folder))
 
-        logging.info(f"Processing {json_file} ...")
-        try:
-            process_to_parquet(json_file, parquet_output, all_known_verbs, all_recon, all_exploit)
-            logging.info(f"Completed {json_file}")
-        except Exception as e:
-            logging.warning(f"Errore durante il processamento di {json_file.name}: {e}")
+    return _run_processing_jobs(jobs, workers, manifest, reports_folder)
 
 
-def process_to_parquet(json_file: Path, output_parquet: Path, all_known_verbs: set[str] = None, all_recon: set[str] = None, all_exploit: set[str] = None, fast_check: set[str] = None): # processa un singolo cleaned file
+def process_to_parquet(json_file: Path, output_parquet: Path, all_known_verbs: set[str] = None, all_recon: set[str] = None, all_exploit: set[str] = None, fast_check: ZDR.VerbTrie = None, profiler: FeatureProfiler = NULL_PROFILER) -> int: # processa un singolo cleaned file
+    """ restituisce il numero di sessioni scritte """
     if not os.path.exists(json_file):
         logging.warning(f"{json_file} does not exist")
+        return 0
+
+    with open(json_file, 'rb') as f:
+        sessions = profiler.timed_iter(IJSON_BACKEND.items(f, 'item', use_float=IJSON_USE_FLOAT), "json_parsing")
+        all_sessions_in_file = _sessions_to_features(sessions, all_known_verbs, all_recon, all_exploit, fast_check, profiler)
+
+    with profiler.phase("parquet_write"):
+        _write_processed_parquet(all_sessions_in_file, output_parquet)
+    return len(all_sessions_in_file)
+
+
+"""
+////////////////////////////////////////////////////////////FUSED = DAI GZ ORIGINALI DIRETTAMENTE AI VETTORI PER ML//////////////////////////////////////////////////////////////////////////////////////
+"""
+def process_original_dataset(originals_path: Path, resulting_path: Path, cleaned_path: Path = None, streaming: bool = False, manifest: RunManifest = None, date_window: DateWindow = None, workers: int = 1, profiles_folder: Path = None, reports_folder: Path = None) -> dict[str, str | None]: # pulisce e processa in un solo passaggio
+    if not originals_path.exists():
+        print(f"Errore: La cartella {originals_path} non esiste.")
+        return {}
+
+    resulting_path.mkdir(parents=True, exist_ok=True)
+
+    jobs = []
+    for gz_file in select_files_in_window(originals_path.glob("*.json.gz"), date_window):
+        log_date = get_day_of_gz_file(gz_file.name)
+        parquet_output = (resulting_path / log_date).with_suffix('.parquet')
+        cleaned_output = get_cleaned_output_path(gz_file, cleaned_path) if cleaned_path else None
+        if _is_already_processed(manifest, gz_file, parquet_output) and (cleaned_output is None or _is_already_cleaned(manifest, gz_file, cleaned_output)):
+            logging.info(f"skipping {parquet_output}.")
+            continue
+        jobs.append((gz_file, parquet_output, cleaned_output, streaming, profiles_folder))
+
+    return _run_processing_jobs(jobs, workers, manifest, reports_folder)
+
+
+def process_gz_to_parquet(gz_file: Path, output_parquet: Path, cleaned_output: Path = None, streaming: bool = False, all_known_verbs: set[str] = None, all_recon: set[str] = None, all_exploit: set[str] = None, fast_check: ZDR.VerbTrie = None, profiler: FeatureProfiler = NULL_PROFILER):
+    """ le sessioni vengono pulite in memoria e passate subito al calcolo delle feature.
+        Il file cleaned intermedio viene scritto solo se richiesto con cleaned_output.
+        Nel profilo la fase read_and_clean comprende decompressione, parsing e pulizia (e la scrittura del cleaned).
+        Restituisce il numero di sessioni scritte """
+    if not os.path.exists(gz_file):
+        logging.warning(f"{gz_file} does not exist")
+        return 0
+
+    with gzip.open(gz_file, "rb") as f:
+        sessions = iter_cleaned_sessions(f, streaming)
+
+        if cleaned_output is None:
+            all_sessions_in_file = _sessions_to_features(profiler.timed_iter(sessions, "read_and_clean"), all_known_verbs, all_recon, all_exploit, fast_check, profiler)
+        else:
+            with atomic_output(cleaned_output) as tmp_cleaned, open(tmp_cleaned, "w", encoding="utf-8") as out:
+                sessions = profiler.timed_iter(write_cleaned_sessions(sessions, out), "read_and_clean")
+                all_sessions_in_file = _sessions_to_features(sessions, all_known_verbs, all_recon, all_exploit, fast_check, profiler)
+
+    with profiler.phase("parquet_write"):
+        _write_processed_parquet(all_sessions_in_file, output_parquet)
+    return len(all_sessions_in_file)
+
+
+"""
+////////////////////////////////////////////////////////////ESECUZIONE DEI FILE (ANCHE IN PARALLELO)//////////////////////////////////////////////////////////////////////////////////////
+"""
+_worker_vocabularies = None # (all_known_verbs, all_recon, all_exploit, fast_check), costruiti una volta per processo
+
+def _get_worker_vocabularies() -> tuple:
+    global _worker_vocabularies
+    if _worker_vocabularies is None:
+        all_recon, all_exploit = get_recon_exploit_flat()
+        _worker_vocabularies = (get_all_known_verbs(), all_recon, all_exploit, ZDR.VERB_TRIE)
+    return _worker_vocabularies
+
+def _process_file(input_file: Path, parquet_output: Path, cleaned_output: Path | None, streaming: bool, profiles_folder: Path | None = None) -> int:
+    """ job eseguito dai worker: un cleaned json oppure, in modalità fused, un gz originale. Restituisce le sessioni scritte.
+        Con profiles_folder il report del profilo viene scritto dal worker stesso """
+    profiler = FeatureProfiler(input_file.name) if profiles_folder is not None else NULL_PROFILER
+    with profiler.phase("total"):
+        if input_file.name.endswith(".json.gz"):
+            sessions = process_gz_to_parquet(input_file, parquet_output, cleaned_output, streaming, *_get_worker_vocabularies(), profiler)
+        else:
+            sessions = process_to_parquet(input_file, parquet_output, *_get_worker_vocabularies(), profiler)
+    if profiles_folder is not None:
+        profiler.count("input_bytes", input_file.stat().st_size)
+        profiler.write_report(profiles_folder)
+    return sessions
+
+def _run_processing_jobs(jobs: list[tuple], workers: int, manifest: RunManifest | None, reports_folder: Path = None) -> dict[str, str | None]:
+    results = {}
+    progress = StageProgress(PROCESSING_STAGE, len(jobs), reports_folder)
+
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            logging.info(f"Processing {job[0]} ...")
+            sessions = 0
+            try:
+                sessions = _process_file(*job)
+                results[job[0].name] = None
+            except Exception as e:
+                results[job[0].name] = f"{type(e).__name__}: {e}"
+            _on_job_done(job, results[job[0].name], manifest)
+            progress.step_done(job[0].name, sessions, job[0].stat().st_size, results[job[0].name] is not None)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_process_file, *job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                sessions = 0
+                try:
+                    sessions = future.result()
+                    results[job[0].name] = None
+                except Exception as e:
+                    results[job[0].name] = f"{type(e).__name__}: {e}"
+                _on_job_done(job, results[job[0].name], manifest)
+                progress.step_done(job[0].name, sessions, job[0].stat().st_size, results[job[0].name] is not None)
+
+    _log_processing_summary(results)
+    progress.finish()
+    return results
+
+def _on_job_done(job: tuple, error: str | None, manifest: RunManifest | None):
+    input_file, parquet_output, cleaned_output = job[:3]
+    if error is not None:
+        logging.warning(f"Errore durante il processamento di {input_file.name}: {error}")
         return
+    if cleaned_output is not None:
+        _record_stage(manifest, CLEANING_STAGE, input_file, cleaned_output)
+    _record_stage(manifest, PROCESSING_STAGE, input_file, parquet_output)
+    logging.info(f"Completed {input_file}")
+
+def _log_processing_summary(results: dict[str, str | None]):
+    failed = {name: error for name, error in results.items() if error is not None}
+    logging.info(f"processing completed: {len(results) - len(failed)} succeeded, {len(failed)} failed")
+    for name, error in sorted(failed.items()):
+        logging.error(f"{name}: {error}")
 
-    all_sessions_in_file = []
+
+"""
+////////////////////////////////////////////////////////////CALCOLO DELLE FEATURE DI OGNI SESSIONE//////////////////////////////////////////////////////////////////////////////////////
+"""
+def _sessions_to_features(sessions, all_known_verbs: set[str] = None, all_recon: set[str] = None, all_exploit: set[str] = None, fast_check: ZDR.VerbTrie = None, profiler: FeatureProfiler = NULL_PROFILER) -> HCD.HoneyClusterDataColumns:
+    """ sessions: sessioni nel formato cleaned (da file o direttamente dal cleaner) """
+    all_sessions_in_file = HCD.HoneyClusterDataColumns()
 
     if not all_known_verbs:
         all_known_verbs = get_all_known_verbs()
@@ -100,65 +263,52 @@ def process_to_parquet(json_file: Path, output_parquet: Path, all_known_verbs: s
         all_recon, all_exploit = get_recon_exploit_flat()
 
     if not fast_check:
-        fast_check = get_fast_check_set()
-
-    with open(json_file, 'rb') as f:
-        for session_data in ijson.items(f, 'item'):
-            start_time = session_data[ZDR.Cleaned_Attr.START_TIME.value]
-            start_time = ZDR.get_datetime(start_time)
-            end_time = session_data[ZDR.Cleaned_Attr.END_TIME.value]
-            end_time = ZDR.get_datetime(end_time)
-            session_events = session_data[ZDR.Cleaned_Attr.EVENTS.value]
-            if not session_events: continue
-
-            statuses = [] # stati equivalenti al tipo di evento
-            timestamps = [] # tempi
-            commands = [] # tunneling e comandi ssh
-            united_commands = []
-            verbs = [] # inizio dei comandi (utile per analisi, contiene anche quelli del tunneling)
-            user_pass = []
-
-            for event in session_events:
-                status = event[Cleaned_Attr.STATUS.value]
-                statuses.append(status)
-                timestamp = event[Cleaned_Attr.TIME.value]
-                timestamps.append(ZDR.get_datetime(timestamp))
-
-                all_event_command = event.get(Cleaned_Attr.MSG.value, []) # now command is a list of strings
-                if all_event_command:
-                    united_command = "; ".join(all_event_command)
-                    united_commands.append(united_command)
-                    for command in all_event_command:
-                        commands.append(command)
-                        verb = ZDR.get_verb_of_command(command,fast_check)
-                        if verb:
-                            verbs.append(verb)
-
-                login_tuple = ZDR.get_tuple_login_data(event)
-                if login_tuple:
-                    user_pass.append(login_tuple)
-
-            # qui posso già calcolare i valori voluti in HoneyClusterData:
-            [sin,cos] = HCD.get_time_of_day_patterns(start_time)
-            data_obj = HCD.HoneyClusterData(
-                inter_command_timing=HCD.get_inter_command_timing(timestamps),
-                session_duration=HCD.get_session_duration(start_time, end_time),
-                time_of_day_patterns_sin= sin,
-                time_of_day_patterns_cos= cos,
-                unique_commands_ratio=HCD.get_unique_commands_ratio(verbs),
-                command_diversity_ratio=HCD.get_command_diversity_ratio(verbs, all_known_verbs),
-                tool_signatures=HCD.get_tool_signatures(statuses, verbs),
-                reconnaissance_vs_exploitation_ratio=HCD.get_reconnaissance_vs_exploitation_ratio(statuses, verbs, all_recon, all_exploit),
-                error_rate=HCD.get_error_rate(statuses),
-                command_correction_attempts=HCD.get_command_correction_attempts(statuses, united_commands, user_pass)
-            )
-
-            all_sessions_in_file.append(data_obj.__dict__)
-
-    if all_sessions_in_file:
-        df = pd.DataFrame(all_sessions_in_file)
-        df.to_parquet(output_parquet, engine='fastparquet', index=False)
+        fast_check = ZDR.VERB_TRIE
+
+    # eventi del file appiattiti in array, poi tutte le feature in blocco (vedi MachineLearning.HoneyClusterBatch)
+    arrays = HCB.SessionEventArrays(fast_check, profiler)
+    add_session = profiler.timed(arrays.add_session, "flattening") # il tempo di lettura delle sessioni resta nella sua fase
+    for session_data in sessions:
+        add_session(session_data)
+    profiler.count("sessions", len(arrays))
+    profiler.count("events", len(arrays.statuses))
+    profiler.count("verbs", len(arrays.verb_ids))
+    profiler.count("distinct_verbs", len(arrays.verb_names))
+
+    with profiler.phase("features"):
+        all_sessions_in_file.extend_numpy(HCB.get_batch_features(arrays, all_known_verbs, all_recon, all_exploit, profiler))
+
+    logging.info(ZDR.get_command_caches_summary()) # contatori cumulativi del processo
+    return all_sessions_in_file
+
+
+def _write_processed_parquet(all_sessions_in_file: HCD.HoneyClusterDataColumns, output_parquet: Path):
+    if len(all_sessions_in_file):
+        df = pd.DataFrame(all_sessions_in_file.to_numpy(), copy=False)
+        with atomic_output(output_parquet) as tmp_parquet:
+            HCS.write_parquet(df, tmp_parquet, HCS.PROCESSED_FEATURE_DTYPE)
         logging.info(f"Saved {len(df)} sessions to {output_parquet}")
+    elif output_parquet.exists(): # ricalcolo senza sessioni: il vecchio output non è più valido
+        output_parquet.unlink()
+
+
+def _is_already_processed(manifest: RunManifest | None, input_file: Path, parquet_output: Path) -> bool:
+    if manifest is None: # senza manifest ci fidiamo del file già presente
+        return os.path.exists(parquet_output)
+    return manifest.is_up_to_date(PROCESSING_STAGE, input_file, parquet_output)
+
+
+def _is_already_cleaned(manifest: RunManifest | None, gz_file: Path, cleaned_output: Path) -> bool:
+    if manifest is None:
+        return os.path.exists(cleaned_output)
+    return manifest.is_up_to_date(CLEANING_STAGE, gz_file, cleaned_output)
+
+
+def _record_stage(manifest: RunManifest | None, stage: str, input_file: Path, output: Path):
+    if manifest is None:
+        return
+    manifest.record(stage, input_file, output)
+    manifest.save()
 
 
 """
@@ -167,37 +317,39 @@ def process_to_parquet(json_file: Path, output_parquet: Path, all_known_verbs: s
 
 def _read_parquet(output_path: Path) -> pd.DataFrame:
     try:
-        datas = pd.read_parquet(output_path, engine='fastparquet')
+        datas = HCS.read_parquet(output_path)
         return datas
     except Exception as e:
         logging.warning(f"Errore di lettura {output_path.name}: {e}")
         return pd.DataFrame()
 
-def _concat_parquets(parquets_folder_path : Path, complete_dataset_output: Path) -> pd.DataFrame:
-    if not os.path.exists(parquets_folder_path):
-        logging.error(f"La cartella {parquets_folder_path} non existent")
-        return pd.DataFrame()
-
-    all_files = parquets_folder_path.glob('*.parquet')
-
-    if not all_files:
-        return pd.DataFrame()
-
-    df = pd.concat((pd.read_parquet(f) for f in all_files), ignore_index=True)
+def _concat_parquets(parquets_folder_path : Path, complete_dataset_output: Path, date_window: DateWindow = None) -> int:
+    """ dataset completo = righe distinte (arrotondate) di tutti i file processati, costruito a batch senza caricare tutto in memoria.
+        Restituisce il numero di righe scritte """
+    all_files = _processed_files_in_window(parquets_folder_path, date_window)
 
-    if 'session_id' in df.columns:
-        df.drop(columns=['session_id'], inplace=True)
+    if not all_files: # il dataset completo precedente (di un'altra finestra o esecuzione) non deve restare: il clustering lo userebbe
+        logging.warning(f"no processed files to merge, {complete_dataset_output.name} replaced by an empty dataset")
 
-    df = df.round(2)
+    n_rows = merge_processed_parquets(all_files, complete_dataset_output)
 
-    df.drop_duplicates(inplace=True)
+    logging.info(f"Number of loaded files: {len(all_files)}, distinct sessions: {n_rows}")
+    return n_rows
 
-    logging.info(f"Number of loaded files: {len(df)}")
+def _append_parquets(parquets_folder_path: Path, complete_dataset_output: Path, state_folder: Path, date_window: DateWindow = None) -> int:
+    """ come _concat_parquets, ma unisce solo i file processati nuovi. Restituisce il numero di righe aggiunte """
+    all_files = _processed_files_in_window(parquets_folder_path, date_window) # nessun file: il dataset incrementale viene svuotato
 
-    df.to_parquet(complete_dataset_output, index=False)
+    n_rows = append_processed_parquets(all_files, complete_dataset_output, state_folder)
 
-    return df
+    logging.info(f"Number of processed files: {len(all_files)}, new distinct sessions: {n_rows}")
+    return n_rows
 
+def _processed_files_in_window(parquets_folder_path: Path, date_window: DateWindow = None) -> list[Path]:
+    if not os.path.exists(parquets_folder_path):
+        logging.error(f"La cartella {parquets_folder_path} non existent")
+        return []
+    return select_files_in_window(parquets_folder_path.glob('*.parquet'), date_window)
 
 
 if __name__ == "__main__":